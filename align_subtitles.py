@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import json
+import bisect
+import logging
+import argparse
+
+from subtitles import load_cues
+
+
+# A target cue without any overlap is still attached to the closest source cue this near
+DEFAULT_MAX_GAP = 1.0
+
+# At the same time a start event goes first, so a zero-length cue is active before it ends.
+# Cues that only touch meet with an overlap of 0, which is not counted.
+START_EVENT = 0
+END_EVENT = 1
+
+SOURCE = 0
+TARGET = 1
+
+
+def cue_interval(cue):
+    """
+    Returns the (start, end) of a cue in seconds, the cue has either an end or a duration.
+    """
+    start = cue['start']
+    end = cue['end'] if 'end' in cue else start + cue['duration']
+
+    return start, max(end, start)
+
+
+def overlapping_pairs(source_intervals, target_intervals):
+    """
+    Finds every overlapping (source, target) pair with one sweep over the sorted cue boundaries.
+
+    The cost is O(n log n) for the sort plus the amount of overlapping pairs,
+    which stays linear for subtitles because only a few cues are on screen at once.
+
+    Yields:
+    - tuple: (source index, target index, overlap in seconds)
+    """
+    events = []
+    for kind, intervals in ((SOURCE, source_intervals), (TARGET, target_intervals)):
+        for index, (start, end) in enumerate(intervals):
+            events.append((start, START_EVENT, kind, index))
+            events.append((end, END_EVENT, kind, index))
+    events.sort()
+
+    # The cues that are on screen at the current time of the sweep
+    active = ({}, {})
+
+    for _, event, kind, index in events:
+        if event == END_EVENT:
+            del active[kind][index]
+            continue
+
+        start, end = (source_intervals if kind == SOURCE else target_intervals)[index]
+
+        # A pair is found once, when the later of its two cues starts
+        for other_index, (other_start, other_end) in active[1 - kind].items():
+            overlap = min(end, other_end) - max(start, other_start)
+            if overlap <= 0:
+                continue
+
+            if kind == SOURCE:
+                yield index, other_index, overlap
+            else:
+                yield other_index, index, overlap
+
+        active[kind][index] = (start, end)
+
+
+def _nearest(intervals, sorted_starts, order, start, end, max_gap):
+    """
+    Returns the index of the interval closest to [start, end] within max_gap, or None.
+    """
+    position = bisect.bisect_left(sorted_starts, start)
+
+    best_index, best_gap = None, max_gap
+    # Cues are mostly sequential, the neighbours around the insertion point are enough
+    for candidate in order[max(position - 2, 0):position + 2]:
+        candidate_start, candidate_end = intervals[candidate]
+        gap = max(candidate_start - end, start - candidate_end, 0)
+        if gap <= best_gap:
+            best_index, best_gap = candidate, gap
+
+    return best_index
+
+
+def align_subtitles(source_subs, target_subs, max_gap=DEFAULT_MAX_GAP):
+    """
+    Matches the target cues to the source cues by time instead of by position.
+
+    Every target cue goes to the source cue it overlaps the most, so several short
+    target cues can merge into one source cue. A source cue that got no target cue
+    borrows the target cue it overlaps the most. The cue count and order of both
+    tracks may differ, e.g. for auto-generated tracks.
+
+    Parameters:
+    - source_subs (list): The source cues with 'start', 'duration' (or 'end') and 'text'.
+    - target_subs (list): The target cues in the same format.
+    - max_gap (float): How far (in seconds) a target cue without any overlap
+                       may be from a source cue to still be attached to it.
+
+    Returns:
+    - list: The target text of every source cue, in the order of source_subs.
+            A source cue without a matching target cue gets an empty string.
+    """
+    source_intervals = [cue_interval(cue) for cue in source_subs]
+    target_intervals = [cue_interval(cue) for cue in target_subs]
+
+    # (overlap, -index), so that on a tie the earlier cue wins
+    best_source = [None] * len(target_intervals)
+    best_target = [None] * len(source_intervals)
+
+    for source_index, target_index, overlap in overlapping_pairs(source_intervals, target_intervals):
+        candidate = (overlap, -source_index)
+        if best_source[target_index] is None or candidate > best_source[target_index]:
+            best_source[target_index] = candidate
+
+        candidate = (overlap, -target_index)
+        if best_target[source_index] is None or candidate > best_target[source_index]:
+            best_target[source_index] = candidate
+
+    source_order = sorted(range(len(source_intervals)), key=lambda index: source_intervals[index])
+    source_starts = [source_intervals[index][0] for index in source_order]
+
+    matched = [[] for _ in source_intervals]
+    dropped = 0
+
+    for target_index, best in enumerate(best_source):
+        if best is not None:
+            source_index = -best[1]
+        else:
+            source_index = _nearest(source_intervals, source_starts, source_order,
+                                    *target_intervals[target_index], max_gap=max_gap)
+            if source_index is None:
+                dropped += 1
+                continue
+
+        matched[source_index].append(target_index)
+
+    if dropped:
+        logging.warning(f'{dropped} target cues are not close to any source cue and were dropped.')
+
+    target_texts = []
+    for source_index, target_indexes in enumerate(matched):
+        if not target_indexes and best_target[source_index] is not None:
+            target_indexes = [-best_target[source_index][1]]
+
+        target_indexes.sort(key=lambda index: target_intervals[index])
+        target_texts.append(' '.join(target_subs[index]['text'].strip() for index in target_indexes))
+
+    return target_texts
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Align target subtitles to source subtitles by time')
+
+    parser.add_argument('-s', '--source', help='Path to the source subtitles (SRT, VTT or JSON).', required=True)
+    parser.add_argument('-t', '--target', help='Path to the target subtitles (SRT, VTT or JSON).', required=True)
+    parser.add_argument('-o', '--output', help='Path to the output file with the aligned pairs.', required=True)
+    parser.add_argument('--max-gap', type=float, default=DEFAULT_MAX_GAP,
+                        help='How far (in seconds) a target cue without any overlap may be '
+                             'from a source cue to still be attached to it.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    source_subs = load_cues(args.source)
+    target_subs = load_cues(args.target)
+
+    target_texts = align_subtitles(source_subs, target_subs, max_gap=args.max_gap)
+    pairs = [{'source': cue['text'], 'target': target_text}
+             for cue, target_text in zip(source_subs, target_texts)]
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(pairs, file, ensure_ascii=False, indent=4)
+
+    logging.info(f'Aligned {len(target_subs)} target cues to {len(source_subs)} source cues.')
+
+
+if __name__ == "__main__":
+    main()
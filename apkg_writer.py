@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import sqlite3
+import zipfile
+import tempfile
+import itertools
+
+# Internals of genanki, requirements.txt pins the version they match
+from genanki.apkg_col import APKG_COL
+from genanki.apkg_schema import APKG_SCHEMA
+
+
+# Audio is compressed already, deflating it again only costs time
+STORED_EXTENSIONS = {'.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.flac', '.wav',
+                     '.mp4', '.webm', '.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+DEFAULT_NOTE_BATCH = 1000
+
+
+class ApkgWriter:
+    """
+    Writes an Anki package note by note instead of building it in memory first.
+
+    The notes go straight into the collection database and are committed in batches,
+    the media files are streamed into the zip archive from disk. It produces the same
+    package as genanki.Package, but a note is never kept after it is written, so the
+    memory stays flat for any amount of notes.
+
+    Usage:
+        with ApkgWriter(output_path, decks=[deck]) as writer:
+            for note in notes:
+                writer.add_note(note)
+            writer.add_media('segment.mp3', path)
+    """
+
+    def __init__(self, output_path, decks, timestamp=None, note_batch=DEFAULT_NOTE_BATCH):
+        """
+        Parameters:
+        - output_path (str): The .apkg file.
+        - decks (list): genanki decks without notes. Their models have to be added
+                        with deck.add_model(), the first deck is the default one.
+        - timestamp (float): The creation time of the notes, defaults to now.
+        - note_batch (int): The amount of notes per transaction.
+        """
+        self.output_path = output_path
+        self.deck_id = decks[0].deck_id
+        self.note_batch = note_batch
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.id_gen = itertools.count(int(self.timestamp * 1000))
+
+        self.media = {}
+        self.notes = 0
+
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        database_descriptor, self.database_path = tempfile.mkstemp(dir=output_dir, suffix='.anki2')
+        os.close(database_descriptor)
+
+        self.connection = sqlite3.connect(self.database_path)
+        self.cursor = self.connection.cursor()
+
+        # The same steps as genanki.Package.write_to_db(), without the notes
+        self.cursor.executescript(APKG_SCHEMA)
+        self.cursor.executescript(APKG_COL)
+        for deck in decks:
+            deck.write_to_db(self.cursor, self.timestamp, self.id_gen)
+
+    def add_note(self, note, deck_id=None):
+        note.write_to_db(self.cursor, self.timestamp,
+                         deck_id if deck_id is not None else self.deck_id, self.id_gen)
+
+        self.notes += 1
+        if self.notes % self.note_batch == 0:
+            self.connection.commit()
+
+    def add_media(self, name, path):
+        """
+        Adds a media file to the package under name, the name the notes refer to.
+        """
+        self.media.setdefault(name, path)
+
+    def close(self):
+        """
+        Writes the zip archive next to the output and renames it into place.
+        """
+        self.connection.commit()
+        self.connection.close()
+
+        temp_output_path = f'{self.output_path}.part'
+        try:
+            with zipfile.ZipFile(temp_output_path, 'w', compression=zipfile.ZIP_DEFLATED) as output:
+                output.write(self.database_path, 'collection.anki2')
+
+                media = list(self.media.items())
+                output.writestr('media', json.dumps({str(index): name for index, (name, _) in enumerate(media)}))
+
+                # zipfile copies a file in blocks, nothing is loaded as a whole
+                for index, (name, path) in enumerate(media):
+                    _, extension = os.path.splitext(name)
+                    compression = zipfile.ZIP_STORED if extension.lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    output.write(path, str(index), compress_type=compression)
+
+            os.replace(temp_output_path, self.output_path)
+        finally:
+            if os.path.exists(temp_output_path):
+                os.remove(temp_output_path)
+            os.remove(self.database_path)
+
+    def abort(self):
+        self.connection.close()
+        os.remove(self.database_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from create_course import (COURSE_INFO, LESSON_INFO, SOURCE_AUDIO_DIR,
+                           create_course, create_lesson, dump_file,
+                           read_json_from_file)
+
+try:
+    from segmenter import FFMPEG_BINARY, SPLIT_MODES, PRECISE_MODE
+except ImportError:
+    # Checkouts before segmenter.py have only the precise split
+    from moviepy.config import get_setting
+    FFMPEG_BINARY = get_setting('FFMPEG_BINARY')
+    PRECISE_MODE = 'precise'
+    SPLIT_MODES = [PRECISE_MODE]
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKDIR = 'benchmark-data'
+DEFAULT_THRESHOLD = 0.15
+
+# Where export_to_anki versions without -o write the deck, inside their working directory
+LEGACY_DECK_FILE = 'output_deck.apkg'
+
+# name: (media length in seconds, amount of cues)
+SIZES = {
+    'xs': (60, 10),
+    's': (600, 100),
+    'm': (2700, 900),
+    'l': (3600, 2000),
+    'xl': (10800, 5000),
+}
+DEFAULT_SIZES = ['xs', 's']
+
+AUDIO_KIND = 'audio'
+VIDEO_KIND = 'video'
+KINDS = [AUDIO_KIND, VIDEO_KIND]
+
+SPLIT_STAGE = 'split'
+EXPORT_STAGE = 'export'
+STAGES = [SPLIT_STAGE, EXPORT_STAGE]
+
+# The metrics compared against a baseline, for all of them lower is better
+COMPARED_METRICS = ['wall_seconds', 'peak_rss_kb', 'output_bytes', 'segment_latency_p95_ms']
+
+
+def generate_media(path, kind, duration):
+    """
+    Generates a synthetic audio (mp3) or video (mp4) file with ffmpeg's built-in sources.
+    """
+    # A sweeping tone, so the encoders do not get digital silence
+    audio_source = f'sine=frequency=220:beep_factor=4:sample_rate=44100:duration={duration}'
+
+    if kind == AUDIO_KIND:
+        command = [FFMPEG_BINARY, '-y', '-v', 'error',
+                   '-f', 'lavfi', '-i', audio_source,
+                   '-ac', '2', '-acodec', 'libmp3lame', path]
+    else:
+        command = [FFMPEG_BINARY, '-y', '-v', 'error',
+                   '-f', 'lavfi', '-i', f'testsrc=size=320x240:rate=15:duration={duration}',
+                   '-f', 'lavfi', '-i', audio_source,
+                   '-vcodec', 'mpeg4', '-ac', '2', '-acodec', 'aac', path]
+
+    subprocess.run(command, check=True)
+
+
+def generate_subtitles(path, duration, cues):
+    """
+    Generates evenly spaced cues in the YouTube transcript JSON format.
+    """
+    step = duration / cues
+    subtitles = [{'text': f'Synthetic cue number {index + 1}',
+                  'start': round(index * step, 2),
+                  'duration': round(step * 0.8, 2)}
+                 for index in range(cues)]
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(subtitles, file)
+
+
+def prepare_case(workdir, size, kind):
+    """
+    Creates (or reuses) the media and the subtitles of one benchmark case.
+
+    Returns:
+    - tuple: (path to the media, path to the subtitles)
+    """
+    duration, cues = SIZES[size]
+    inputs_dir = os.path.join(workdir, 'inputs')
+    os.makedirs(inputs_dir, exist_ok=True)
+
+    extension = 'mp3' if kind == AUDIO_KIND else 'mp4'
+    media_path = os.path.join(inputs_dir, f'{kind}-{duration}s.{extension}')
+    subtitles_path = os.path.join(inputs_dir, f'{cues}-cues-{duration}s.json')
+
+    if not os.path.exists(media_path):
+        logging.info(f'Generating {media_path}')
+        generate_media(media_path, kind=kind, duration=duration)
+
+    if not os.path.exists(subtitles_path):
+        generate_subtitles(subtitles_path, duration=duration, cues=cues)
+
+    return media_path, subtitles_path
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, file_name))
+               for root, _, files in os.walk(path) for file_name in files)
+
+
+def run_child(command, cwd=None):
+    """
+    Runs a stage in its own process, so its peak RSS is not mixed with other stages.
+
+    Returns:
+    - tuple: (wall seconds, peak RSS in KB of the process and its waited-for children)
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - started
+
+    # Popen must not wait for the pid again
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f'The stage failed with {process.returncode}: {" ".join(command)}')
+
+    return wall_seconds, usage.ru_maxrss
+
+
+def split_stage(media_path, subtitles_path, output_dir, report_path, kind, workers, mode):
+    """
+    Splits the media and writes the per-segment latencies into report_path.
+    It runs inside the child process started by run_child.
+    """
+    from split_audio import split_audio
+    from split_video import split_video
+
+    split = split_audio if kind == AUDIO_KIND else split_video
+    media_argument = 'path_to_mp3' if kind == AUDIO_KIND else 'path_to_video'
+
+    # Only what differs from the defaults, older checkouts take neither option
+    options = {}
+    if workers != 1:
+        options['workers'] = workers
+    if mode != PRECISE_MODE:
+        options['mode'] = mode
+
+    latencies = []
+    segments = []
+    last = time.perf_counter()
+
+    for index, subtitle, segment_filename in split(**{media_argument: media_path},
+                                                   path_to_subtitles=subtitles_path,
+                                                   output_dir=output_dir, **options):
+        now = time.perf_counter()
+        latencies.append((now - last) * 1000)
+        last = now
+        segments.append((subtitle, segment_filename))
+
+    with open(report_path, 'w') as file:
+        json.dump({'latencies_ms': latencies,
+                   'segments': [[subtitle['text'], segment_filename]
+                                for subtitle, segment_filename in segments]}, file)
+
+
+def summarize_latencies(latencies):
+    if not latencies:
+        return {}
+
+    ordered = sorted(latencies)
+    return {
+        'segments': len(ordered),
+        'segment_latency_mean_ms': statistics.fmean(ordered),
+        'segment_latency_p50_ms': ordered[len(ordered) // 2],
+        'segment_latency_p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        'segment_latency_max_ms': ordered[-1],
+    }
+
+
+def write_course(course_path, segments):
+    """
+    Turns the split output into a one-lesson course the export stage can read.
+    """
+    create_course(course_name='Benchmark', course_path=course_path,
+                  source_language='Synthetic', target_language='Synthetic')
+
+    lesson_path = os.path.join(course_path, '1')
+    create_lesson(lesson_name='Benchmark lesson', lesson_number=1, lesson_path=lesson_path)
+
+    lesson_structure = read_json_from_file(os.path.join(lesson_path, LESSON_INFO))
+    lesson_structure['phrases'] = [{'source': text, 'target': text,
+                                    'source_audio': segment_filename, 'target_audio': None,
+                                    'comment': None}
+                                   for text, segment_filename in segments]
+    dump_file(folder_path=lesson_path, file_name=LESSON_INFO, data=lesson_structure)
+
+    course_info = read_json_from_file(os.path.join(course_path, COURSE_INFO))
+    course_info['lessons'].append({'name': 'Benchmark lesson', 'source-link': None, 'path': '1'})
+    dump_file(folder_path=course_path, file_name=COURSE_INFO, data=course_info)
+
+
+def export_command(course_path, deck_path, legacy_export=False):
+    """
+    Returns the command of the export stage for the export_to_anki.py of this checkout.
+
+    With legacy_export the checkout has no -o and always writes LEGACY_DECK_FILE into
+    the working directory, so deck_path has to be that file in the directory the stage runs in.
+    """
+    command = [sys.executable, os.path.join(SCRIPT_DIR, 'export_to_anki.py'),
+               '-c', os.path.abspath(course_path)]
+
+    if not legacy_export:
+        command += ['-o', deck_path]
+
+    return command
+
+
+def run_case(workdir, size, kind, stages, workers, mode, legacy_export=False):
+    media_path, subtitles_path = prepare_case(workdir, size=size, kind=kind)
+
+    case_dir = os.path.join(workdir, 'runs', f'{size}-{kind}')
+    shutil.rmtree(case_dir, ignore_errors=True)
+
+    course_path = os.path.join(case_dir, 'course')
+    output_dir = os.path.join(course_path, '1', SOURCE_AUDIO_DIR)
+    report_path = os.path.join(case_dir, 'split-report.json')
+    os.makedirs(output_dir)
+
+    results = {'media_seconds': SIZES[size][0], 'cues': SIZES[size][1]}
+
+    # The export needs the segments, so the split always runs
+    wall_seconds, peak_rss_kb = run_child([sys.executable, os.path.abspath(__file__), 'stage',
+                                           '--kind', kind, '--media', media_path,
+                                           '--subtitles', subtitles_path,
+                                           '--output-dir', output_dir, '--report', report_path,
+                                           '--workers', str(workers), '--mode', mode])
+    report = read_json_from_file(report_path)
+
+    if SPLIT_STAGE in stages:
+        results[SPLIT_STAGE] = {
+            'wall_seconds': wall_seconds,
+            'peak_rss_kb': peak_rss_kb,
+            'output_bytes': directory_size(output_dir),
+            **summarize_latencies(report['latencies_ms']),
+        }
+
+    if EXPORT_STAGE in stages:
+        write_course(course_path, segments=report['segments'])
+
+        # Absolute, the stage runs inside case_dir
+        deck_path = os.path.abspath(os.path.join(case_dir, LEGACY_DECK_FILE))
+        wall_seconds, peak_rss_kb = run_child(export_command(course_path, deck_path, legacy_export),
+                                              cwd=case_dir)
+        results[EXPORT_STAGE] = {
+            'wall_seconds': wall_seconds,
+            'peak_rss_kb': peak_rss_kb,
+            'output_bytes': os.path.getsize(deck_path),
+        }
+
+    return results
+
+
+def run_benchmarks(workdir, sizes, kinds, stages, workers, mode, legacy_export=False):
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'workers': workers,
+        'mode': mode,
+        'cases': {},
+    }
+
+    for size in sizes:
+        for kind in kinds:
+            case = f'{size}-{kind}'
+            logging.info(f'Running {case}')
+            results['cases'][case] = run_case(workdir, size=size, kind=kind, stages=stages,
+                                              workers=workers, mode=mode,
+                                              legacy_export=legacy_export)
+
+    return results
+
+
+def compare_results(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares results against a baseline.
+
+    Returns:
+    - list: (case, stage, metric, baseline value, new value) for every metric
+            that got worse by more than threshold.
+    """
+    regressions = []
+
+    for case, stages in results['cases'].items():
+        baseline_stages = baseline['cases'].get(case, {})
+
+        for stage in STAGES:
+            for metric in COMPARED_METRICS:
+                old = baseline_stages.get(stage, {}).get(metric)
+                new = stages.get(stage, {}).get(metric)
+
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + threshold):
+                    regressions.append((case, stage, metric, old, new))
+
+    return regressions
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Benchmark the split and export stages on synthetic media')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks.')
+    run_parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                            help=f'Comma separated sizes out of {", ".join(SIZES)}.')
+    run_parser.add_argument('--kinds', default=','.join(KINDS),
+                            help=f'Comma separated media kinds out of {", ".join(KINDS)}.')
+    run_parser.add_argument('--stages', default=','.join(STAGES),
+                            help=f'Comma separated stages out of {", ".join(STAGES)}.')
+    run_parser.add_argument('-w', '--workers', type=int, default=1,
+                            help='The amount of processes that encode segments.')
+    run_parser.add_argument('-m', '--mode', choices=SPLIT_MODES, default=PRECISE_MODE,
+                            help='The split mode.')
+    run_parser.add_argument('--legacy-export', action='store_true',
+                            help=f'The export_to_anki.py of this checkout has no -o and writes '
+                                 f'{LEGACY_DECK_FILE} into its working directory.')
+    run_parser.add_argument('--workdir', default=DEFAULT_WORKDIR,
+                            help='The folder for the generated inputs and the outputs.')
+    run_parser.add_argument('-o', '--output', default='benchmark-results.json',
+                            help='The results file.')
+    run_parser.add_argument('--baseline', help='A results file to compare with.')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='The allowed relative slowdown before a metric is a regression.')
+
+    compare_parser = commands.add_parser('compare', help='Compare results against a baseline.')
+    compare_parser.add_argument('--baseline', required=True, help='The baseline results file.')
+    compare_parser.add_argument('--results', required=True, help='The new results file.')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='The allowed relative slowdown before a metric is a regression.')
+
+    # Internal: runs the split stage inside a child process
+    stage_parser = commands.add_parser('stage')
+    stage_parser.add_argument('--kind', choices=KINDS, required=True)
+    stage_parser.add_argument('--media', required=True)
+    stage_parser.add_argument('--subtitles', required=True)
+    stage_parser.add_argument('--output-dir', required=True)
+    stage_parser.add_argument('--report', required=True)
+    stage_parser.add_argument('--workers', type=int, default=1)
+    stage_parser.add_argument('--mode', choices=SPLIT_MODES, default=PRECISE_MODE)
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.command == 'stage':
+        split_stage(media_path=args.media, subtitles_path=args.subtitles,
+                    output_dir=args.output_dir, report_path=args.report,
+                    kind=args.kind, workers=args.workers, mode=args.mode)
+        return
+
+    if args.command == 'run':
+        results = run_benchmarks(workdir=args.workdir, sizes=args.sizes.split(','),
+                                 kinds=args.kinds.split(','), stages=args.stages.split(','),
+                                 workers=args.workers, mode=args.mode,
+                                 legacy_export=args.legacy_export)
+        dump_file(folder_path=os.path.dirname(os.path.abspath(args.output)),
+                  file_name=os.path.basename(args.output), data=results)
+        logging.info(f'Results saved to {args.output}')
+
+        if args.baseline is None:
+            return
+        baseline = read_json_from_file(args.baseline)
+
+    else:
+        baseline = read_json_from_file(args.baseline)
+        results = read_json_from_file(args.results)
+
+    regressions = compare_results(baseline, results, threshold=args.threshold)
+    for case, stage, metric, old, new in regressions:
+        logging.warning(f'Regression in {case}/{stage}: {metric} {old:.2f} -> {new:.2f} '
+                        f'({(new / old - 1) * 100:+.1f}%)')
+
+    if regressions:
+        sys.exit(1)
+
+    logging.info('No regressions found.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import fcntl
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from retry import retry_with_backoff, DEFAULT_RETRIES, DEFAULT_BACKOFF
+
+
+STAGING_DIR_ENV = 'VIDEO_CUTTER_STAGING_DIR'
+DEFAULT_STAGING_DIR = os.environ.get(
+    STAGING_DIR_ENV,
+    os.path.join(os.path.expanduser('~'), '.cache', 'video-cutter', 'downloads'))
+
+DEFAULT_CHUNK_SIZE = 8 << 20
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_TIMEOUT = 30
+
+BLOCK_SIZE = 64 << 10
+INFO_FILE = 'info.json'
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes \d+-\d+/(\d+)')
+
+
+class RangesNotSupportedError(IOError):
+    """
+    The server does not serve the file in byte ranges, it has to be downloaded in one request.
+    """
+
+
+def probe_size(url, timeout=DEFAULT_TIMEOUT):
+    """
+    Asks for the first byte of url to learn its size and whether it serves ranges.
+
+    Returns:
+    - tuple: (size or None, True if range requests are supported)
+    """
+    request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if response.status == 206:
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+            if match is not None:
+                return int(match.group(1)), True
+
+        length = response.headers.get('Content-Length')
+        return (int(length) if length is not None else None), False
+
+
+def _chunk_path(staging, index):
+    return os.path.join(staging, f'chunk-{index:05d}.part')
+
+
+def _fetch_chunk(url, path, start, end, retries, backoff, timeout):
+    """
+    Downloads bytes [start, end] of url into path, resuming from what path already holds.
+    """
+    expected = end - start + 1
+
+    def fetch():
+        have = os.path.getsize(path) if os.path.exists(path) else 0
+        if have > expected:
+            # Not a prefix of this chunk, it cannot be resumed
+            os.remove(path)
+            have = 0
+        if have == expected:
+            return
+
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start + have}-{end}'})
+        with urllib.request.urlopen(request, timeout=timeout) as response, open(path, 'ab') as file:
+            if response.status != 206:
+                raise IOError(f'The server ignored the range request ({response.status})')
+
+            shutil.copyfileobj(response, file, BLOCK_SIZE)
+
+        # A connection closed early is resumed from here by the next attempt
+        if os.path.getsize(path) != expected:
+            raise IOError(f'Chunk {os.path.basename(path)} is incomplete')
+
+    retry_with_backoff(fetch, retries=retries, backoff=backoff, exceptions=OSError,
+                       description=f'Chunk {os.path.basename(path)}')
+
+
+@contextmanager
+def _staging_lock(staging):
+    """
+    Holds an exclusive flock on <staging>.lock, the kernel releases it when the holder dies.
+    """
+    os.makedirs(os.path.dirname(staging), exist_ok=True)
+
+    with open(f'{staging}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _prepare_staging(staging, size, chunk_size):
+    """
+    Keeps the finished chunks of an earlier attempt if they belong to the same download.
+    """
+    info = {'size': size, 'chunk_size': chunk_size}
+    info_path = os.path.join(staging, INFO_FILE)
+
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as file:
+            if json.load(file) == info:
+                return
+        logging.info(f'The staged chunks in {staging} belong to another download, starting over.')
+
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    with open(info_path, 'w') as file:
+        json.dump(info, file)
+
+
+def download_file(url, destination, key=None, staging_dir=DEFAULT_STAGING_DIR,
+                  chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_DOWNLOAD_WORKERS,
+                  expected_size=None, expected_sha256=None,
+                  retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+    """
+    Downloads url in parallel byte-range chunks that survive failures.
+
+    The chunks are kept in a persistent staging folder. A repeated call with the
+    same key resumes from the finished chunks and the finished part of the others.
+    The assembled file is checked against the size (and the hash, when given)
+    before it is moved to destination. Concurrent downloads of the same key
+    wait for each other.
+
+    Parameters:
+    - url (str): The URL, the server has to support range requests,
+                 RangesNotSupportedError is raised otherwise.
+    - destination (str): The output file.
+    - key (str): Identifies the download across attempts. Use it when the URL
+                 changes between attempts (e.g. signed URLs). Defaults to the URL.
+    - staging_dir (str): The folder for the partial downloads.
+    - chunk_size (int): The size of one range request in bytes.
+    - workers (int): The amount of chunks downloaded at once.
+    - expected_size (int): The size the file must have.
+    - expected_sha256 (str): The hex digest the file must have.
+    - retries (int): How many times a failed chunk is retried.
+    - backoff (float): The delay before the first retry, doubled for every next one.
+    - timeout (float): The socket timeout in seconds.
+
+    Returns:
+    - str: The SHA-256 hex digest of the downloaded file.
+    """
+    try:
+        size, ranges_supported = probe_size(url, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        # e.g. 416 for an empty file, it has no first byte to ask for
+        raise RangesNotSupportedError(f'Probing the ranges of {url} failed: {e}') from e
+
+    if size is None:
+        size = expected_size
+    if not ranges_supported or size is None:
+        raise RangesNotSupportedError(f'{url} does not support range requests')
+    if expected_size is not None and size != expected_size:
+        raise IOError(f'{url} has {size} bytes, expected {expected_size}')
+
+    staging = os.path.join(staging_dir, hashlib.sha256((key or url).encode()).hexdigest())
+
+    # Another process downloading the same key would write into the same chunks
+    with _staging_lock(staging):
+        _prepare_staging(staging, size=size, chunk_size=chunk_size)
+
+        chunks = [(index, start, min(start + chunk_size, size) - 1)
+                  for index, start in enumerate(range(0, size, chunk_size))]
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [executor.submit(_fetch_chunk, url, _chunk_path(staging, index), start, end,
+                                       retries, backoff, timeout)
+                       for index, start, end in chunks]
+            for future in futures:
+                future.result()
+
+        # Assemble next to the destination, so the final rename is atomic
+        digest = hashlib.sha256()
+        temp_destination = f'{destination}.part'
+        with open(temp_destination, 'wb') as output:
+            for index, _, _ in chunks:
+                with open(_chunk_path(staging, index), 'rb') as chunk:
+                    while block := chunk.read(BLOCK_SIZE):
+                        digest.update(block)
+                        output.write(block)
+
+        actual_size = os.path.getsize(temp_destination)
+        if actual_size != size:
+            os.remove(temp_destination)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise IOError(f'{destination} has {actual_size} bytes, expected {size}')
+
+        if expected_sha256 is not None and digest.hexdigest() != expected_sha256:
+            os.remove(temp_destination)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise IOError(f'{destination} has the SHA-256 {digest.hexdigest()}, expected {expected_sha256}')
+
+        os.replace(temp_destination, destination)
+        shutil.rmtree(staging, ignore_errors=True)
+
+    logging.info(f'Downloaded {destination}: {size} bytes in {len(chunks)} chunks, '
+                 f'sha256 {digest.hexdigest()}')
+    return digest.hexdigest()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Download a file in resumable parallel chunks')
+
+    parser.add_argument('-u', '--url', help='The URL of the file.', required=True)
+    parser.add_argument('-o', '--output', help='The output file.', required=True)
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help='The amount of chunks downloaded at once.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='The size of one chunk in bytes.')
+    parser.add_argument('--sha256', help='The expected SHA-256 of the file.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    download_file(url=args.url, destination=args.output, workers=args.workers,
+                  chunk_size=args.chunk_size, expected_sha256=args.sha256)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import sqlite3
+import logging
+import argparse
+
+
+CATALOG_FILE = 'course-catalog.sqlite'
+
+# How many rows are sent to sqlite at once when a lesson is written
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    source_language TEXT,
+    target_language TEXT,
+    link TEXT,
+    model_id INTEGER,
+    deck_id INTEGER,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    number INTEGER,
+    name TEXT,
+    description TEXT,
+    link TEXT,
+    source_link TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (course_id, path)
+);
+CREATE INDEX IF NOT EXISTS lessons_by_number ON lessons(course_id, number);
+
+CREATE TABLE IF NOT EXISTS phrases (
+    id INTEGER PRIMARY KEY,
+    lesson_id INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    source TEXT,
+    target TEXT,
+    source_audio TEXT,
+    target_audio TEXT,
+    comment TEXT,
+    UNIQUE (lesson_id, position)
+);
+CREATE INDEX IF NOT EXISTS phrases_by_source ON phrases(source);
+CREATE INDEX IF NOT EXISTS phrases_by_target ON phrases(target);
+CREATE INDEX IF NOT EXISTS phrases_by_audio ON phrases(source_audio);
+
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime_ns INTEGER,
+    updated_at REAL NOT NULL
+);
+"""
+
+PHRASE_FIELDS = ('source', 'target', 'source_audio', 'target_audio', 'comment')
+
+
+def _batches(iterable, size=BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prefix_end(prefix):
+    # Every string that starts with prefix sorts below this one, so a prefix
+    # lookup becomes a range scan over the index instead of a LIKE over the table.
+    return prefix + '\U0010ffff'
+
+
+class CourseCatalog:
+    """
+    An SQLite store of the courses, lessons, phrases and media, with indexes.
+
+    A course with a catalog keeps its lessons here instead of in lesson-info.json files,
+    course-info.json still lists them. A registered lesson is written in one transaction
+    without rewriting the others, phrases are looked up without opening every lesson and
+    an export re-reads only the lessons updated since the previous one (see lesson_updates()).
+    The JSON files can be written from it, see read_course()/read_lesson().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+
+        # WAL lets readers (e.g. an export) work while an import writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put_course(self, course_info):
+        """
+        Inserts or updates a course (without its lessons) by its name.
+
+        Returns:
+        - int: The id of the course.
+        """
+        anki = course_info.get('anki') or {}
+
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO courses (name, description, source_language, target_language, '
+                '                     link, model_id, deck_id, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET '
+                '    description = excluded.description, '
+                '    source_language = excluded.source_language, '
+                '    target_language = excluded.target_language, '
+                '    link = excluded.link, model_id = excluded.model_id, '
+                '    deck_id = excluded.deck_id, updated_at = excluded.updated_at',
+                (course_info['name'], course_info.get('description'),
+                 course_info.get('source_language'), course_info.get('target_language'),
+                 course_info.get('link'), anki.get('model_id'), anki.get('deck_id'),
+                 time.time()))
+
+        return self.course_id(course_info['name'])
+
+    def course_id(self, name):
+        row = self.connection.execute('SELECT id FROM courses WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(f'The course {name} is not in the catalog {self.path}')
+        return row['id']
+
+    def put_lesson(self, course_id, lesson_entry, lesson_info, phrases=None, media_dir=None):
+        """
+        Inserts or replaces a lesson and all its phrases in one transaction.
+
+        Parameters:
+        - course_id (int): The course of the lesson.
+        - lesson_entry (dict): The entry of the lesson in course-info.json.
+        - lesson_info (dict): The lesson as in lesson-info.json. Its phrases are used
+                              unless phrases is given.
+        - phrases (iterable): The phrases of the lesson, consumed lazily.
+        - media_dir (str): When given, the audio files of the phrases are looked up
+                           by their names in this folder and recorded in the media table.
+
+        Returns:
+        - int: The id of the lesson.
+        """
+        if phrases is None:
+            phrases = lesson_info.get('phrases', [])
+
+        now = time.time()
+
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO lessons (course_id, path, number, name, description, link, '
+                '                     source_link, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (course_id, path) DO UPDATE SET '
+                '    number = excluded.number, name = excluded.name, '
+                '    description = excluded.description, link = excluded.link, '
+                '    source_link = excluded.source_link, updated_at = excluded.updated_at',
+                (course_id, str(lesson_entry['path']), lesson_info.get('number'),
+                 lesson_info.get('name', lesson_entry.get('name')),
+                 lesson_info.get('description'), lesson_info.get('link'),
+                 lesson_entry.get('source-link'), now))
+
+            lesson_id = self.connection.execute(
+                'SELECT id FROM lessons WHERE course_id = ? AND path = ?',
+                (course_id, str(lesson_entry['path']))).fetchone()['id']
+
+            self.connection.execute('DELETE FROM phrases WHERE lesson_id = ?', (lesson_id,))
+
+            rows = ((lesson_id, position, *(phrase.get(field) for field in PHRASE_FIELDS))
+                    for position, phrase in enumerate(phrases))
+            for batch in _batches(rows):
+                self.connection.executemany(
+                    'INSERT INTO phrases (lesson_id, position, source, target, '
+                    '                     source_audio, target_audio, comment) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+
+                if media_dir is not None:
+                    self._put_media((row[4] for row in batch), media_dir, now)
+
+        return lesson_id
+
+    def _put_media(self, paths, media_dir, now):
+        rows = []
+        for path in paths:
+            if not path:
+                continue
+
+            try:
+                stat = os.stat(os.path.join(media_dir, os.path.basename(path)))
+            except FileNotFoundError:
+                continue
+
+            rows.append((path, stat.st_size, stat.st_mtime_ns, now))
+
+        self.connection.executemany(
+            'INSERT INTO media (path, size, mtime_ns, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (path) DO UPDATE SET size = excluded.size, '
+            '    mtime_ns = excluded.mtime_ns, updated_at = excluded.updated_at', rows)
+
+    def import_course(self, course_info, lessons):
+        """
+        Loads a whole course in its JSON form into the catalog.
+
+        Parameters:
+        - course_info (dict): The content of course-info.json.
+        - lessons (iterable): (lesson entry, lesson info, phrases, media dir) for every lesson,
+                              see put_lesson().
+
+        Returns:
+        - int: The id of the course.
+        """
+        course_id = self.put_course(course_info)
+
+        for lesson_entry, lesson_info, phrases, media_dir in lessons:
+            self.put_lesson(course_id, lesson_entry, lesson_info,
+                            phrases=phrases, media_dir=media_dir)
+
+        return course_id
+
+    def read_course(self, course_id):
+        """
+        Returns the course in the form of course-info.json.
+        """
+        course = self.connection.execute('SELECT * FROM courses WHERE id = ?', (course_id,)).fetchone()
+        lessons = self.connection.execute(
+            'SELECT name, source_link, path FROM lessons WHERE course_id = ? ORDER BY number, path',
+            (course_id,)).fetchall()
+
+        return {
+            'name': course['name'],
+            'description': course['description'],
+            'source_language': course['source_language'],
+            'target_language': course['target_language'],
+            'lessons': [{'name': lesson['name'], 'source-link': lesson['source_link'],
+                         'path': lesson['path']} for lesson in lessons],
+            'anki': {
+                'model_id': course['model_id'],
+                'deck_id': course['deck_id'],
+            },
+            'link': course['link'],
+        }
+
+    def _lesson_row(self, course_id, path):
+        row = self.connection.execute(
+            'SELECT * FROM lessons WHERE course_id = ? AND path = ?',
+            (course_id, str(path))).fetchone()
+        if row is None:
+            raise KeyError(f'The lesson {path} is not in the catalog {self.path}')
+        return row
+
+    def lesson_updates(self, course_id):
+        """
+        Returns the time every lesson of a course was last written, by its path.
+        """
+        rows = self.connection.execute('SELECT path, updated_at FROM lessons WHERE course_id = ?',
+                                       (course_id,))
+        return {row['path']: row['updated_at'] for row in rows}
+
+    def iter_phrases(self, course_id, path):
+        """
+        Yields the phrases of a lesson in their order, in the form of lesson-info.json.
+        """
+        lesson_id = self._lesson_row(course_id, path)['id']
+        cursor = self.connection.execute(
+            'SELECT source, target, source_audio, target_audio, comment FROM phrases '
+            'WHERE lesson_id = ? ORDER BY position', (lesson_id,))
+
+        for row in cursor:
+            yield dict(row)
+
+    def read_lesson(self, course_id, path):
+        """
+        Returns the lesson in the form of lesson-info.json.
+        """
+        lesson = self._lesson_row(course_id, path)
+
+        return {
+            'name': lesson['name'],
+            'number': lesson['number'],
+            'description': lesson['description'],
+            'phrases': list(self.iter_phrases(course_id, path)),
+            'link': lesson['link'],
+        }
+
+    def find_phrases(self, text, prefix=False, limit=100):
+        """
+        Looks up phrases by their source or target text through the indexes.
+
+        Parameters:
+        - text (str): The text of the phrase.
+        - prefix (bool): Match every phrase that starts with text.
+        - limit (int): The maximum amount of phrases.
+
+        Returns:
+        - list: Dicts with the phrase, its lesson path and its position in the lesson.
+        """
+        if prefix:
+            condition = '(p.{0} >= :text AND p.{0} < :end)'
+        else:
+            condition = 'p.{0} = :text'
+
+        query = (
+            'SELECT l.path AS lesson, p.position, p.source, p.target, p.source_audio, '
+            '       p.target_audio, p.comment '
+            'FROM phrases p JOIN lessons l ON l.id = p.lesson_id '
+            f'WHERE {condition.format("source")} OR {condition.format("target")} '
+            'ORDER BY l.number, p.position LIMIT :limit')
+
+        rows = self.connection.execute(query, {'text': text, 'end': _prefix_end(text), 'limit': limit})
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        return {table: self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('courses', 'lessons', 'phrases', 'media')}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Look up phrases in a course catalog')
+
+    parser.add_argument('-c', '--course-path', help='The path to the course.', required=True)
+    parser.add_argument('-f', '--find', help='The text of the phrase to look up.')
+    parser.add_argument('--prefix', action='store_true', help='Match the phrases that start with the text.')
+    parser.add_argument('--limit', type=int, default=100, help='The maximum amount of phrases.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    catalog_path = os.path.join(args.course_path, CATALOG_FILE)
+    if not os.path.exists(catalog_path):
+        parser.error(f'{args.course_path} has no catalog, create it with create_course.py --catalog')
+
+    with CourseCatalog(catalog_path) as catalog:
+        if args.find is None:
+            logging.info(f'Catalog {catalog_path}: {catalog.stats()}')
+            return
+
+        for phrase in catalog.find_phrases(args.find, prefix=args.prefix, limit=args.limit):
+            print(f"{phrase['lesson']}#{phrase['position']}: {phrase['source']} | {phrase['target']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os
+import fcntl
+import socket
+import logging
+from contextlib import contextmanager
+
+from create_course import COURSE_INFO, dump_file, read_json_from_file
+
+
+# course-info.json is replaced atomically on every write, so the lock lives in its own file
+COURSE_LOCK_FILE = '.course-info.lock'
+RESERVATIONS_DIR = '.reservations'
+
+
+@contextmanager
+def course_lock(course_path):
+    """
+    Holds an exclusive lock on a course between the processes of this host.
+
+    The lock is an flock, the kernel releases it when the holder dies,
+    so a crashed import never leaves the course locked.
+    """
+    lock_path = os.path.join(course_path, COURSE_LOCK_FILE)
+
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def update_course_info(course_path):
+    """
+    Reads course-info.json under the course lock and writes it back when the block succeeds.
+
+    Usage:
+        with update_course_info(course_path) as course_info:
+            course_info['lessons'].append(lesson)
+    """
+    with course_lock(course_path):
+        course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+
+        yield course_info
+
+        dump_file(folder_path=course_path, file_name=COURSE_INFO, data=course_info)
+
+
+def next_lesson_number(course_info):
+    # Failed imports may leave gaps, the number is past the highest used or reserved one
+    numbers = [int(lesson['path']) for lesson in course_info['lessons']
+               if str(lesson['path']).isdigit()]
+    numbers.extend(int(number) for number in course_info.get('reservations', {}))
+
+    return max(numbers + [len(course_info['lessons'])]) + 1
+
+
+def _lock_lesson(course_path, lesson_number):
+    """
+    Takes the import lock of a lesson number without waiting.
+
+    Returns:
+    - file: The open lock file (closing it releases the lock), or None when
+            another process is importing this lesson right now.
+    """
+    lock_dir = os.path.join(course_path, RESERVATIONS_DIR)
+    os.makedirs(lock_dir, exist_ok=True)
+
+    lock_file = open(os.path.join(lock_dir, f'{lesson_number}.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+
+    return lock_file
+
+
+@contextmanager
+def reserve_lessons(course_path, video_links):
+    """
+    Reserves a lesson number for every video link, atomically across processes.
+
+    A reservation is written to course-info.json, the process that made it holds the
+    import lock of the lesson until the block ends. A reservation whose lock is free
+    belongs to an import that failed or died: when it is for the same link, it is
+    taken over, so the import continues in the same lesson folder.
+    register_lessons() removes the reservations of the registered lessons.
+
+    Parameters:
+    - course_path (str): The path to the course.
+    - video_links (list): The links of the videos in the order of the lessons.
+
+    Yields:
+    - list: The lesson numbers in the order of video_links.
+    """
+    lesson_numbers = []
+    lock_files = []
+
+    try:
+        with update_course_info(course_path) as course_info:
+            reservations = course_info.setdefault('reservations', {})
+
+            for video_link in video_links:
+                lesson_number, lock_file = None, None
+
+                for reserved_number, reservation in reservations.items():
+                    if reservation['link'] != video_link or int(reserved_number) in lesson_numbers:
+                        continue
+
+                    lock_file = _lock_lesson(course_path, reserved_number)
+                    if lock_file is not None:
+                        lesson_number = int(reserved_number)
+                        logging.info(f'Taking over the abandoned lesson {lesson_number} for {video_link}')
+                        break
+
+                if lesson_number is None:
+                    lesson_number = next_lesson_number(course_info)
+                    lock_file = _lock_lesson(course_path, lesson_number)
+                    if lock_file is None:
+                        raise RuntimeError(f'The lesson {lesson_number} is locked without a reservation')
+
+                reservations[str(lesson_number)] = {
+                    'link': video_link,
+                    'host': socket.gethostname(),
+                    'pid': os.getpid(),
+                }
+                lesson_numbers.append(lesson_number)
+                lock_files.append(lock_file)
+
+        yield lesson_numbers
+
+    finally:
+        # Unregistered reservations stay, a later import of the same link takes them over
+        for lock_file in lock_files:
+            lock_file.close()
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 import os
 import json
+import stat
 import argparse
+from contextlib import contextmanager
 
 from anki_utlis import generate_id
+from course_catalog import CourseCatalog, CATALOG_FILE
 
 
 COURSE_INFO = 'course-info.json'
 LESSON_INFO = 'lesson-info.json'
+PHRASE_JOURNAL = 'lesson-phrases.jsonl'
 SOURCE_AUDIO_DIR = 'source-audio'
 
 DEFAULT_INDENT = 4
@@ -18,11 +22,41 @@ DEFAULT_INDENT = 4
 
 # TODO: Move dump_file and read_json_from_file to utils.py
 
+@contextmanager
+def atomic_write(file_path):
+    """
+    Opens a temporary file next to file_path and renames it over file_path on success,
+    so readers see either the old or the new content, never a truncated file.
+    """
+    folder_path = os.path.dirname(file_path) or '.'
+    temp_path = os.path.join(folder_path, f'.tmp-{os.urandom(6).hex()}')
+
+    # Created with the mode open() would give it, 0666 minus the umask
+    file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+
+    try:
+        with os.fdopen(file_descriptor, 'w') as file:
+            # A replaced file keeps its mode
+            try:
+                os.chmod(temp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+            except FileNotFoundError:
+                pass
+
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
 def dump_file(folder_path, file_name, data, indent=DEFAULT_INDENT):
     os.makedirs(folder_path, exist_ok=True)
     info_file_path = os.path.join(folder_path, file_name)
 
-    with open(info_file_path, 'w') as json_file:
+    with atomic_write(info_file_path) as json_file:
         json.dump(data, json_file, indent=indent)
 
 
@@ -61,7 +95,8 @@ def create_course(course_name, course_path,
                   source_language,
                   target_language,
                   link=None,
-                  description=''):
+                  description='',
+                  catalog=False):
 
     model_id = generate_id()
     deck_id = generate_id()
@@ -89,9 +124,17 @@ def create_course(course_name, course_path,
         'link': link,
     }
 
+    if catalog:
+        # The lessons are kept in an SQLite catalog, see course_catalog.py
+        course_structure['catalog'] = CATALOG_FILE
+
     dump_file(folder_path=course_path, file_name=COURSE_INFO,
               data=course_structure)
 
+    if catalog:
+        with open_catalog(course_path, course_info=course_structure) as course_catalog:
+            course_catalog.put_course(course_structure)
+
 
 def create_lesson(lesson_name, lesson_number, lesson_path, link=None,
                   description=''):
@@ -120,25 +163,317 @@ def create_lesson(lesson_name, lesson_number, lesson_path, link=None,
               data=lesson_structure)
 
 
+class PhraseJournal:
+    """
+    An append-only JSONL file with the phrases of a lesson that is being imported.
+
+    The first line holds the lesson without its phrases, every next line is one phrase.
+    Appending costs O(1) and a crash loses at most the phrase being written.
+    compact_lesson() turns the journal into lesson-info.json.
+    """
+
+    def __init__(self, lesson_path, lesson_structure):
+        self.path = os.path.join(lesson_path, PHRASE_JOURNAL)
+        self.count = 0
+
+        header = dict(lesson_structure, phrases=[])
+
+        os.makedirs(lesson_path, exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._write_line(header)
+
+    def _write_line(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def append(self, phrase):
+        self._write_line(phrase)
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _read_journal_header(journal_path):
+    """
+    Returns the lesson header, the first line of a journal.
+    """
+    with open(journal_path, 'r', encoding='utf-8') as file:
+        return json.loads(file.readline())
+
+
+def _iter_journal_phrases(journal_path):
+    """
+    Yields the phrases of a journal, the lines after the header.
+    """
+    with open(journal_path, 'r', encoding='utf-8') as file:
+        file.readline()
+
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A line that was cut off by a crash
+                continue
+
+
+def _indented(data, level, indent=DEFAULT_INDENT):
+    # The same layout json.dump(indent=indent) produces for data nested level deep
+    return json.dumps(data, indent=indent).replace('\n', '\n' + ' ' * (indent * level))
+
+
+def compact_lesson(lesson_path):
+    """
+    Writes lesson-info.json from the phrase journal of a lesson and removes the journal.
+
+    The phrases are streamed from the journal into a temporary file that replaces
+    lesson-info.json atomically, the lesson is never built in memory.
+    """
+    journal_path = os.path.join(lesson_path, PHRASE_JOURNAL)
+    header = _read_journal_header(journal_path)
+    pad = ' ' * DEFAULT_INDENT
+
+    with atomic_write(os.path.join(lesson_path, LESSON_INFO)) as json_file:
+        json_file.write('{')
+
+        for key_index, (key, value) in enumerate(header.items()):
+            json_file.write(',\n' if key_index else '\n')
+            json_file.write(f'{pad}{json.dumps(key)}: ')
+
+            if key != 'phrases':
+                json_file.write(_indented(value, level=1))
+                continue
+
+            json_file.write('[')
+            count = 0
+            for phrase in _iter_journal_phrases(journal_path):
+                json_file.write(',\n' if count else '\n')
+                json_file.write(f'{pad * 2}{_indented(phrase, level=2)}')
+                count += 1
+            json_file.write(f'\n{pad}]' if count else ']')
+
+        json_file.write('\n}')
+
+    os.remove(journal_path)
+
+
+def _journal_path_for(lesson_path):
+    if lesson_path.endswith('.jsonl'):
+        return lesson_path
+    return os.path.join(os.path.dirname(lesson_path), PHRASE_JOURNAL)
+
+
+@contextmanager
+def open_catalog(course_path, course_info=None):
+    """
+    Opens the catalog of a course, yields None when the course does not use one.
+    """
+    if course_info is None:
+        course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+
+    if not course_info.get('catalog'):
+        yield None
+        return
+
+    course_catalog = CourseCatalog(os.path.join(course_path, course_info['catalog']))
+    try:
+        yield course_catalog
+    finally:
+        course_catalog.close()
+
+
+def uses_catalog(course_path):
+    return bool(read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO)).get('catalog'))
+
+
+@contextmanager
+def _open_lesson_catalog(lesson_path):
+    """
+    Opens the catalog that holds the lesson of a lesson-info.json path that does not exist.
+
+    Yields:
+    - tuple: (the catalog, the id of the course, the path of the lesson in the course).
+    """
+    lesson_folder = os.path.dirname(os.path.abspath(lesson_path))
+    course_path = os.path.dirname(lesson_folder)
+    course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+
+    with open_catalog(course_path, course_info=course_info) as course_catalog:
+        if course_catalog is None:
+            raise FileNotFoundError(f'{lesson_path} does not exist and the course has no catalog')
+
+        yield course_catalog, course_catalog.course_id(course_info['name']), os.path.basename(lesson_folder)
+
+
+def iter_phrases(lesson_path):
+    """
+    Yields the phrases of a lesson one by one from its journal, its lesson-info.json
+    or the catalog of its course.
+    """
+    journal_path = _journal_path_for(lesson_path)
+    if os.path.exists(journal_path):
+        yield from _iter_journal_phrases(journal_path)
+        return
+
+    if os.path.exists(lesson_path):
+        yield from read_json_from_file(file_path=lesson_path)['phrases']
+        return
+
+    with _open_lesson_catalog(lesson_path) as (course_catalog, course_id, path):
+        yield from course_catalog.iter_phrases(course_id, path)
+
+
 def read_lesson(lesson_path):
-    return read_json_from_file(file_path=lesson_path)
+    """
+    Reads a lesson from lesson-info.json, or from the phrase journal next to it
+    while the lesson is still being imported (or its import was interrupted).
+    The lessons of a course with a catalog are read from the catalog.
+    """
+    journal_path = _journal_path_for(lesson_path)
+    if os.path.exists(journal_path):
+        header = _read_journal_header(journal_path)
+        header['phrases'] = list(_iter_journal_phrases(journal_path))
+        return header
+
+    if os.path.exists(lesson_path):
+        return read_json_from_file(file_path=lesson_path)
+
+    with _open_lesson_catalog(lesson_path) as (course_catalog, course_id, path):
+        return course_catalog.read_lesson(course_id, path)
+
+
+def _lesson_info_path(course_path, lesson_entry):
+    return os.path.join(course_path, str(lesson_entry['path']), LESSON_INFO)
+
+
+def sync_catalog(course_path, lesson_entries=None, course_info=None):
+    """
+    Moves lessons into the catalog of a course: a lesson that is being imported from
+    its phrase journal, any other from its lesson-info.json. From then on the catalog
+    holds the lesson, its journal and lesson-info.json are removed. Only the given
+    lesson entries are moved, all lessons of the course by default.
+    Does nothing for a course without a catalog.
+    """
+    if course_info is None:
+        course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+    if lesson_entries is None:
+        lesson_entries = course_info['lessons']
+
+    with open_catalog(course_path, course_info=course_info) as course_catalog:
+        if course_catalog is None:
+            return
+
+        course_id = course_catalog.put_course(course_info)
+
+        for lesson_entry in lesson_entries:
+            lesson_info_path = _lesson_info_path(course_path, lesson_entry)
+            journal_path = _journal_path_for(lesson_info_path)
+
+            # The phrases are streamed into the catalog, the lesson is never built in memory
+            if os.path.exists(journal_path):
+                lesson_info = _read_journal_header(journal_path)
+                phrases = _iter_journal_phrases(journal_path)
+            elif os.path.exists(lesson_info_path):
+                lesson_info = read_json_from_file(file_path=lesson_info_path)
+                phrases = None
+            else:
+                # In the catalog already
+                continue
+
+            course_catalog.put_lesson(course_id, lesson_entry, lesson_info, phrases=phrases,
+                                      media_dir=os.path.join(course_path, str(lesson_entry['path']),
+                                                             SOURCE_AUDIO_DIR))
+
+            # Only once the lesson is committed
+            for path in (journal_path, lesson_info_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def enable_catalog(course_path):
+    """
+    Moves the lessons of an existing course from its JSON files into a new catalog.
+    """
+    # course_lock builds on this module
+    from course_lock import update_course_info
+
+    # Under the course lock, a lesson registered meanwhile is either in the JSON files
+    # read here or sees the catalog and moves itself into it
+    with update_course_info(course_path) as course_info:
+        course_info['catalog'] = CATALOG_FILE
+
+        # Before any lesson leaves its JSON file, an interrupted move is read from both places
+        dump_file(folder_path=course_path, file_name=COURSE_INFO, data=course_info)
+        sync_catalog(course_path, course_info=course_info)
+
+
+def export_catalog(course_path):
+    """
+    Writes course-info.json and every lesson-info.json of a course from its catalog,
+    the course keeps its lessons in the JSON files again. The catalog file is left as it is.
+    The keys the catalog does not hold (e.g. the lesson reservations) are kept.
+    """
+    # course_lock builds on this module
+    from course_lock import update_course_info
+
+    with update_course_info(course_path) as course_info:
+        with open_catalog(course_path, course_info=course_info) as course_catalog:
+            if course_catalog is None:
+                raise ValueError(f'The course {course_path} has no catalog')
+
+            course_id = course_catalog.course_id(course_info['name'])
+            exported_info = course_catalog.read_course(course_id)
+
+            for lesson_entry in exported_info['lessons']:
+                dump_file(folder_path=os.path.join(course_path, lesson_entry['path']),
+                          file_name=LESSON_INFO,
+                          data=course_catalog.read_lesson(course_id, lesson_entry['path']))
+
+        course_info.update(exported_info)
+        course_info.pop('catalog')
 
 
 def main():
     parser = argparse.ArgumentParser(description='This script creates an empty course.')
 
-    parser.add_argument('-c', '--course', help='The course name.', required=True)
+    parser.add_argument('-c', '--course', help='The course name.')
     parser.add_argument('-p', '--path', help='The path to the course.', required=True)
 
-    parser.add_argument('-s', '--source-language', help='The name of the source language.', required=True)
-    parser.add_argument('-t', '--target-language', help='The name of the target language.', required=True)
+    parser.add_argument('-s', '--source-language', help='The name of the source language.')
+    parser.add_argument('-t', '--target-language', help='The name of the target language.')
+    parser.add_argument('--catalog', action='store_true',
+                        help='Keep the lessons of the course in an SQLite catalog instead of '
+                             'lesson-info.json files. The lessons of an existing course are moved into it.')
+    parser.add_argument('--export-catalog', action='store_true',
+                        help='Move the lessons of a course from its catalog back into lesson-info.json files.')
 
     # Parse the arguments
     args = parser.parse_args()
 
+    course_exists = os.path.exists(os.path.join(args.path, COURSE_INFO))
+
+    if args.export_catalog:
+        export_catalog(course_path=args.path)
+        return
+
+    if args.catalog and course_exists:
+        enable_catalog(course_path=args.path)
+        return
+
+    if args.course is None or args.source_language is None or args.target_language is None:
+        parser.error('the following arguments are required: -c/--course, '
+                     '-s/--source-language, -t/--target-language')
+
     create_course(course_name=args.course, course_path=args.path,
                   source_language=args.source_language,
-                  target_language=args.target_language)
+                  target_language=args.target_language,
+                  catalog=args.catalog)
 
 
 if __name__ == "__main__":
@@ -2,19 +2,34 @@
 
 import os
 import sys
+import json
+import time
 import shutil
 import logging
 import argparse
+import threading
 
 from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
 
-from pytube import YouTube
+from pytube import YouTube, Playlist
 from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api.formatters import JSONFormatter
+
+from chunked_download import download_file, RangesNotSupportedError
+from retry import retry_with_backoff, DEFAULT_RETRIES, DEFAULT_BACKOFF
 
 
 DEFAULT_SOURCE_LANGUAGE = 'en'
 
+METADATA_CACHE_DIR_ENV = 'VIDEO_CUTTER_METADATA_CACHE_DIR'
+DEFAULT_METADATA_CACHE_DIR = os.environ.get(
+    METADATA_CACHE_DIR_ENV,
+    os.path.join(os.path.expanduser('~'), '.cache', 'video-cutter', 'metadata'))
+DEFAULT_METADATA_TTL = 24 * 60 * 60
+
+GENERATED_SUFFIX = '_gen'
+DEFAULT_SUBTITLE_WORKERS = 4
+
 
 def get_youtube_video_id(url):
     """
@@ -42,65 +57,333 @@ def remove_mp4_suffix(file_name):
     return file_name
 
 
-def get_stream(url):
-    yt = YouTube(url)
-    return yt.streams.get_highest_resolution()
+class PytubeBackend:
+    """
+    Resolves videos with pytube and transcripts with youtube-transcript-api.
+    """
+
+    def __init__(self):
+        # TranscriptList objects by video id, so fetching several languages lists them once
+        self._transcript_lists = {}
+        self._lock = threading.Lock()
+
+    def resolve_stream(self, url, audio_only=False):
+        yt = YouTube(url)
+
+        if audio_only:
+            # The best audio-only (adaptive) stream, the picture is never downloaded
+            audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+            if audio_stream is not None:
+                return audio_stream
+            logging.warning(f'No audio-only stream was found for {url}, using the full video.')
+
+        return yt.streams.get_highest_resolution()
+
+    def _transcript_list(self, video_id):
+        # Concurrent fetches of one video must not list its transcripts several times
+        with self._lock:
+            if video_id not in self._transcript_lists:
+                self._transcript_lists[video_id] = YouTubeTranscriptApi.list_transcripts(video_id)
+            return self._transcript_lists[video_id]
+
+    def list_transcripts(self, video_id):
+        return [{'language_code': transcript.language_code,
+                 'language': transcript.language,
+                 'is_generated': transcript.is_generated}
+                for transcript in self._transcript_list(video_id)]
 
+    def fetch_transcript(self, video_id, language_code, is_generated):
+        transcript_list = self._transcript_list(video_id)
 
-def get_video_name(url):
-    return get_stream(url).default_filename
+        if is_generated:
+            transcript = transcript_list.find_generated_transcript([language_code])
+        else:
+            transcript = transcript_list.find_manually_created_transcript([language_code])
 
+        fetched = transcript.fetch()
+        # Newer versions of youtube-transcript-api return an object instead of a list
+        return fetched.to_raw_data() if hasattr(fetched, 'to_raw_data') else fetched
 
-def download_youtube_video(video_url, path):
+
+class LocalStream:
+    def __init__(self, media_path, title):
+        self.media_path = media_path
+        self.title = title
+        self.default_filename = os.path.basename(media_path)
+        self.filesize = os.path.getsize(media_path)
+
+    def download(self, output_path):
+        shutil.copyfile(self.media_path, os.path.join(output_path, self.default_filename))
+
+
+class LocalBackend:
+    """
+    A stand-in for PytubeBackend that serves a local media file and local transcripts.
+
+    Parameters:
+    - media_path (str): The file every video resolves to.
+    - transcripts (dict): {(language_code, is_generated): path to a transcript JSON}.
+    - title (str): The title of the video, defaults to the file name.
     """
-    Downloads a video and all its subtitles from YouTube.
+
+    def __init__(self, media_path, transcripts, title=None):
+        self.media_path = media_path
+        self.transcripts = transcripts
+        self.title = title or os.path.splitext(os.path.basename(media_path))[0]
+
+    def resolve_stream(self, url, audio_only=False):
+        return LocalStream(self.media_path, title=self.title)
+
+    def list_transcripts(self, video_id):
+        return [{'language_code': language_code,
+                 'language': language_code,
+                 'is_generated': is_generated}
+                for language_code, is_generated in self.transcripts]
+
+    def fetch_transcript(self, video_id, language_code, is_generated):
+        with open(self.transcripts[(language_code, is_generated)], 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+
+class VideoSession:
+    """
+    The metadata of one video resolved once and shared by the whole import.
+
+    The title, the file name and the list of transcripts are kept in an on-disk
+    cache for ttl seconds, so repeated or retried imports do not resolve them again.
+    The stream itself is only resolved when the video is downloaded.
+
+    Parameters:
+    - url (str): The URL of the video.
+    - audio_only (bool): Pick the best audio-only stream instead of the full video.
+    - backend: PytubeBackend or a stand-in with the same methods.
+    - cache_dir (str): The metadata cache folder, None disables the cache.
+    - ttl (int): How long the cached metadata is trusted, in seconds.
+    """
+
+    def __init__(self, url, audio_only=False, backend=None,
+                 cache_dir=DEFAULT_METADATA_CACHE_DIR, ttl=DEFAULT_METADATA_TTL):
+        self.url = url
+        self.audio_only = audio_only
+        self.video_id = get_youtube_video_id(url=url)
+        self.backend = backend or PytubeBackend()
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+        self._stream = None
+
+        metadata = self._load_cached_metadata()
+        if metadata is None:
+            metadata = self._resolve_metadata()
+            self._save_metadata(metadata)
+
+        self.title = metadata['title']
+        self.default_filename = metadata['default_filename']
+        self.transcripts = metadata['transcripts']
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            self._stream = self.backend.resolve_stream(self.url, audio_only=self.audio_only)
+        return self._stream
+
+    def _cache_path(self):
+        if self.cache_dir is None or self.video_id is None:
+            return None
+        # The audio-only stream has its own file name
+        suffix = '-audio' if self.audio_only else ''
+        return os.path.join(self.cache_dir, f'{self.video_id}{suffix}.json')
+
+    def _load_cached_metadata(self):
+        cache_path = self._cache_path()
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                metadata = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if time.time() - metadata.get('resolved_at', 0) > self.ttl:
+            return None
+
+        logging.info(f'Using the cached metadata of {self.url}')
+        return metadata
+
+    def _resolve_metadata(self):
+        stream = self.stream
+        return {
+            'resolved_at': time.time(),
+            'title': stream.title,
+            'default_filename': stream.default_filename,
+            'transcripts': self.backend.list_transcripts(self.video_id),
+        }
+
+    def _save_metadata(self, metadata):
+        cache_path = self._cache_path()
+        if cache_path is None:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = f'{cache_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(metadata, file)
+        os.replace(temp_path, cache_path)
+
+    def fetch_transcript(self, transcript):
+        return self.backend.fetch_transcript(self.video_id,
+                                             language_code=transcript['language_code'],
+                                             is_generated=transcript['is_generated'])
+
+
+def get_playlist_links(playlist_url):
+    return list(Playlist(playlist_url).video_urls)
+
+
+def get_stream(url, audio_only=False):
+    return VideoSession(url, audio_only=audio_only).stream
+
+
+def get_video_name(url, session=None):
+    session = session or VideoSession(url)
+    return session.default_filename
+
+
+def download_youtube_video(video_url, path, session=None, chunked=True):
+    """
+    Downloads a video from YouTube.
     
     Parameters:
     - video_url: str. The URL of the YouTube video.
-    - path: str. The directory path to save the video and subtitles.
+    - path: str. The directory path to save the video.
+    - session: VideoSession. The already resolved video, resolved here if missing.
+    - chunked: bool. Download in resumable range chunks, a failed download
+               continues from the staged chunks on the next attempt.
+               Streams that are not served in ranges are downloaded in one request.
     """
+    session = session or VideoSession(video_url)
 
     # Download video
-    stream = get_stream(url=video_url)
+    stream = session.stream
+    video_path = os.path.join(path, f'{stream.default_filename}')
 
     logging.info(f"Downloading video: {stream.title}")
-    stream.download(output_path=path)
+
+    chunked = chunked and bool(getattr(stream, 'url', None))
+    if chunked:
+        try:
+            # The signed URL changes between attempts, the video and the stream do not
+            download_file(url=stream.url, destination=video_path,
+                          key=f'{session.video_id}-{stream.itag}')
+        except RangesNotSupportedError as e:
+            logging.info(f'{e}, downloading the video in one request.')
+            chunked = False
+
+    if not chunked:
+        stream.download(output_path=path)
+
     logging.info(f"Video downloaded successfully: {stream.default_filename}")
 
-    return os.path.join(path, f'{stream.default_filename}')
+    return video_path
+
+
+def transcript_key(transcript):
+    """
+    Returns the key a transcript is known by, e.g. 'en' or 'en_gen' for a generated one.
+    """
+    if transcript['is_generated']:
+        return f'{transcript["language_code"]}{GENERATED_SUFFIX}'
+    return transcript['language_code']
+
+
+def select_transcripts(transcripts, languages=None, generated_fallback=True):
+    """
+    Picks the transcripts of the wanted languages.
+
+    Parameters:
+    - transcripts (list): The transcripts of a VideoSession.
+    - languages (list): Wanted keys, e.g. ['cs', 'en_gen']. None selects every transcript.
+    - generated_fallback (bool): Use the generated transcript of a language
+                                 that has no manually created one.
+
+    Returns:
+    - list: (requested key, transcript) pairs.
+    """
+    by_key = {transcript_key(transcript): transcript for transcript in transcripts}
+
+    if languages is None:
+        return list(by_key.items())
+
+    selected = []
+    for language in languages:
+        transcript = by_key.get(language)
+
+        if transcript is None and generated_fallback and not language.endswith(GENERATED_SUFFIX):
+            transcript = by_key.get(f'{language}{GENERATED_SUFFIX}')
+            if transcript is not None:
+                logging.info(f'There are no manual {language} subtitles, using the generated ones.')
+
+        if transcript is None:
+            logging.warning(f'There are no {language} subtitles, available: {", ".join(by_key)}')
+            continue
 
+        selected.append((language, transcript))
 
-def download_subtitles(video_url, path):
-    video_id = get_youtube_video_id(url=video_url)
-    transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-    video_name = get_video_name(url=video_url)
+    return selected
 
-    downloaded_subtitles = {}
-    for transcript in transcript_list:
-        youtube_video_name = remove_mp4_suffix(file_name=video_name)
 
-        language_code = transcript.language_code
-        file_name = f'{youtube_video_name} ({language_code}).json'
+def download_subtitles(video_url, path, session=None, languages=None, generated_fallback=True,
+                       workers=DEFAULT_SUBTITLE_WORKERS, retries=DEFAULT_RETRIES,
+                       backoff=DEFAULT_BACKOFF):
+    """
+    Downloads the subtitles of a video as YouTube transcript JSON files.
+
+    Parameters:
+    - video_url: str. The URL of the YouTube video.
+    - path: str. The directory path to save the subtitles.
+    - session: VideoSession. The already resolved video, resolved here if missing.
+    - languages: list. Wanted keys like 'cs' or 'en_gen', None downloads every transcript.
+    - generated_fallback: bool. Use generated subtitles for languages without manual ones.
+    - workers: int. The amount of concurrent fetches.
+    - retries: int. How many times a failed fetch is retried.
+    - backoff: float. The delay before the first retry, doubled for every next one.
+
+    Returns:
+    - dict. The paths of the downloaded subtitles by the requested keys.
+    """
+    session = session or VideoSession(video_url)
+    youtube_video_name = remove_mp4_suffix(file_name=session.default_filename)
 
-        if transcript.is_generated:
-            language_code = f'{transcript.language_code}_gen'
-            file_name = f'{youtube_video_name} ({language_code}).json'
+    selected = select_transcripts(session.transcripts, languages=languages,
+                                  generated_fallback=generated_fallback)
 
+    def download(transcript):
+        file_name = f'{youtube_video_name} ({transcript_key(transcript)}).json'
         file_path = os.path.join(path, file_name)
 
-        formatter = JSONFormatter()
-        text = transcript.fetch()
-        json_formatted = formatter.format_transcript(text)
+        text = retry_with_backoff(lambda: session.fetch_transcript(transcript),
+                                  retries=retries, backoff=backoff,
+                                  description=f'Fetching the {transcript_key(transcript)} subtitles')
+
+        # The backends return plain lists, which JSONFormatter of newer versions does not take
+        json_formatted = json.dumps(text)
 
         with open(file_path, 'w', encoding='utf-8') as file:
             file.write(json_formatted)
 
         logging.info(f'Downloaded {file_path}, amount of lines: {len(text)}')
+        return file_path
 
-        # Return downloaded subtitles
-        downloaded_subtitles[language_code] = file_path
+    # The same transcript may be requested under several keys, it is fetched once
+    unique_transcripts = {transcript_key(transcript): transcript for _, transcript in selected}
 
-    return downloaded_subtitles
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        file_paths = dict(zip(unique_transcripts,
+                              executor.map(download, unique_transcripts.values())))
+
+    # Return downloaded subtitles
+    return {language: file_paths[transcript_key(transcript)] for language, transcript in selected}
 
 
 def main():
@@ -120,6 +403,11 @@ def main():
                         help='Downloading all, video, subtitles')
 
     parser.add_argument('-p', '--path', help='The path to the output folder')
+    parser.add_argument('--languages',
+                        help='Comma separated subtitle languages to download, e.g. "cs,en_gen". '
+                             'All subtitles are downloaded by default.')
+    parser.add_argument('--audio-only', action='store_true',
+                        help='Download the best audio-only stream instead of the full video.')
 
     # Parse the arguments
     args = parser.parse_args()
@@ -131,15 +419,20 @@ def main():
     # Make sure that the folder exists
     os.makedirs(output_dir, exist_ok=True)
 
+    session = VideoSession(args.link, audio_only=args.audio_only)
+    languages = args.languages.split(',') if args.languages else None
+
     if args.download == download_options[0]:
-        download_youtube_video(video_url=args.link, path=output_dir)
-        download_subtitles(video_url=args.link, path=output_dir)
+        download_youtube_video(video_url=args.link, path=output_dir, session=session)
+        download_subtitles(video_url=args.link, path=output_dir, session=session,
+                           languages=languages)
 
     elif args.download == download_options[1]:
-        download_youtube_video(video_url=args.link, path=output_dir)
+        download_youtube_video(video_url=args.link, path=output_dir, session=session)
 
     elif args.download == download_options[2]:
-        download_subtitles(video_url=args.link, path=output_dir)
+        download_subtitles(video_url=args.link, path=output_dir, session=session,
+                           languages=languages)
 
 
 if __name__ == "__main__":
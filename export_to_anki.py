@@ -1,89 +1,566 @@
 #!/usr/bin/env python3
 
-import json
 import os
+import re
+import json
+import shutil
+import hashlib
+import logging
 import argparse
+import tempfile
 import genanki
 
-from create_course import COURSE_INFO
+from create_course import (COURSE_INFO, LESSON_INFO, SOURCE_AUDIO_DIR,
+                           read_json_from_file, iter_phrases, open_catalog, dump_file)
+from media_index import MediaIndex, MEDIA_INDEX_FILE, DEFAULT_HASH_WORKERS, content_name
+from media_profile import (PROFILES, DEFAULT_TRANSCODE_CACHE_DIR,
+                           DEFAULT_TRANSCODE_CACHE_SIZE_MB, transcode_media)
+from segment_cache import SegmentCache, link_or_copy
+from apkg_writer import ApkgWriter
+from parallel import ordered_map
+
+
+DECKS_DIR = 'decks'
+DEFAULT_LESSONS_PER_SHARD = 1
+EXPORT_MANIFEST_SUFFIX = '.manifest.json'
+EXPORT_MANIFEST_VERSION = 2
 
 
-parser = argparse.ArgumentParser(description='Export to Anki.')
+def build_model(course_info):
+    """
+    Defines the Anki model using information from course-info.json.
+    """
+    target_language = course_info['target_language']
 
-parser.add_argument('-c', '--course-path', help='The course path.', required=True)
-# Parse the arguments
-args = parser.parse_args()
+    return genanki.Model(
+        course_info['anki']['model_id'],
+        'Simple Model with Audio',
+        fields=[
+            {'name': 'English'},
+            {'name': target_language},
+            {'name': 'Audio'},
+        ],
+        templates=[
+            {
+                'name': 'Card 1',
+                'qfmt': '{{English}}<br>{{Audio}}',  # Question format
+                'afmt': '{{FrontSide}}<hr id="answer">{{' + target_language + '}}',  # Answer format
+            },
+        ]
+    )
 
 
-# Path to your course-info.json file
-course_info_path = os.path.join(args.course_path, COURSE_INFO)
+def lesson_signatures(course_path, course_info, lessons):
+    """
+    Returns what tells a changed lesson apart without reading it, by its path:
+    (size, mtime) of its lesson-info.json, or (update time,) of the lesson
+    in the catalog of the course. None when the lesson is in neither.
+    """
+    signatures = {}
+    in_catalog = []
 
-# Load course info
-with open(course_info_path, 'r') as file:
-    course_info = json.load(file)
+    for lesson in lessons:
+        path = str(lesson['path'])
+        try:
+            stat = os.stat(os.path.join(course_path, path, LESSON_INFO))
+            signatures[path] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            signatures[path] = None
+            in_catalog.append(path)
 
-MODEL_ID = course_info['anki']['model_id']
-DECK_ID = course_info['anki']['deck_id']
-TARGET_LANGUAGE = course_info['target_language']
+    if in_catalog:
+        # One query for all the lessons
+        with open_catalog(course_path, course_info=course_info) as course_catalog:
+            if course_catalog is not None:
+                updates = course_catalog.lesson_updates(course_catalog.course_id(course_info['name']))
+                for path in in_catalog:
+                    if path in updates:
+                        signatures[path] = [updates[path]]
 
-# Define the Anki model using information from course-info.json
-my_model = genanki.Model(
-    MODEL_ID,
-    'Simple Model with Audio',
-    fields=[
-        {'name': 'English'},
-        {'name': TARGET_LANGUAGE},
-        {'name': 'Audio'},
-    ],
-    templates=[
-        {
-            'name': 'Card 1',
-            'qfmt': '{{English}}<br>{{Audio}}',  # Question format
-            'afmt': '{{FrontSide}}<hr id="answer">{{' + TARGET_LANGUAGE + '}}',  # Answer format
-        },
+    return signatures
+
+
+def note_fields(note, media_name=None):
+    return [
+        *note['text'],
+        '[sound:{}]'.format(media_name) if media_name else '',  # Audio field
     ]
-)
-
-# Create a new Anki deck
-my_deck = genanki.Deck(
-    DECK_ID,
-    course_info['name']
-)
-
-output_path = 'output_deck.apkg'
-
-# Collect audio files to be added to the Anki package
-audio_files = []
-
-for lesson in course_info['lessons']:
-    lesson_path = os.path.join(os.path.dirname(course_info_path), lesson['path'], 'lesson-info.json')
-    
-    # Load lesson info
-    with open(lesson_path, 'r') as file:
-        lesson_info = json.load(file)
-    
-    # Add cards for each phrase in the lesson
-    for phrase in lesson_info['phrases']:
+
+
+def phrase_hash(text, audio_path):
+    return hashlib.sha1(json.dumps([text, audio_path], ensure_ascii=False).encode()).hexdigest()
+
+
+def export_lesson(course_path, lesson, deck_id, signature=None):
+    """
+    Turns the phrases of a lesson into note fields and collects its audio files.
+
+    Returns:
+    - dict: The manifest entry of the lesson: its signature (taken before it is read),
+            its notes (stable guid, text fields, audio file and their hash) and its media files.
+    """
+    lesson_folder = os.path.join(course_path, str(lesson['path']))
+
+    notes = []
+    media = {}
+
+    for position, phrase in enumerate(iter_phrases(os.path.join(lesson_folder, LESSON_INFO))):
+        audio_path = None
+
         if phrase['source_audio']:
-            audio_path = os.path.join(os.path.dirname(lesson_path), 'source-audio', os.path.basename(phrase['source_audio']))
-            print(audio_path)
-
-            # Ensure the audio file exists before adding it to the list
-            if os.path.exists(audio_path) and audio_path not in audio_files:
-                audio_files.append(audio_path)
-        
-        note = genanki.Note(
-            model=my_model,
-            fields=[
-                # TODO: source and target subtitles should be swapped.
-                phrase['target'],  # English field
-                phrase['source'],  # Target language field
-                '[sound:{}]'.format(os.path.basename(phrase['source_audio'])) if phrase['source_audio'] else '',  # Audio field
-            ]
-        )
-        my_deck.add_note(note)
-
-# Package the deck and include the audio files
-genanki.Package(my_deck, media_files=audio_files).write_to_file(output_path)
-
-print(f"Deck created: {output_path}")
+            audio_path = os.path.join(lesson_folder, SOURCE_AUDIO_DIR, os.path.basename(phrase['source_audio']))
+
+            # Ensure the audio file exists before adding it to the package
+            try:
+                stat = os.stat(audio_path)
+                media[audio_path] = [stat.st_size, stat.st_mtime_ns]
+            except FileNotFoundError:
+                logging.warning(f'The audio file {audio_path} is missing')
+                audio_path = None
+
+        text = [
+            # TODO: source and target subtitles should be swapped.
+            phrase['target'],  # English field
+            phrase['source'],  # Target language field
+        ]
+        notes.append({
+            # The guid only depends on where the phrase is, so Anki updates
+            # an edited phrase in place instead of adding a new note.
+            'guid': genanki.guid_for(deck_id, lesson['path'], position),
+            'text': text,
+            'audio': audio_path,
+            'hash': phrase_hash(text, audio_path),
+        })
+
+    return {
+        'signature': signature,
+        'notes': notes,
+        'media': media,
+    }
+
+
+def export_manifest_path(output_path):
+    return output_path + EXPORT_MANIFEST_SUFFIX
+
+
+def load_export_manifest(manifest_path, course_info):
+    """
+    Returns the lessons of the previous export, or an empty dict when it cannot be reused.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+
+    try:
+        manifest = read_json_from_file(file_path=manifest_path)
+    except json.JSONDecodeError:
+        logging.warning(f'The export manifest {manifest_path} is broken, exporting everything.')
+        return {}
+
+    if (manifest.get('version') != EXPORT_MANIFEST_VERSION
+            or manifest.get('anki') != course_info['anki']
+            or manifest.get('target_language') != course_info['target_language']):
+        return {}
+
+    return manifest['lessons']
+
+
+def write_genanki_package(output_path, decks, media, staging_parent):
+    """
+    Writes decks with their notes in memory through genanki.Package.
+    """
+    # genanki packs a file under its own name, so the audio is linked under its content name
+    staging_dir = tempfile.mkdtemp(dir=staging_parent, prefix='.export-media-')
+    try:
+        media_files = []
+        for name, path in media.items():
+            staged_path = os.path.join(staging_dir, name)
+            link_or_copy(path, staged_path)
+            media_files.append(staged_path)
+
+        # Write next to the output and rename, a failed export keeps the previous package
+        temp_output_path = f'{output_path}.part'
+        genanki.Package(decks, media_files=media_files).write_to_file(temp_output_path)
+        os.replace(temp_output_path, output_path)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def course_slug(course_info):
+    return re.sub(r'[^\w]+', '-', course_info['name']).strip('-').lower() or 'course'
+
+
+def default_output_path(course_path, course_info):
+    """
+    The package of a course lives in the course, so exports of different courses never collide.
+    """
+    return os.path.join(course_path, f'{course_slug(course_info)}.apkg')
+
+
+def lesson_deck_id(course_info, lesson_path):
+    # Stable across exports and shards, in the same range as anki_utlis.generate_id()
+    digest = hashlib.sha1(f"{course_info['anki']['deck_id']}:{lesson_path}".encode()).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], 'big') % (1 << 30)
+
+
+def _export_lessons(course_path, course_info, lessons, output_path, incremental=False,
+                    hash_workers=DEFAULT_HASH_WORKERS, streaming=False, profile=None,
+                    transcode_workers=1, transcode_cache=None, sub_decks=False,
+                    media_index_path=None):
+    """
+    Writes the given lessons of a course into one package, see export_course().
+    The caller evicts the transcode cache, several exports may share it at once.
+    """
+    manifest_path = export_manifest_path(output_path)
+
+    previous_lessons = load_export_manifest(manifest_path, course_info) if incremental else {}
+
+    exported_lessons = {}
+    signatures = lesson_signatures(course_path, course_info, lessons)
+    stats = {'lessons': 0, 'read_lessons': 0, 'notes': 0, 'media': 0, 'hashed_media': 0,
+             'transcoded_media': 0, 'added': 0, 'updated': 0, 'removed': 0}
+
+    # The hashes are cached by size and mtime, only new or changed audio is read
+    media_index = MediaIndex(media_index_path or os.path.join(course_path, MEDIA_INDEX_FILE),
+                             workers=hash_workers)
+    media_paths = set()
+    unique_media = {}
+
+    model = build_model(course_info)
+    decks = [genanki.Deck(course_info['anki']['deck_id'], course_info['name'])]
+
+    # Every lesson gets a sub-deck Course::Lesson under the deck of the course
+    lesson_decks = {}
+    if sub_decks:
+        for lesson in lessons:
+            lesson_deck = genanki.Deck(lesson_deck_id(course_info, lesson['path']),
+                                       f"{course_info['name']}::{lesson['name'] or lesson['path']}")
+            lesson_decks[str(lesson['path'])] = lesson_deck
+            decks.append(lesson_deck)
+
+    for deck in decks:
+        deck.add_model(model)
+
+    def exported_lessons_with_media():
+        for lesson in lessons:
+            path = str(lesson['path'])
+            signature = signatures[path]
+            previous = previous_lessons.get(path)
+
+            if previous is not None and signature is not None and previous['signature'] == signature:
+                exported_lesson = previous
+            else:
+                exported_lesson = export_lesson(course_path, lesson, deck_id=course_info['anki']['deck_id'],
+                                                signature=signature)
+                stats['read_lessons'] += 1
+
+                previous_hashes = {note['guid']: note['hash'] for note in (previous or {}).get('notes', [])}
+                for note in exported_lesson['notes']:
+                    if note['guid'] not in previous_hashes:
+                        stats['added'] += 1
+                    elif previous_hashes.pop(note['guid']) != note['hash']:
+                        stats['updated'] += 1
+                stats['removed'] += len(previous_hashes)
+
+            # Only the manifest needs the lessons after they are written
+            if incremental:
+                exported_lessons[path] = exported_lesson
+            stats['lessons'] += 1
+
+            digests = media_index.digests(exported_lesson['media'])
+            media_paths.update(exported_lesson['media'])
+
+            yield path, exported_lesson, digests
+
+    def exported_notes():
+        # One lesson at a time, so the notes can be written while they are made
+        lesson_exports = exported_lessons_with_media()
+
+        # path -> (name in the package, the file that is packed)
+        packed_media = {}
+        if profile is not None:
+            # The audio of all the lessons in one pool, lessons have only a few phrases each
+            lesson_exports = list(lesson_exports)
+            all_digests = {}
+            for _, _, digests in lesson_exports:
+                all_digests.update(digests)
+
+            packed_media, stats['transcoded_media'] = transcode_media(
+                all_digests, profile, cache=transcode_cache, workers=transcode_workers)
+
+        for path, exported_lesson, digests in lesson_exports:
+            if profile is None:
+                packed_media = {media_path: (content_name(media_path, digest), media_path)
+                                for media_path, digest in digests.items()}
+
+            for media_path in digests:
+                name, packed_path = packed_media[media_path]
+                unique_media.setdefault(name, packed_path)
+
+            deck = lesson_decks.get(path, decks[0])
+            for note in exported_lesson['notes']:
+                stats['notes'] += 1
+                media_name = packed_media[note['audio']][0] if note['audio'] is not None else None
+                yield deck, genanki.Note(model=model, guid=note['guid'],
+                                         fields=note_fields(note, media_name))
+
+    if streaming:
+        with ApkgWriter(output_path, decks=decks) as writer:
+            for deck, note in exported_notes():
+                writer.add_note(note, deck_id=deck.deck_id)
+            for name, media_path in unique_media.items():
+                writer.add_media(name, media_path)
+    else:
+        for deck, note in exported_notes():
+            deck.add_note(note)
+        write_genanki_package(output_path, decks, unique_media, staging_parent=course_path)
+
+    media_index.save(keep=media_paths)
+
+    # Lessons that are gone
+    exported_paths = {str(lesson['path']) for lesson in lessons}
+    stats['removed'] += sum(len(previous['notes']) for path, previous in previous_lessons.items()
+                            if path not in exported_paths)
+
+    stats['media'] = len(unique_media)
+    stats['hashed_media'] = media_index.hashed
+
+    if incremental:
+        dump_file(folder_path=os.path.dirname(os.path.abspath(manifest_path)),
+                  file_name=os.path.basename(manifest_path),
+                  data={
+                      'version': EXPORT_MANIFEST_VERSION,
+                      'anki': course_info['anki'],
+                      'target_language': course_info['target_language'],
+                      'options': {'profile': profile, 'sub_decks': sub_decks},
+                      'lessons': exported_lessons,
+                  },
+                  indent=None)
+
+    logging.info(f'Deck created: {output_path} ({stats})')
+    return stats
+
+
+def _transcode_cache(profile, transcode_cache):
+    if profile is not None and transcode_cache is None:
+        return SegmentCache(cache_dir=DEFAULT_TRANSCODE_CACHE_DIR,
+                            max_bytes=DEFAULT_TRANSCODE_CACHE_SIZE_MB << 20)
+    return transcode_cache
+
+
+def export_course(course_path, output_path=None, incremental=False,
+                  hash_workers=DEFAULT_HASH_WORKERS, streaming=False,
+                  profile=None, transcode_workers=1, transcode_cache=None,
+                  sub_decks=False):
+    """
+    Exports a course into an Anki package.
+
+    In the incremental mode an export manifest is kept next to the package. Lessons whose
+    lesson-info.json (or catalog entry) did not change since the last export are taken from
+    the manifest, their phrases are not read again and their audio files are not stat-ed again.
+
+    The audio files are packed under names derived from their content (see media_index.py),
+    so segments of different lessons never collide and identical audio is packed once.
+
+    Parameters:
+    - course_path (str): The path to the course.
+    - output_path (str): The .apkg file to write, defaults to <course_path>/<course name>.apkg.
+    - incremental (bool): Reuse the unchanged lessons of the previous export.
+    - hash_workers (int): The amount of audio files hashed at once.
+    - streaming (bool): Write the notes and the media into the package as they are
+                        made (see apkg_writer.py) instead of building the deck in memory.
+    - profile (str): One of media_profile.PROFILES to transcode the audio with,
+                     None packs the segments as they are.
+    - transcode_workers (int): The amount of audio files transcoded at once.
+    - transcode_cache (SegmentCache): The store of the transcoded audio.
+                                      Defaults to one in DEFAULT_TRANSCODE_CACHE_DIR.
+    - sub_decks (bool): Put the notes of every lesson into a sub-deck Course::Lesson.
+
+    Returns:
+    - dict: Counts of the exported lessons, notes and media and of the re-read lessons and
+            the added, updated and removed notes since the previous export.
+    """
+    course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+    transcode_cache = _transcode_cache(profile, transcode_cache)
+
+    stats = _export_lessons(course_path, course_info, course_info['lessons'],
+                            output_path=output_path or default_output_path(course_path, course_info),
+                            incremental=incremental, hash_workers=hash_workers,
+                            streaming=streaming, profile=profile,
+                            transcode_workers=transcode_workers, transcode_cache=transcode_cache,
+                            sub_decks=sub_decks)
+
+    if transcode_cache is not None:
+        transcode_cache.evict()
+
+    return stats
+
+
+def shard_output_path(output_dir, course_info, lessons):
+    first, last = lessons[0]['path'], lessons[-1]['path']
+    suffix = f'{first}' if first == last else f'{first}-{last}'
+    return os.path.join(output_dir, f'{course_slug(course_info)}-{suffix}.apkg')
+
+
+def shard_is_fresh(course_path, course_info, lessons, output_path, profile):
+    """
+    Tells whether a shard package already holds exactly these lessons in their current state.
+    """
+    manifest_path = export_manifest_path(output_path)
+    if not os.path.exists(output_path) or not os.path.exists(manifest_path):
+        return False
+
+    try:
+        manifest = read_json_from_file(file_path=manifest_path)
+    except json.JSONDecodeError:
+        return False
+
+    if (manifest.get('version') != EXPORT_MANIFEST_VERSION
+            or manifest.get('options') != {'profile': profile, 'sub_decks': True}
+            or set(manifest['lessons']) != {str(lesson['path']) for lesson in lessons}):
+        return False
+
+    signatures = lesson_signatures(course_path, course_info, lessons)
+    return all(signature is not None and manifest['lessons'][path]['signature'] == signature
+               for path, signature in signatures.items())
+
+
+def _export_shard(course_path, course_info, lessons, output_path, hash_workers,
+                  streaming, profile, transcode_workers, transcode_cache):
+    if shard_is_fresh(course_path, course_info, lessons, output_path, profile):
+        return {'lessons': len(lessons), 'skipped': True}
+
+    # Every shard has its own media index, the shards run in parallel processes
+    return _export_lessons(course_path, course_info, lessons, output_path,
+                           incremental=True, hash_workers=hash_workers,
+                           streaming=streaming, profile=profile,
+                           transcode_workers=transcode_workers, transcode_cache=transcode_cache,
+                           sub_decks=True, media_index_path=f'{output_path}.{MEDIA_INDEX_FILE}')
+
+
+def export_shards(course_path, output_dir=None, lessons_per_shard=DEFAULT_LESSONS_PER_SHARD,
+                  workers=1, hash_workers=DEFAULT_HASH_WORKERS, streaming=False,
+                  profile=None, transcode_workers=1, transcode_cache=None):
+    """
+    Exports a course into one package per group of lessons, the packages are built in parallel.
+
+    Every shard holds the deck of the course with a sub-deck Course::Lesson per lesson,
+    so importing all the shards into Anki gives one deck hierarchy. A shard whose lessons
+    did not change since its last export is not built again. Packages of shards that
+    no longer exist (e.g. after changing lessons_per_shard) are removed.
+
+    Parameters:
+    - course_path (str): The path to the course.
+    - output_dir (str): The folder of the packages, defaults to <course_path>/decks.
+    - lessons_per_shard (int): The amount of lessons in one package.
+    - workers (int): The amount of shards built at once (processes).
+    - The other parameters are the same as for export_course().
+
+    Returns:
+    - dict: The stats of every shard by its package path. Skipped shards have 'skipped' set.
+    """
+    course_info = read_json_from_file(file_path=os.path.join(course_path, COURSE_INFO))
+    transcode_cache = _transcode_cache(profile, transcode_cache)
+
+    if output_dir is None:
+        output_dir = os.path.join(course_path, DECKS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+
+    course_lessons = course_info['lessons']
+    shards = [course_lessons[start:start + lessons_per_shard]
+              for start in range(0, len(course_lessons), lessons_per_shard)]
+    output_paths = [shard_output_path(output_dir, course_info, lessons) for lessons in shards]
+
+    jobs = ((course_path, course_info, lessons, output_path, hash_workers,
+             streaming, profile, transcode_workers, transcode_cache)
+            for lessons, output_path in zip(shards, output_paths))
+
+    results = dict(zip(output_paths, ordered_map(_export_shard, jobs, workers=workers,
+                                                 trace_name='export_shard')))
+
+    # Shards of an earlier layout would hold the same notes twice
+    prefix = f'{course_slug(course_info)}-'
+    for file_name in os.listdir(output_dir):
+        package_path = os.path.join(output_dir, file_name)
+        if file_name.startswith(prefix) and file_name.endswith('.apkg') and package_path not in results:
+            for path in (package_path, export_manifest_path(package_path),
+                         f'{package_path}.{MEDIA_INDEX_FILE}'):
+                if os.path.exists(path):
+                    os.remove(path)
+            logging.info(f'Removed the stale shard {package_path}')
+
+    if transcode_cache is not None:
+        transcode_cache.evict()
+
+    skipped = sum(1 for stats in results.values() if stats.get('skipped'))
+    logging.info(f'Exported {len(shards)} shards into {output_dir}, {skipped} were up to date.')
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Export to Anki.')
+
+    parser.add_argument('-c', '--course-path', help='The course path.', required=True)
+    parser.add_argument('-o', '--output',
+                        help='The path to the .apkg file, defaults to <course>/<course name>.apkg. '
+                             'With --lessons-per-shard, the folder of the packages '
+                             '(defaults to <course>/decks).')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Keep an export manifest next to the package and re-read '
+                             'only the lessons that changed since the previous export.')
+    parser.add_argument('--sub-decks', action='store_true',
+                        help='Put the notes of every lesson into a sub-deck Course::Lesson.')
+    parser.add_argument('--lessons-per-shard', type=int,
+                        help='Export one package per this many lessons instead of one package. '
+                             'Only the shards with changed lessons are built again (always incremental).')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The amount of shards built at once.')
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help='The amount of audio files hashed at once.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Stream the notes and the media into the package, '
+                             'the memory stays flat for big courses.')
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        help='Transcode the audio for a compact deck, e.g. voice-mp3 '
+                             '(mono 32 kbps MP3) or voice-opus (mono 24 kbps Opus), '
+                             'both loudness normalized. By default the segments are packed as they are.')
+    parser.add_argument('--transcode-workers', type=int,
+                        help='The amount of processes that transcode the audio in every export, '
+                             'defaults to the CPU count divided by the shard workers.')
+    parser.add_argument('--transcode-cache-dir', default=DEFAULT_TRANSCODE_CACHE_DIR,
+                        help='The cache of the transcoded audio, shared between courses.')
+    parser.add_argument('--transcode-cache-size', type=int, default=DEFAULT_TRANSCODE_CACHE_SIZE_MB,
+                        help='The size limit of the transcode cache in MB.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Every shard worker runs its own transcode pool
+    transcode_workers = args.transcode_workers
+    if transcode_workers is None:
+        shard_workers = args.workers if args.lessons_per_shard is not None else 1
+        transcode_workers = max((os.cpu_count() or 1) // shard_workers, 1)
+
+    transcode_cache = None
+    if args.profile is not None:
+        transcode_cache = SegmentCache(cache_dir=args.transcode_cache_dir,
+                                       max_bytes=args.transcode_cache_size << 20)
+
+    if args.lessons_per_shard is not None:
+        export_shards(course_path=args.course_path, output_dir=args.output,
+                      lessons_per_shard=args.lessons_per_shard, workers=args.workers,
+                      hash_workers=args.hash_workers, streaming=args.streaming,
+                      profile=args.profile, transcode_workers=transcode_workers,
+                      transcode_cache=transcode_cache)
+        return
+
+    export_course(course_path=args.course_path, output_path=args.output,
+                  incremental=args.incremental, hash_workers=args.hash_workers,
+                  streaming=args.streaming, profile=args.profile,
+                  transcode_workers=transcode_workers,
+                  transcode_cache=transcode_cache, sub_decks=args.sub_decks)
+
+
+if __name__ == "__main__":
+    main()
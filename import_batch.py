@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from download_from_youtube import get_playlist_links
+from import_lesson import (temp_directory, download_lesson,
+                           build_lesson, register_lessons)
+from course_lock import reserve_lessons
+from segmenter import SPLIT_MODES, PRECISE_MODE, DECODE_MODES, MEMORY_DECODE
+from segment_cache import add_cache_arguments, cache_from_arguments
+from tracing import span, enable_tracing, save_trace
+
+
+DEFAULT_DOWNLOAD_WORKERS = 2
+DEFAULT_SPLIT_WORKERS = 1
+
+DOWNLOAD_STAGE = 'download'
+SPLIT_STAGE = 'split'
+
+
+def import_lessons(course_path, video_links,
+                   source_abbreviation, target_abbreviation,
+                   download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                   split_workers=DEFAULT_SPLIT_WORKERS,
+                   workers=1, mode=PRECISE_MODE, decode=MEMORY_DECODE,
+                   cache=None, audio_only=True, max_downloaded=None):
+    """
+    Imports several videos into a course, downloading the next videos while the current ones are split.
+
+    The lesson numbers follow the order of video_links no matter in which order
+    the lessons finish. They are reserved up front, so other imports into the
+    same course can run at the same time. Every finished lesson is added to
+    course-info.json right away.
+
+    Parameters:
+    - course_path (str): The path to the course.
+    - video_links (list): The links of the videos in the order of the lessons.
+    - source_abbreviation (str): Abbreviation of the source language.
+    - target_abbreviation (str): Abbreviation of the target language.
+    - download_workers (int): The amount of videos downloaded at once.
+    - split_workers (int): The amount of lessons split at once.
+    - workers (int): The amount of processes that encode the segments of one lesson.
+    - mode (str): One of SPLIT_MODES.
+    - decode (str): One of DECODE_MODES.
+    - cache (SegmentCache): A segment cache shared between courses, or None.
+    - audio_only (bool): Download only the audio streams.
+    - max_downloaded (int): The cap on downloaded lessons waiting for a split, bounds the disk use.
+                            Defaults to download_workers + split_workers.
+
+    Returns:
+    - dict: The links that failed with their errors.
+    """
+    # Downloads wait for a slot, so a slow split does not let the downloads fill the disk
+    download_slots = threading.BoundedSemaphore(max_downloaded or download_workers + split_workers)
+    failures = {}
+
+    with reserve_lessons(course_path, video_links) as lesson_numbers, \
+            temp_directory() as temp_processing_folder:
+
+        def download(index, video_link):
+            download_slots.acquire()
+            try:
+                lesson_folder = os.path.join(temp_processing_folder, f'{index}')
+                os.makedirs(lesson_folder)
+
+                return download_lesson(video_link=video_link, path=lesson_folder,
+                                       source_abbreviation=source_abbreviation,
+                                       target_abbreviation=target_abbreviation,
+                                       audio_only=audio_only)
+            except BaseException:
+                download_slots.release()
+                raise
+
+        def split(index, downloaded_lesson):
+            try:
+                with span('build_lesson', link=downloaded_lesson['video_link']):
+                    return build_lesson(course_path=course_path,
+                                        lesson_number=lesson_numbers[index],
+                                        downloaded_lesson=downloaded_lesson,
+                                        workers=workers, mode=mode, decode=decode, cache=cache)
+            finally:
+                shutil.rmtree(os.path.join(temp_processing_folder, f'{index}'), ignore_errors=True)
+                download_slots.release()
+
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+                ThreadPoolExecutor(max_workers=split_workers) as split_pool:
+
+            pending = {download_pool.submit(download, index, video_link): (DOWNLOAD_STAGE, index)
+                       for index, video_link in enumerate(video_links)}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(f'The {stage} of {video_links[index]} failed: {e}')
+                        failures[video_links[index]] = e
+                        continue
+
+                    if stage == DOWNLOAD_STAGE:
+                        pending[split_pool.submit(split, index, result)] = (SPLIT_STAGE, index)
+                        continue
+
+                    # Only this thread writes course-info.json
+                    register_lessons(course_path=course_path, lessons=[result])
+                    logging.info(f'Lesson {lesson_numbers[index]} is ready: {video_links[index]}')
+
+    return failures
+
+
+def main():
+    # A course should be create before using this script
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Import several videos or a playlist to a course')
+
+    parser.add_argument('-c', '--course-path', help='The path to the course.', required=True)
+    parser.add_argument('-v', '--video-links', nargs='+', default=[],
+                        help='The links to the videos, in the order of the lessons.')
+    parser.add_argument('-f', '--links-file', help='A file with one video link per line.')
+    parser.add_argument('--playlist', help='The link to a playlist.')
+
+    parser.add_argument('-s', '--source-language', help='Abbreviation of the source language', required=True)
+    parser.add_argument('-t', '--target-language', help='Abbreviation of the target language', required=True)
+
+    parser.add_argument('--download-workers', type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help='The amount of videos downloaded at once.')
+    parser.add_argument('--split-workers', type=int, default=DEFAULT_SPLIT_WORKERS,
+                        help='The amount of lessons split at once.')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The amount of processes that encode the segments of one lesson.')
+    parser.add_argument('-m', '--mode', choices=SPLIT_MODES, default=PRECISE_MODE,
+                        help='precise re-encodes every segment, copy cuts the original '
+                             'audio packets without re-encoding.')
+    parser.add_argument('--decode', choices=DECODE_MODES, default=MEMORY_DECODE,
+                        help='memory decodes the whole audio track at once, stream decodes '
+                             'it in windows to keep the memory flat for long sources.')
+    add_cache_arguments(parser)
+    parser.add_argument('--trace', help='Save a Chrome trace (JSON) of the import stages to this file.')
+    parser.add_argument('--full-video', action='store_true',
+                        help='Download the full videos instead of only their audio streams.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    video_links = list(args.video_links)
+    if args.links_file is not None:
+        with open(args.links_file, 'r') as file:
+            video_links.extend(line.strip() for line in file if line.strip())
+    if args.playlist is not None:
+        video_links.extend(get_playlist_links(args.playlist))
+
+    if not video_links:
+        parser.error('No videos to import, use --video-links, --links-file or --playlist.')
+
+    if args.trace is not None:
+        enable_tracing()
+
+    try:
+        failures = import_lessons(course_path=args.course_path, video_links=video_links,
+                                  source_abbreviation=args.source_language,
+                                  target_abbreviation=args.target_language,
+                                  download_workers=args.download_workers,
+                                  split_workers=args.split_workers,
+                                  workers=args.workers, mode=args.mode, decode=args.decode,
+                                  cache=cache_from_arguments(args),
+                                  audio_only=not args.full_video)
+    finally:
+        save_trace(args.trace)
+
+    if failures:
+        logging.error(f'{len(failures)} of {len(video_links)} videos failed: {", ".join(failures)}')
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import shutil
 import tempfile
 import logging
@@ -9,15 +8,22 @@ import argparse
 from contextlib import contextmanager
 
 from create_course import (COURSE_INFO, LESSON_INFO,
-                           SOURCE_AUDIO_DIR, dump_file,
+                           SOURCE_AUDIO_DIR,
                            create_lesson, read_lesson,
-                           read_json_from_file)
+                           PhraseJournal, compact_lesson,
+                           uses_catalog, sync_catalog)
 
-from download_from_youtube import (download_youtube_video,
-                                   get_video_name,
+from download_from_youtube import (VideoSession,
+                                   download_youtube_video,
                                    download_subtitles)
 
 from split_video import split_video
+from course_lock import update_course_info, reserve_lessons
+from align_subtitles import align_subtitles
+from subtitles import load_cues
+from segmenter import SPLIT_MODES, PRECISE_MODE, DECODE_MODES, MEMORY_DECODE
+from segment_cache import add_cache_arguments, cache_from_arguments
+from tracing import span, enable_tracing, save_trace
 
 
 @contextmanager
@@ -29,50 +35,86 @@ def temp_directory():
         shutil.rmtree(temp_dir)  # Clean up the temporary directory when done
 
 
-def import_lesson(course_path, video_link,
-                  source_abbreviation, target_abbreviation):
-
-    # Getting course_info
-    course_info_path = os.path.join(course_path, COURSE_INFO)
-    course_info = None
+def download_lesson(video_link, path, source_abbreviation, target_abbreviation,
+                    session=None, audio_only=True):
+    """
+    Downloads the media and the subtitles of a lesson into path.
 
-    with open(course_info_path, 'r') as file:
-        course_info = json.load(file)
+    Returns:
+    - dict: The video name and the paths of the media and the source/target subtitles.
+    """
+    # The video is resolved once and the session is shared by all the downloads
+    with span('resolve_metadata', link=video_link):
+        session = session or VideoSession(video_link, audio_only=audio_only)
 
-    lesson_number = len(course_info['lessons']) + 1
-
-    with temp_directory() as temp_processing_folder:
-        video_name = get_video_name(url=video_link)
+    with span('download_video', link=video_link) as current:
         video_path = download_youtube_video(video_url=video_link,
-                                            path=temp_processing_folder)
-        downloaded_subtitles = download_subtitles(video_url=video_link,
-                                                path=temp_processing_folder)
-
-        # Splitting audio
-        audio_chunks_path = os.path.join(course_path, f'{lesson_number}', SOURCE_AUDIO_DIR)
-        # TODO: source and target subtitles should be swapped.
-        path_to_source_subtitles = downloaded_subtitles[source_abbreviation]
-        path_to_target_subtitles = downloaded_subtitles[target_abbreviation]
-
-        # TODO: Remove this interesting logic
-        target_subs = read_json_from_file(file_path=path_to_target_subtitles)
-
-        # TODO: Adding a comparison between the source and target subtitles.
-        # TODO: Get name of the lesson without .mp4 suffix.
-        # TODO: Create a classes for lessons and courses.
+                                            path=path,
+                                            session=session)
+        current.set(bytes=os.path.getsize(video_path))
 
-        lesson_path_folder = os.path.join(course_path, f'{lesson_number}')
-        lesson_path = os.path.join(lesson_path_folder, LESSON_INFO)
-
-        create_lesson(lesson_name=video_name, lesson_number=lesson_number,
-                      lesson_path=lesson_path_folder,
-                      link=video_link)
-        lesson_structure = read_lesson(lesson_path=lesson_path)
-        phrases = lesson_structure['phrases']
-
-        for index, subtitle, segment_filename in split_video(path_to_video=video_path,
-                                                            path_to_subtitles=path_to_source_subtitles,
-                                                            output_dir=audio_chunks_path):
+    with span('download_subtitles', link=video_link) as current:
+        downloaded_subtitles = download_subtitles(video_url=video_link,
+                                                path=path,
+                                                session=session,
+                                                languages=[source_abbreviation,
+                                                           target_abbreviation])
+        current.set(subtitles=len(downloaded_subtitles))
+
+    # TODO: source and target subtitles should be swapped.
+    return {
+        'video_link': video_link,
+        'video_name': session.default_filename,
+        'video_path': video_path,
+        'source_subtitles': downloaded_subtitles[source_abbreviation],
+        'target_subtitles': downloaded_subtitles[target_abbreviation],
+    }
+
+
+def build_lesson(course_path, lesson_number, downloaded_lesson,
+                 workers=1, mode=PRECISE_MODE, decode=MEMORY_DECODE, cache=None):
+    """
+    Splits a downloaded lesson into <course_path>/<lesson_number> and writes its lesson-info.json.
+    For a course with a catalog the phrase journal is left for register_lessons().
+
+    Returns:
+    - dict: The entry of the lesson for course-info.json.
+    """
+    video_link = downloaded_lesson['video_link']
+    video_name = downloaded_lesson['video_name']
+
+    # Splitting audio
+    audio_chunks_path = os.path.join(course_path, f'{lesson_number}', SOURCE_AUDIO_DIR)
+
+    # The tracks rarely have the same cues, the target text of every source cue is matched by time
+    source_subs = load_cues(downloaded_lesson['source_subtitles'])
+    target_subs = load_cues(downloaded_lesson['target_subtitles'])
+
+    with span('align', source_cues=len(source_subs), target_cues=len(target_subs)):
+        target_texts = align_subtitles(source_subs=source_subs, target_subs=target_subs)
+
+    # TODO: Get name of the lesson without .mp4 suffix.
+    # TODO: Create a classes for lessons and courses.
+
+    lesson_path_folder = os.path.join(course_path, f'{lesson_number}')
+    lesson_path = os.path.join(lesson_path_folder, LESSON_INFO)
+
+    create_lesson(lesson_name=video_name, lesson_number=lesson_number,
+                  lesson_path=lesson_path_folder,
+                  link=video_link)
+    lesson_structure = read_lesson(lesson_path=lesson_path)
+
+    # Every phrase is appended to the journal as soon as its segment is ready,
+    # lesson-info.json is written once at the end instead of being rebuilt in memory.
+    with PhraseJournal(lesson_path_folder, lesson_structure) as journal, \
+            span('split', mode=mode, decode=decode, workers=workers) as current:
+        for index, subtitle, segment_filename in split_video(path_to_video=downloaded_lesson['video_path'],
+                                                            path_to_subtitles=downloaded_lesson['source_subtitles'],
+                                                            output_dir=audio_chunks_path,
+                                                            workers=workers,
+                                                            mode=mode,
+                                                            decode=decode,
+                                                            cache=cache):
 
             logging.info(f'The next chunk was processed: index = {index}, '
                         f'subtitle={subtitle}, segment={segment_filename}.')
@@ -80,36 +122,84 @@ def import_lesson(course_path, video_link,
             # TODO: Creating a phrase should be possibly inside the class.
             phrase = {
                 'source': subtitle['text'],
-                'target': target_subs[index]['text'],
+                'target': target_texts[index],
 
                 'source_audio': segment_filename,
                 'target_audio': None,
                 'comment': None,
             }
-            phrases.append(phrase)
+            journal.append(phrase)
+
+        current.set(segments=journal.count)
+
+    # A catalog takes the phrases from the journal when the lesson is registered
+    if not uses_catalog(course_path):
+        with span('write_lesson', phrases=journal.count) as current:
+            compact_lesson(lesson_path=lesson_path_folder)
+            current.set(bytes=os.path.getsize(lesson_path))
+
+    # {
+        # 'name': '<name>',
+        # 'source-link': '<link>',
+        # 'path': '<path-to-the-lesson>'
+    # },
+
+    return {
+        'name': video_name,
+        'source-link': video_link,
+        'path': f'{lesson_number}'
+    }
+
+
+def register_lessons(course_path, lessons):
+    """
+    Adds lessons to course-info.json and drops their reservations, the lessons stay
+    ordered by their numbers. Other processes may import into the same course,
+    so the course file is re-read and written under the course lock.
+    A course with a catalog gets the lessons from their phrase journals.
+    """
+    paths = {lesson['path'] for lesson in lessons}
+
+    with span('write_course', lessons=len(lessons)) as current:
+        with update_course_info(course_path) as course_info:
+            # A lesson that is imported again replaces its old entry
+            course_info['lessons'] = [lesson for lesson in course_info['lessons']
+                                      if lesson['path'] not in paths]
+            course_info['lessons'].extend(lessons)
+            course_info['lessons'].sort(key=lambda lesson: int(lesson['path'])
+                                        if str(lesson['path']).isdigit() else 0)
+
+            reservations = course_info.get('reservations', {})
+            for path in paths:
+                reservations.pop(path, None)
+
+        current.set(bytes=os.path.getsize(os.path.join(course_path, COURSE_INFO)))
+
+    # Only the new lessons are moved into the catalog (if the course has one)
+    with span('write_catalog', lessons=len(lessons)):
+        sync_catalog(course_path=course_path, lesson_entries=lessons, course_info=course_info)
 
-        # {
-            # 'name': '<name>',
-            # 'source-link': '<link>',
-            # 'path': '<path-to-the-lesson>'
-        # },
 
-        lesson = {
-            'name': video_name,
-            'source-link': video_link,
-            'path': f'{lesson_number}'
-        }
+def import_lesson(course_path, video_link,
+                  source_abbreviation, target_abbreviation,
+                  workers=1, mode=PRECISE_MODE, decode=MEMORY_DECODE,
+                  cache=None, session=None, audio_only=True):
 
-        course_info['lessons'].append(lesson)
+    # The number is reserved, so parallel imports into the same course get their own lessons
+    with reserve_lessons(course_path, [video_link]) as (lesson_number,), \
+            temp_directory() as temp_processing_folder:
+        downloaded_lesson = download_lesson(video_link=video_link,
+                                            path=temp_processing_folder,
+                                            source_abbreviation=source_abbreviation,
+                                            target_abbreviation=target_abbreviation,
+                                            session=session,
+                                            audio_only=audio_only)
 
-        dump_file(folder_path=lesson_path_folder,
-                  file_name=LESSON_INFO,
-                  data=lesson_structure)
+        lesson = build_lesson(course_path=course_path, lesson_number=lesson_number,
+                              downloaded_lesson=downloaded_lesson,
+                              workers=workers, mode=mode, decode=decode, cache=cache)
 
-        # Dump the course info back
-        dump_file(folder_path=course_path,
-                file_name=COURSE_INFO,
-                data=course_info)
+        register_lessons(course_path=course_path, lessons=[lesson])
 
 
 def main():
@@ -124,15 +214,40 @@ def main():
     # TODO: We do not need to know the exact abbreviation of the target and source languages.
     parser.add_argument('-s', '--source-language', help='Abbreviation of the source language', required=True)
     parser.add_argument('-t', '--target-language', help='Abbreviation of the target language', required=True)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The amount of processes that encode segments.')
+    parser.add_argument('-m', '--mode', choices=SPLIT_MODES, default=PRECISE_MODE,
+                        help='precise re-encodes every segment, copy cuts the original '
+                             'audio packets without re-encoding (much faster, the cuts '
+                             'land on packet boundaries).')
+    parser.add_argument('--decode', choices=DECODE_MODES, default=MEMORY_DECODE,
+                        help='memory decodes the whole audio track at once, stream decodes '
+                             'it in windows to keep the memory flat for long sources.')
+    add_cache_arguments(parser)
+    parser.add_argument('--trace', help='Save a Chrome trace (JSON) of the import stages to this file.')
+    parser.add_argument('--full-video', action='store_true',
+                        help='Download the full video instead of only its audio stream.')
 
     # Parse the arguments
     args = parser.parse_args()
 
     logging.info(f'{args.course_path} {args.video_link}')
 
-    import_lesson(course_path=args.course_path, video_link=args.video_link,
-                  source_abbreviation=args.source_language,
-                  target_abbreviation=args.target_language)
+    if args.trace is not None:
+        enable_tracing()
+
+    try:
+        with span('import_lesson', link=args.video_link):
+            import_lesson(course_path=args.course_path, video_link=args.video_link,
+                          source_abbreviation=args.source_language,
+                          target_abbreviation=args.target_language,
+                          workers=args.workers,
+                          mode=args.mode,
+                          decode=args.decode,
+                          cache=cache_from_arguments(args),
+                          audio_only=not args.full_video)
+    finally:
+        save_trace(args.trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from create_course import dump_file, read_json_from_file
+from segment_manifest import hash_file
+
+
+MEDIA_INDEX_FILE = 'media-index.json'
+MEDIA_INDEX_VERSION = 1
+
+# 128 bits of the SHA-256 keep the names short and collisions out of reach
+CONTENT_NAME_LENGTH = 32
+DEFAULT_HASH_WORKERS = 4
+
+
+def content_name(path, digest):
+    """
+    Returns the name of a media file inside a package: its content hash plus its extension.
+    Files with the same content get the same name, different files never share one.
+    """
+    _, extension = os.path.splitext(path)
+    return f'{digest[:CONTENT_NAME_LENGTH]}{extension.lower()}'
+
+
+class MediaIndex:
+    """
+    The content hashes of media files, cached by their size and mtime.
+
+    A file is only hashed again when its size or mtime changes, so indexing
+    a course costs a stat per file (or nothing, when the stat is already known)
+    plus hashing of the new files.
+    """
+
+    def __init__(self, index_path, workers=DEFAULT_HASH_WORKERS):
+        self.index_path = index_path
+        self.workers = workers
+        self.entries = {}
+        self.hashed = 0
+
+        if os.path.exists(index_path):
+            try:
+                index = read_json_from_file(file_path=index_path)
+                if index.get('version') == MEDIA_INDEX_VERSION:
+                    self.entries = index['files']
+            except json.JSONDecodeError:
+                logging.warning(f'The media index {index_path} is broken, hashing everything again.')
+
+    def digests(self, files):
+        """
+        Returns the SHA-256 of every file, hashing only the new and the changed ones.
+
+        Parameters:
+        - files (dict): path -> [size, mtime_ns], or path -> None to stat the file here.
+
+        Returns:
+        - dict: path -> hex digest.
+        """
+        result = {}
+        to_hash = {}
+
+        for path, stat in files.items():
+            if stat is None:
+                file_stat = os.stat(path)
+                stat = [file_stat.st_size, file_stat.st_mtime_ns]
+
+            key = os.path.abspath(path)
+            entry = self.entries.get(key)
+            if entry is not None and entry[:2] == list(stat):
+                result[path] = entry[2]
+            else:
+                to_hash[path] = (key, stat)
+
+        # hashlib releases the GIL, threads hash several files at once
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            for path, digest in zip(to_hash, executor.map(hash_file, to_hash)):
+                key, stat = to_hash[path]
+                self.entries[key] = [*stat, digest]
+                result[path] = digest
+
+        self.hashed += len(to_hash)
+        return result
+
+    def package_names(self, files):
+        """
+        Gives every file its content-addressed name inside a package.
+
+        Returns:
+        - tuple: (path -> name, name -> path of one file with that content).
+        """
+        names = {path: content_name(path, digest) for path, digest in self.digests(files).items()}
+
+        unique_files = {}
+        for path, name in names.items():
+            unique_files.setdefault(name, path)
+
+        return names, unique_files
+
+    def save(self, keep=None):
+        """
+        Writes the index. With keep, only the entries of these paths are kept,
+        so files that are gone do not pile up in the index.
+        """
+        entries = self.entries
+        if keep is not None:
+            keys = {os.path.abspath(path) for path in keep}
+            entries = {key: entry for key, entry in entries.items() if key in keys}
+
+        dump_file(folder_path=os.path.dirname(os.path.abspath(self.index_path)),
+                  file_name=os.path.basename(self.index_path),
+                  data={'version': MEDIA_INDEX_VERSION, 'files': entries},
+                  indent=None)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Find media files with the same content')
+
+    parser.add_argument('-p', '--path', help='The folder with the media files.', required=True)
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help='The amount of files hashed at once.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    files = {os.path.join(root, name): None
+             for root, _, names in os.walk(args.path) for name in names
+             if name != MEDIA_INDEX_FILE}
+
+    media_index = MediaIndex(os.path.join(args.path, MEDIA_INDEX_FILE), workers=args.workers)
+    _, unique_files = media_index.package_names(files)
+    media_index.save(keep=files)
+
+    logging.info(f'{len(files)} files, {len(unique_files)} distinct, {media_index.hashed} hashed.')
+
+
+if __name__ == "__main__":
+    main()
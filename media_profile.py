@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import logging
+import subprocess
+from collections import namedtuple
+
+from segmenter import FFMPEG_BINARY
+from segment_cache import SegmentCache
+from media_index import CONTENT_NAME_LENGTH, content_name
+from parallel import ordered_map
+
+
+MediaProfile = namedtuple('MediaProfile', ['codec', 'container', 'extension',
+                                           'bitrate', 'sample_rate', 'channels', 'loudnorm'])
+
+# Speech stays clear at these rates, a segment shrinks to a fraction of the 128k stereo default
+PROFILES = {
+    'voice-mp3': MediaProfile(codec='libmp3lame', container='mp3', extension='mp3',
+                              bitrate='32k', sample_rate=22050, channels=1, loudnorm=True),
+    'voice-opus': MediaProfile(codec='libopus', container='ogg', extension='ogg',
+                               bitrate='24k', sample_rate=48000, channels=1, loudnorm=True),
+}
+
+# EBU R128 single pass, so phrases cut from different videos play at the same volume
+LOUDNORM_FILTER = 'loudnorm=I=-16:TP=-1.5:LRA=11'
+
+TRANSCODE_CACHE_DIR_ENV = 'VIDEO_CUTTER_TRANSCODE_CACHE_DIR'
+DEFAULT_TRANSCODE_CACHE_DIR = os.environ.get(
+    TRANSCODE_CACHE_DIR_ENV,
+    os.path.join(os.path.expanduser('~'), '.cache', 'video-cutter', 'transcoded'))
+DEFAULT_TRANSCODE_CACHE_SIZE_MB = 2 * 1024
+
+
+def transcode_command(source, destination, profile):
+    command = [FFMPEG_BINARY, '-y', '-v', 'error',
+               '-i', source,
+               '-vn', '-map', '0:a:0',
+               '-ac', str(profile.channels), '-ar', str(profile.sample_rate)]
+
+    if profile.loudnorm:
+        command += ['-af', LOUDNORM_FILTER]
+
+    return command + ['-c:a', profile.codec, '-b:a', profile.bitrate,
+                      '-map_metadata', '-1',
+                      '-f', profile.container, destination]
+
+
+def transcode_file(source, destination, profile):
+    """
+    Transcodes one audio file, the destination only appears once it is complete.
+
+    Returns:
+    - str: The destination, or None when ffmpeg failed (e.g. loudnorm aborts on a file without audio).
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+    # Parallel exports may transcode the same content at once
+    temp_destination = f'{destination}.{os.getpid()}.tmp'
+    try:
+        subprocess.run(transcode_command(source, temp_destination, profile), check=True)
+        os.replace(temp_destination, destination)
+    except subprocess.CalledProcessError as e:
+        logging.warning(f'Transcoding {source} failed ({e}), it is packed as it is.')
+        return None
+    finally:
+        if os.path.exists(temp_destination):
+            os.remove(temp_destination)
+
+    return destination
+
+
+def profile_media_name(digest, profile_name):
+    # The profile is a part of the name, Anki keeps a file it already has under the same name
+    return f'{digest[:CONTENT_NAME_LENGTH]}-{profile_name}.{PROFILES[profile_name].extension}'
+
+
+def transcode_media(digests, profile_name, cache=None, workers=1):
+    """
+    Transcodes media files with a profile, each distinct content only once.
+
+    The outputs are cached by the content hash of the input and the profile,
+    so an unchanged segment is never transcoded twice, whatever its path.
+    A file ffmpeg fails on is packed as it is, under its content name.
+
+    Parameters:
+    - digests (dict): path -> SHA-256 of the file, see MediaIndex.digests().
+    - profile_name (str): One of PROFILES.
+    - cache (SegmentCache): The store of the transcoded files.
+                            Defaults to one in DEFAULT_TRANSCODE_CACHE_DIR.
+    - workers (int): The amount of ffmpeg processes at once.
+
+    Returns:
+    - tuple: (path -> (name in the package, path of the transcoded file),
+              the amount of files transcoded now).
+    """
+    profile = PROFILES[profile_name]
+    if cache is None:
+        cache = SegmentCache(cache_dir=DEFAULT_TRANSCODE_CACHE_DIR,
+                             max_bytes=DEFAULT_TRANSCODE_CACHE_SIZE_MB << 20)
+
+    result = {}
+    jobs = {}
+
+    for path, digest in digests.items():
+        key = hashlib.sha256(json.dumps([digest, profile_name, profile]).encode()).hexdigest()
+
+        transcoded_path = cache.lookup(key, profile.extension)
+        if transcoded_path is None:
+            transcoded_path = cache.path_for(key, profile.extension)
+            jobs.setdefault(transcoded_path, (path, transcoded_path, profile))
+
+        result[path] = (profile_media_name(digest, profile_name), transcoded_path)
+
+    failed = set()
+    for transcoded_path, destination in zip(jobs, ordered_map(transcode_file, jobs.values(),
+                                                              workers=workers, trace_name='transcode')):
+        if destination is None:
+            failed.add(transcoded_path)
+
+    for path, (_, transcoded_path) in result.items():
+        if transcoded_path in failed:
+            result[path] = (content_name(path, digests[path]), path)
+
+    return result, len(jobs) - len(failed)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from tracing import tracing_enabled, timed_call, record
+
+
+# The pools are started while other threads run (downloads of import_batch), a forked child
+# could inherit a lock one of them holds. The workers start from a clean server process instead.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# The format every script configures, the workers do not inherit the setup of the parent
+WORKER_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def _init_worker(log_level):
+    logging.basicConfig(level=log_level, format=WORKER_LOG_FORMAT)
+
+
+def ordered_map(function, arguments, workers=1, max_pending=None,
+                trace_name=None, trace_args=None):
+    """
+    Runs function(*args) for every tuple in arguments and yields the results in input order.
+
+    With more than one worker the calls run in a process pool. At most max_pending
+    calls are in flight or finished-but-not-yet-yielded, so a slow consumer never
+    makes the pool pile up results in memory.
+
+    Parameters:
+    - function (callable): A picklable top-level function. The workers are not forked,
+                           they import its module again.
+    - arguments (iterable): Tuples of positional arguments, consumed lazily.
+    - workers (int): The amount of worker processes; 1 runs everything inline.
+    - max_pending (int): The cap on submitted but not yet yielded calls.
+                         Defaults to twice the amount of workers.
+    - trace_name (str): While tracing, every call is recorded as a span with this name.
+    - trace_args (callable): Turns a result into the arguments of its span.
+
+    Yields:
+    - The results of the calls in the order of arguments.
+    """
+    if trace_name is not None and tracing_enabled():
+        # The calls time themselves, so the spans show when the workers really ran
+        timed_results = ordered_map(timed_call, ((function, *args) for args in arguments),
+                                    workers=workers, max_pending=max_pending)
+
+        for index, (result, start_us, duration_us, pid, tid) in enumerate(timed_results):
+            span_args = trace_args(result) if trace_args is not None else {}
+            record(trace_name, start_us, duration_us, pid=pid, tid=tid, index=index, **span_args)
+            yield result
+        return
+
+    if workers is None or workers <= 1:
+        for args in arguments:
+            yield function(*args)
+        return
+
+    if max_pending is None:
+        max_pending = workers * 2
+
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   mp_context=multiprocessing.get_context(START_METHOD),
+                                   initializer=_init_worker,
+                                   initargs=(logging.getLogger().getEffectiveLevel(),))
+    pending = deque()
+
+    try:
+        for args in arguments:
+            pending.append(executor.submit(function, *args))
+
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    finally:
+        # The consumer may stop early or a call may fail, do not leave work behind.
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+
+def retry_with_backoff(function, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                       exceptions=Exception, description='The call'):
+    """
+    Calls function() and retries it after 'backoff * 2 ** attempt' seconds when it raises.
+
+    Parameters:
+    - function (callable): Called without arguments, its result is returned.
+    - retries (int): How many times a failed call is retried.
+    - backoff (float): The delay before the first retry, doubled for every next one.
+    - exceptions (type or tuple): The exceptions that are retried, others are raised at once.
+    - description (str): What is called, for the log, e.g. 'Chunk chunk-00001.part'.
+
+    Returns:
+    - The result of the first call that succeeds. The exception of the last attempt is raised.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except exceptions as e:
+            if attempt == retries:
+                raise
+
+            delay = backoff * 2 ** attempt
+            logging.warning(f'{description} failed (attempt {attempt + 1}): {e}, retrying in {delay:.1f}s')
+            time.sleep(delay)
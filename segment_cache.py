@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+
+
+CACHE_DIR_ENV = 'VIDEO_CUTTER_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'video-cutter', 'segments')
+DEFAULT_CACHE_SIZE_MB = 5 * 1024
+
+# When every entry was last used, one "<time> <entry path>" line per hit
+ACCESS_LOG = 'access.log'
+
+# ioctl request that clones a file's extents on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def _reflink(source, destination):
+    import fcntl
+
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+
+
+def link_or_copy(source, destination):
+    """
+    Places source at destination as a hardlink, a reflink or, as the last resort, a copy.
+    The destination is replaced atomically and never shares an inode it is written through.
+    """
+    temp_destination = f'{destination}.tmp'
+    if os.path.exists(temp_destination):
+        os.remove(temp_destination)
+
+    try:
+        os.link(source, temp_destination)
+    except OSError:
+        try:
+            _reflink(source, temp_destination)
+        except (OSError, ImportError):
+            shutil.copyfile(source, temp_destination)
+
+    os.replace(temp_destination, destination)
+
+
+class SegmentCache:
+    """
+    A content-addressed store of segments shared by all courses.
+
+    Segments are keyed by the content hash of the source, the cue timing and the encoding
+    parameters, so the same cue of the same media is only encoded once. Hits are appended
+    to an access log and evict() removes the least recently used entries until the cache
+    fits into max_bytes. The entries themselves are never touched, they share their inode
+    (and so their mtime) with the lesson files they are linked into.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_SIZE_MB << 20):
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.access_log_path = os.path.join(self.cache_dir, ACCESS_LOG)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(source, start_time, end_time, buffer_time, parameters):
+        data = json.dumps([source, round(start_time, 6), round(end_time, 6),
+                           buffer_time, parameters], sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def path_for(self, key, extension):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.{extension}')
+
+    def lookup(self, key, extension):
+        """
+        Returns the path of a cached entry, or None on a miss.
+        """
+        cached_path = self.path_for(key, extension)
+        if not os.path.exists(cached_path):
+            return None
+
+        # One short append, so the lines of processes that share the cache do not mix
+        with open(self.access_log_path, 'a', encoding='utf-8') as access_log:
+            access_log.write(f'{time.time():.3f} {os.path.relpath(cached_path, self.cache_dir)}\n')
+
+        return cached_path
+
+    def _read_access_log(self):
+        last_used = {}
+        try:
+            with open(self.access_log_path, 'r', encoding='utf-8') as access_log:
+                for line in access_log:
+                    try:
+                        used, relative_path = line.rstrip('\n').split(' ', 1)
+                        last_used[relative_path] = max(float(used), last_used.get(relative_path, 0))
+                    except ValueError:
+                        # A line that was cut off by a crash
+                        continue
+        except FileNotFoundError:
+            pass
+
+        return last_used
+
+    def _write_access_log(self, last_used):
+        # A hit that another process logs meanwhile is lost, its entry only looks older
+        temp_path = f'{self.access_log_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as access_log:
+            for relative_path, used in last_used.items():
+                access_log.write(f'{used:.3f} {relative_path}\n')
+
+        os.replace(temp_path, self.access_log_path)
+
+    def fetch(self, key, segment_filename):
+        """
+        Links the cached segment into segment_filename.
+
+        Returns:
+        - bool: True on a hit.
+        """
+        extension = os.path.splitext(segment_filename)[1][1:]
+        cached_path = self.lookup(key, extension)
+        if cached_path is None:
+            return False
+
+        link_or_copy(cached_path, segment_filename)
+        return True
+
+    def store(self, key, segment_filename):
+        extension = os.path.splitext(segment_filename)[1][1:]
+        cached_path = self.path_for(key, extension)
+
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        link_or_copy(segment_filename, cached_path)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits into max_bytes.
+        """
+        last_used = self._read_access_log()
+        entries = []
+        total_bytes = 0
+
+        for root, _, files in os.walk(self.cache_dir):
+            # The entries are in the subfolders, the access log is at the top
+            if root == self.cache_dir:
+                continue
+
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                # An entry that was never hit counts as used when it was stored
+                relative_path = os.path.relpath(path, self.cache_dir)
+                entries.append((max(stat.st_mtime, last_used.get(relative_path, 0)), stat.st_size,
+                                relative_path))
+                total_bytes += stat.st_size
+
+        entries.sort()
+        removed = 0
+        for _, size, relative_path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(os.path.join(self.cache_dir, relative_path))
+            except FileNotFoundError:
+                pass
+
+            total_bytes -= size
+            removed += 1
+
+        # Compacts the log to one line per entry that is still there
+        if last_used:
+            kept = {relative_path for _, _, relative_path in entries[removed:]}
+            self._write_access_log({relative_path: used for relative_path, used in last_used.items()
+                                    if relative_path in kept})
+
+        if removed:
+            logging.info(f'Evicted {removed} entries from the cache {self.cache_dir}.')
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-dir',
+                        default=os.environ.get(CACHE_DIR_ENV),
+                        help='A segment cache shared between courses, '
+                             f'also taken from ${CACHE_DIR_ENV}. Disabled by default.')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help='The size limit of the segment cache in MB.')
+
+
+def cache_from_arguments(args):
+    if args.cache_dir is None:
+        return None
+    return SegmentCache(cache_dir=args.cache_dir, max_bytes=args.cache_size << 20)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import logging
+
+
+MANIFEST_FILE = 'segments-manifest.jsonl'
+
+# The fingerprint hashes a few samples of the file instead of the whole file,
+# so it stays cheap for multi-gigabyte videos.
+FINGERPRINT_SAMPLE_SIZE = 1 << 20
+FINGERPRINT_SAMPLES = 3
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def fingerprint_file(file_path):
+    """
+    Returns a fingerprint of a file's content that does not depend on its path or mtime.
+
+    The fingerprint covers the size of the file and samples from its beginning,
+    middle and end.
+
+    Parameters:
+    - file_path (str): Path to the file.
+
+    Returns:
+    - str: A hex digest.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha256(str(size).encode())
+
+    with open(file_path, 'rb') as file:
+        if size <= FINGERPRINT_SAMPLE_SIZE * FINGERPRINT_SAMPLES:
+            digest.update(file.read())
+        else:
+            step = (size - FINGERPRINT_SAMPLE_SIZE) // (FINGERPRINT_SAMPLES - 1)
+            for sample in range(FINGERPRINT_SAMPLES):
+                file.seek(sample * step)
+                digest.update(file.read(FINGERPRINT_SAMPLE_SIZE))
+
+    return digest.hexdigest()
+
+
+def hash_file(file_path):
+    """
+    Returns the SHA-256 of the whole content of a file.
+    Unlike fingerprint_file() two different files never share it.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _same_time(first, second):
+    return round(first, 6) == round(second, 6)
+
+
+class SegmentManifest:
+    """
+    An append-only record of the segments written into an output folder.
+
+    The first line holds the source fingerprint and the encoding parameters,
+    every next line describes one finished segment. A segment is only trusted
+    on a re-run if the source, the parameters, its cue timing and its size match.
+    """
+
+    def __init__(self, output_dir, source, parameters):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.header = {'source': source, 'parameters': parameters}
+        self.segments = {}
+
+        self._load()
+        self._rewrite()
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as file:
+            lines = iter(file)
+
+            try:
+                header = json.loads(next(lines, 'null'))
+            except json.JSONDecodeError:
+                header = None
+
+            if header != self.header:
+                logging.info(f'The source or the parameters changed, all segments in {self.path} are stale.')
+                return
+
+            for line in lines:
+                try:
+                    segment = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line that was cut off by a crash
+                    continue
+                self.segments[segment['file']] = segment
+
+    def _rewrite(self):
+        # Compacts the records of earlier runs and drops the stale ones
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(self.header) + '\n')
+            for segment in self.segments.values():
+                file.write(json.dumps(segment) + '\n')
+
+        os.replace(temp_path, self.path)
+
+    def is_fresh(self, segment_filename, start_time, end_time):
+        segment = self.segments.get(os.path.basename(segment_filename))
+        if segment is None:
+            return False
+
+        try:
+            size = os.path.getsize(segment_filename)
+        except OSError:
+            return False
+
+        return (size == segment['size']
+                and _same_time(segment['start'], start_time)
+                and _same_time(segment['end'], end_time))
+
+    def record(self, segment_filename, start_time, end_time):
+        segment = {
+            'file': os.path.basename(segment_filename),
+            'start': start_time,
+            'end': end_time,
+            'size': os.path.getsize(segment_filename),
+        }
+        self.segments[segment['file']] = segment
+
+        # One flushed line per segment, so a crash loses at most the segment in progress
+        self._file.write(json.dumps(segment) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
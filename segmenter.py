@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import math
+import bisect
+import logging
+import tempfile
+import subprocess
+from collections import namedtuple
+
+import numpy as np
+from moviepy.config import get_setting
+
+from parallel import ordered_map
+from segment_manifest import SegmentManifest, fingerprint_file, hash_file
+from tracing import span
+
+
+# The same binary moviepy uses, so FFMPEG_BINARY overrides keep working.
+FFMPEG_BINARY = get_setting('FFMPEG_BINARY')
+
+DEFAULT_FPS = 44100
+DEFAULT_CHANNELS = 2
+DEFAULT_CODEC = 'libmp3lame'
+SEGMENT_EXTENSION = 'mp3'
+
+# 16-bit signed little-endian PCM is what ffmpeg writes into the pipe.
+SAMPLE_FORMAT = 's16le'
+SAMPLE_DTYPE = np.int16
+
+# precise: decode and re-encode, the cuts are sample accurate.
+# copy: cut the original packets without decoding, the cuts land on packet boundaries.
+PRECISE_MODE = 'precise'
+COPY_MODE = 'copy'
+SPLIT_MODES = [PRECISE_MODE, COPY_MODE]
+
+# Audio codecs that can be stream copied and the extension of their container.
+COPY_EXTENSIONS = {
+    'aac': 'm4a',
+    'mp3': 'mp3',
+    'opus': 'opus',
+    'vorbis': 'ogg',
+}
+
+# memory: decode the whole track into one buffer.
+# stream: decode in fixed-size windows and drop the windows no cue needs anymore,
+#         so the memory depends on the longest cue and not on the length of the media.
+MEMORY_DECODE = 'memory'
+STREAM_DECODE = 'stream'
+DECODE_MODES = [MEMORY_DECODE, STREAM_DECODE]
+
+DECODE_WINDOW_SECONDS = 30
+
+AUDIO_STREAM_PATTERN = re.compile(r'Stream #\d+:\d+.*?: Audio: (\w+)')
+
+# The requested (not yet clamped or snapped) timing of one segment
+SegmentCut = namedtuple('SegmentCut', ['start_time', 'end_time', 'segment_filename'])
+
+
+class PcmBuffer:
+    """
+    Decoded audio kept in memory as a NumPy array of shape (frames, channels).
+    """
+
+    def __init__(self, samples, fps):
+        self.samples = samples
+        self.fps = fps
+
+    @property
+    def nchannels(self):
+        return self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.fps
+
+    def slice(self, start_time, end_time):
+        """
+        Returns the frames between start_time and end_time (in seconds).
+        The bounds are clamped to the buffer, and at least one frame is
+        returned so the encoder never gets an empty input.
+        """
+        total_frames = len(self.samples)
+        start_frame = min(max(int(round(start_time * self.fps)), 0), total_frames - 1)
+        end_frame = min(int(round(end_time * self.fps)), total_frames)
+        end_frame = max(end_frame, start_frame + 1)
+
+        return self.samples[start_frame:end_frame]
+
+
+def decode_command(path_to_media, fps, nchannels):
+    return [FFMPEG_BINARY, '-v', 'error',
+            '-i', path_to_media,
+            '-vn', '-map', '0:a:0',
+            '-f', SAMPLE_FORMAT, '-acodec', f'pcm_{SAMPLE_FORMAT}',
+            '-ar', str(fps), '-ac', str(nchannels),
+            '-']
+
+
+def decode_audio(path_to_media, fps=DEFAULT_FPS, nchannels=DEFAULT_CHANNELS):
+    """
+    Decodes the first audio track of a media file into memory with a single ffmpeg run.
+
+    Parameters:
+    - path_to_media (str): Path to an audio or a video file.
+    - fps (int): The sample rate of the decoded audio.
+    - nchannels (int): The amount of channels of the decoded audio.
+
+    Returns:
+    - PcmBuffer: The decoded audio.
+    """
+    command = decode_command(path_to_media, fps=fps, nchannels=nchannels)
+
+    with span('decode_audio', media=path_to_media) as current:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        current.set(bytes=len(result.stdout))
+
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to decode {path_to_media}: '
+                           f'{result.stderr.decode(errors="replace").strip()}')
+
+    samples = np.frombuffer(result.stdout, dtype=SAMPLE_DTYPE).reshape(-1, nchannels)
+    if len(samples) == 0:
+        raise RuntimeError(f'No audio was decoded from {path_to_media}')
+
+    return PcmBuffer(samples=samples, fps=fps)
+
+
+class PcmStream:
+    """
+    Decodes the first audio track through an ffmpeg pipe in fixed-size windows.
+
+    Only the frames between the last drop_before() and the end of the last slice()
+    are kept in memory. Slices have to be requested at or after the dropped position.
+    """
+
+    def __init__(self, path_to_media, fps=DEFAULT_FPS, nchannels=DEFAULT_CHANNELS,
+                 window_seconds=DECODE_WINDOW_SECONDS):
+        self.path_to_media = path_to_media
+        self.fps = fps
+        self.window_bytes = int(window_seconds * fps) * nchannels * SAMPLE_DTYPE().itemsize
+
+        self.samples = np.empty((0, nchannels), dtype=SAMPLE_DTYPE)
+        # The position of samples[0] in the whole track
+        self.offset = 0
+        self.finished = False
+
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(decode_command(path_to_media, fps=fps, nchannels=nchannels),
+                                         stdout=subprocess.PIPE, stderr=self._stderr)
+
+    # The length is only known when the whole track was read
+    @property
+    def duration(self):
+        if not self.finished:
+            return math.inf
+        return (self.offset + len(self.samples)) / self.fps
+
+    def _read_window(self):
+        with span('decode_window', offset=self.offset + len(self.samples)) as current:
+            data = self._process.stdout.read(self.window_bytes)
+            current.set(bytes=len(data))
+
+        if data:
+            window = np.frombuffer(data, dtype=SAMPLE_DTYPE).reshape(-1, self.samples.shape[1])
+            self.samples = np.concatenate([self.samples, window])
+
+        if len(data) < self.window_bytes:
+            self._finish()
+
+    def _finish(self):
+        self.finished = True
+
+        if self._process.wait() != 0:
+            self._stderr.seek(0)
+            raise RuntimeError(f'ffmpeg failed to decode {self.path_to_media}: '
+                               f'{self._stderr.read().decode(errors="replace").strip()}')
+
+        if self.offset + len(self.samples) == 0:
+            raise RuntimeError(f'No audio was decoded from {self.path_to_media}')
+
+    def drop_before(self, time):
+        """
+        Releases the frames before time (in seconds), they cannot be sliced anymore.
+        The last frame is always kept, it is what cues past the end are clamped to,
+        so a time past the end (math.inf after the last cue) drops everything else.
+        """
+        last_frame = self.offset + len(self.samples) - 1
+        if math.isfinite(time):
+            last_frame = min(int(time * self.fps), last_frame)
+
+        frames = last_frame - self.offset
+        if frames > 0:
+            # Copy, so the dropped part of the array can be freed
+            self.samples = self.samples[frames:].copy()
+            self.offset += frames
+
+    def slice(self, start_time, end_time):
+        """
+        Returns the frames between start_time and end_time (in seconds)
+        with the same clamping as PcmBuffer.slice.
+        """
+        end_frame = int(round(end_time * self.fps))
+        while not self.finished and self.offset + len(self.samples) < end_frame:
+            self._read_window()
+
+        total_frames = self.offset + len(self.samples)
+        start_frame = min(max(int(round(start_time * self.fps)), 0), total_frames - 1)
+        if start_frame < self.offset:
+            raise ValueError(f'The audio before {start_time}s was already dropped')
+
+        end_frame = max(min(end_frame, total_frames), start_frame + 1)
+
+        return self.samples[start_frame - self.offset:end_frame - self.offset]
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._process.stdout.close()
+        self._stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def partial_filename(segment_filename):
+    # Keeps the extension, ffmpeg picks the container by it
+    root, extension = os.path.splitext(segment_filename)
+    return f'{root}.part{extension}'
+
+
+def encode_segment(samples, fps, segment_filename, codec=DEFAULT_CODEC):
+    """
+    Encodes raw PCM frames into an audio file by piping them into ffmpeg.
+
+    Parameters:
+    - samples (numpy.ndarray): Frames of shape (frames, channels).
+    - fps (int): The sample rate of the frames.
+    - segment_filename (str): The output file.
+    - codec (str): The ffmpeg audio codec.
+
+    Returns:
+    - str: The output file.
+    """
+    command = [FFMPEG_BINARY, '-y', '-v', 'error',
+               '-f', SAMPLE_FORMAT, '-ar', str(fps), '-ac', str(samples.shape[1]),
+               '-i', '-',
+               '-acodec', codec,
+               partial_filename(segment_filename)]
+
+    result = subprocess.run(command, input=samples.tobytes(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to encode {segment_filename}: '
+                           f'{result.stderr.decode(errors="replace").strip()}')
+
+    # A new file is renamed into place, an existing segment may be hardlinked to the cache
+    os.replace(partial_filename(segment_filename), segment_filename)
+    return segment_filename
+
+
+def segment_times(subtitle, buffer_time):
+    """
+    Returns the (start, end) of the audio segment that belongs to a subtitle.
+    The end is clamped to the length of the audio when the segment is cut.
+    """
+    start_time = subtitle['start']
+    end_time = start_time + subtitle['duration'] + buffer_time
+
+    return start_time, end_time
+
+
+def segment_filename_for(output_dir, index, extension=SEGMENT_EXTENSION):
+    return os.path.join(output_dir, f'segment_{index+1:03d}.{extension}')
+
+
+def probe_audio_codec(path_to_media):
+    """
+    Returns the codec name of the first audio track, e.g. 'aac' or 'mp3'.
+    """
+    # Without an output ffmpeg only prints the stream info and exits with an error.
+    result = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-i', path_to_media],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    match = AUDIO_STREAM_PATTERN.search(result.stderr.decode(errors='replace'))
+    if match is None:
+        raise RuntimeError(f'No audio track was found in {path_to_media}')
+
+    return match.group(1)
+
+
+class PacketIndex:
+    """
+    Start times and durations (in seconds) of the audio packets of a media file.
+    """
+
+    def __init__(self, starts, durations):
+        self.starts = starts
+        self.ends = [start + duration for start, duration in zip(starts, durations)]
+
+    @property
+    def duration(self):
+        return self.ends[-1]
+
+    def snap(self, start_time, end_time):
+        """
+        Widens [start_time, end_time] to the nearest packet boundaries around it.
+
+        Returns:
+        - tuple: (start, end) that can be cut without decoding.
+        """
+        first = max(bisect.bisect_right(self.starts, start_time) - 1, 0)
+        last = min(bisect.bisect_left(self.ends, end_time), len(self.ends) - 1)
+        last = max(last, first)
+
+        return self.starts[first], self.ends[last]
+
+
+def read_packet_index(path_to_media):
+    """
+    Reads the packet timestamps of the first audio track.
+    The packets are only demuxed and checksummed, nothing is decoded.
+    """
+    command = [FFMPEG_BINARY, '-v', 'error',
+               '-copyts', '-i', path_to_media,
+               '-map', '0:a:0', '-c', 'copy',
+               '-f', 'framecrc', '-']
+
+    with span('read_packet_index', media=path_to_media):
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to read packets of {path_to_media}: '
+                           f'{result.stderr.decode(errors="replace").strip()}')
+
+    time_base = None
+    starts = []
+    durations = []
+
+    for line in result.stdout.decode().splitlines():
+        # The header looks like "#tb 0: 1/44100"
+        if line.startswith('#tb'):
+            numerator, denominator = line.split(':', 1)[1].strip().split('/')
+            time_base = int(numerator) / int(denominator)
+            continue
+
+        if not line or line.startswith('#'):
+            continue
+
+        # stream_index, dts, pts, duration, size, crc
+        _, dts, pts, duration, *_ = [field.strip() for field in line.split(',')]
+        timestamp = pts if pts != 'N/A' else dts
+        starts.append(int(timestamp) * time_base)
+        durations.append(int(duration) * time_base)
+
+    if not starts:
+        raise RuntimeError(f'No audio packets were found in {path_to_media}')
+
+    # -ss is relative to the start of the file, so are the snapped cuts.
+    first_start = starts[0]
+    starts = [start - first_start for start in starts]
+
+    order = sorted(range(len(starts)), key=starts.__getitem__)
+    return PacketIndex(starts=[starts[i] for i in order],
+                       durations=[durations[i] for i in order])
+
+
+def copy_segment(path_to_media, start_time, end_time, segment_filename):
+    """
+    Cuts [start_time, end_time] of the first audio track by copying its packets.
+    """
+    command = [FFMPEG_BINARY, '-y', '-v', 'error',
+               '-ss', f'{start_time:.6f}', '-i', path_to_media,
+               '-t', f'{end_time - start_time:.6f}',
+               '-map', '0:a:0', '-c', 'copy',
+               partial_filename(segment_filename)]
+
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to cut {segment_filename}: '
+                           f'{result.stderr.decode(errors="replace").strip()}')
+
+    os.replace(partial_filename(segment_filename), segment_filename)
+    return segment_filename
+
+
+def _encode_jobs(pcm, cuts):
+    # Slices are produced lazily, so only the in-flight ones are copied to the workers.
+    for cut in cuts:
+        yield pcm.slice(cut.start_time, cut.end_time), pcm.fps, cut.segment_filename
+
+
+def _streamed_encode_jobs(pcm, cuts):
+    # The earliest start among the remaining cuts, everything before it can be dropped.
+    # Cues in time order keep just one cue worth of audio, unordered ones keep more.
+    earliest_starts = [math.inf] * (len(cuts) + 1)
+    for index in range(len(cuts) - 1, -1, -1):
+        earliest_starts[index] = min(earliest_starts[index + 1], cuts[index].start_time)
+
+    for index, job in enumerate(_encode_jobs(pcm, cuts)):
+        yield job
+        pcm.drop_before(earliest_starts[index + 1])
+
+
+def _segment_span_args(segment_filename):
+    return {'segment': os.path.basename(segment_filename),
+            'bytes': os.path.getsize(segment_filename)}
+
+
+def _encode_segments(path_to_media, cuts, workers, decode=MEMORY_DECODE):
+    if decode == STREAM_DECODE:
+        with PcmStream(path_to_media) as pcm:
+            yield from ordered_map(encode_segment, _streamed_encode_jobs(pcm, cuts),
+                                   workers=workers, trace_name='encode_segment',
+                                   trace_args=_segment_span_args)
+        return
+
+    pcm = decode_audio(path_to_media)
+    yield from ordered_map(encode_segment, _encode_jobs(pcm, cuts), workers=workers,
+                           trace_name='encode_segment', trace_args=_segment_span_args)
+
+
+def copy_extension(path_to_media):
+    """
+    Returns the extension of the segments that the copy mode cuts from a media file.
+    """
+    codec = probe_audio_codec(path_to_media)
+    if codec not in COPY_EXTENSIONS:
+        raise ValueError(f'The audio codec {codec} of {path_to_media} cannot be stream copied, '
+                         f'supported codecs: {", ".join(COPY_EXTENSIONS)}')
+
+    return COPY_EXTENSIONS[codec]
+
+
+def _copy_segments(path_to_media, cuts, workers, decode=MEMORY_DECODE):
+    packets = read_packet_index(path_to_media)
+    snapped_cuts = [packets.snap(cut.start_time, cut.end_time) for cut in cuts]
+
+    copy_jobs = ((path_to_media, cut_start, cut_end, cut.segment_filename)
+                 for cut, (cut_start, cut_end) in zip(cuts, snapped_cuts))
+
+    largest_offset = 0.0
+    for cut, (cut_start, cut_end), segment_filename in zip(
+            cuts, snapped_cuts, ordered_map(copy_segment, copy_jobs, workers=workers,
+                                                trace_name='copy_segment',
+                                                trace_args=_segment_span_args)):
+
+        start_offset = cut_start - cut.start_time
+        end_offset = cut_end - min(cut.end_time, packets.duration)
+        largest_offset = max(largest_offset, abs(start_offset), abs(end_offset))
+
+        logging.info(f'Cut {segment_filename} at packet boundaries: '
+                     f'start {start_offset * 1000:+.1f} ms, end {end_offset * 1000:+.1f} ms '
+                     f'from the requested cue.')
+
+        yield segment_filename
+
+    logging.info(f'The largest cut offset was {largest_offset * 1000:.1f} ms.')
+
+
+def split_media(path_to_media, subtitles, output_dir, buffer_time=0.33, workers=1,
+                mode=PRECISE_MODE, decode=MEMORY_DECODE, resume=True, cache=None):
+    """
+    Cuts a segment for every subtitle out of the first audio track of a media file.
+
+    In the precise mode the media is decoded once and every segment is encoded from
+    the decoded buffer. In the copy mode the packets are copied without decoding,
+    so every cut is widened to the nearest packet boundaries.
+
+    With resume the finished segments are recorded in a manifest inside output_dir.
+    A re-run only cuts the segments that are missing or do not match the source,
+    the parameters or the cue timing anymore, and skips decoding when nothing is left.
+
+    With a cache the segments are first looked up in the shared SegmentCache and linked
+    into output_dir, only the segments missing from it are cut and then stored in it.
+
+    Parameters:
+    - path_to_media (str): Path to an audio or a video file.
+    - subtitles (list): Subtitles with 'start', 'duration' and 'text'.
+    - output_dir (str): The folder for the segments.
+    - buffer_time (float): Extra seconds added to the end of every segment.
+    - workers (int): The amount of processes that encode segments.
+    - mode (str): One of SPLIT_MODES.
+    - decode (str): One of DECODE_MODES, how the precise mode keeps the decoded audio.
+    - resume (bool): Reuse the segments of an earlier run.
+    - cache (SegmentCache): A segment cache shared between courses, or None.
+
+    Yields:
+    - tuple: (index, subtitle, segment_filename) in the order of the subtitles.
+    """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f'Unknown split mode: {mode}')
+    if decode not in DECODE_MODES:
+        raise ValueError(f'Unknown decode mode: {decode}')
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    extension = copy_extension(path_to_media) if mode == COPY_MODE else SEGMENT_EXTENSION
+
+    cuts = []
+    for index, subtitle in enumerate(subtitles):
+        start_time, end_time = segment_times(subtitle, buffer_time=buffer_time)
+        cuts.append(SegmentCut(start_time=start_time, end_time=end_time,
+                               segment_filename=segment_filename_for(output_dir, index,
+                                                                     extension=extension)))
+
+    parameters = {
+        'mode': mode,
+        'codec': DEFAULT_CODEC if mode == PRECISE_MODE else 'copy',
+        'fps': DEFAULT_FPS,
+        'nchannels': DEFAULT_CHANNELS,
+    }
+
+    manifest = None
+    if resume:
+        manifest = SegmentManifest(output_dir, source=fingerprint_file(path_to_media),
+                                   parameters=parameters)
+
+    # The cache is shared by all courses, a sampled fingerprint could hand out another video's audio
+    content = hash_file(path_to_media) if cache is not None else None
+
+    def cache_key(cut):
+        return cache.key(content, cut.start_time, cut.end_time, buffer_time, parameters)
+
+    try:
+        stale_cuts = [cut for cut in cuts
+                      if manifest is None or not manifest.is_fresh(cut.segment_filename,
+                                                                   cut.start_time, cut.end_time)]
+        if manifest is not None and len(stale_cuts) < len(cuts):
+            logging.info(f'Reusing {len(cuts) - len(stale_cuts)} of {len(cuts)} segments in {output_dir}.')
+
+        # Linking from the cache is cheap, so it is done before anything is decoded
+        missing_cuts = stale_cuts
+        if cache is not None:
+            missing_cuts = [cut for cut in stale_cuts
+                            if not cache.fetch(cache_key(cut), cut.segment_filename)]
+            logging.info(f'Linked {len(stale_cuts) - len(missing_cuts)} segments from the cache.')
+
+        # Nothing is decoded when every segment is fresh or cached
+        segment_filenames = iter(())
+        if missing_cuts:
+            cut_segments = _copy_segments if mode == COPY_MODE else _encode_segments
+            segment_filenames = cut_segments(path_to_media=path_to_media, cuts=missing_cuts,
+                                             workers=workers, decode=decode)
+
+        stale_filenames = {cut.segment_filename for cut in stale_cuts}
+        missing_filenames = {cut.segment_filename for cut in missing_cuts}
+
+        for (index, subtitle), cut in zip(enumerate(subtitles), cuts):
+            if cut.segment_filename in missing_filenames:
+                next(segment_filenames)
+                if cache is not None:
+                    cache.store(cache_key(cut), cut.segment_filename)
+
+            if manifest is not None and cut.segment_filename in stale_filenames:
+                manifest.record(cut.segment_filename, cut.start_time, cut.end_time)
+
+            yield index, subtitle, cut.segment_filename
+
+        # Every segment was taken, this only runs what the generator does after its loop
+        for _ in segment_filenames:
+            pass
+
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    if cache is not None:
+        cache.evict()
@@ -1,39 +1,34 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import logging
 import argparse
-import pysrt
-from googletrans import Translator
 
-from moviepy.editor import AudioFileClip
+from segmenter import (split_media, SPLIT_MODES, PRECISE_MODE,
+                       DECODE_MODES, MEMORY_DECODE)
+from segment_cache import add_cache_arguments, cache_from_arguments
+from tracing import enable_tracing, save_trace
+from subtitles import Cue, iter_cues, load_cues, write_json
+from translation import (BACKENDS, TranslationMemory, translate_texts,
+                         add_translation_arguments)
 
 
 def srt_to_json(srt_file_path):
+    """
+    Converts SRT or VTT subtitles into the YouTube transcript JSON next to them.
+    The split functions read the subtitle files directly, this is only for other tools.
+    """
     # Replace the .srt extension with .json
     json_file_path = os.path.splitext(srt_file_path)[0] + '.json'
-    
-    subs = pysrt.open(srt_file_path)
-    subs_data = []
-
-    for sub in subs:
-        # Convert start and end times to seconds
-        start_seconds = sub.start.hours * 3600 + sub.start.minutes * 60 + sub.start.seconds + sub.start.milliseconds / 1000
-        end_seconds = sub.end.hours * 3600 + sub.end.minutes * 60 + sub.end.seconds + sub.end.milliseconds / 1000
-
-        # Calculate duration
-        duration = end_seconds - start_seconds
-        
-        sub_data = {
-            "start": round(start_seconds, 2),
-            "duration": round(duration, 2),
-            "text": sub.text
-        }
-        subs_data.append(sub_data)
-
-    with open(json_file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(subs_data, json_file, ensure_ascii=False, indent=4)
+
+    # The output is opened before the cues are read, it must not be the input
+    if os.path.abspath(json_file_path) == os.path.abspath(srt_file_path):
+        raise ValueError(f'{srt_file_path} is JSON already')
+
+    # Times rounded to centiseconds, as the converter always wrote them
+    cues = (Cue(round(cue.start, 2), round(cue.duration, 2), cue.text)
+            for cue in iter_cues(srt_file_path))
+    write_json(cues, json_file_path)
 
     logging.info(f"Converted {srt_file_path} to {json_file_path}")
 
@@ -41,69 +36,48 @@ def srt_to_json(srt_file_path):
 
 
 # TODO: Move the next function into more logical place
-def translate_subtitles(json_file_path, source_lang='auto', dest_lang='en'):
+def translate_subtitles(path_to_subtitles, source_lang='auto', dest_lang='en',
+                        backend=None, memory=None):
     # Create the path for the translated file
-    base, ext = os.path.splitext(json_file_path)
-    translated_file_path = f"{base}_en{ext}"
-    
-    # Initialize the translator
-    translator = Translator()
-    
-    # Read the original subtitles from the JSON file
-    with open(json_file_path, 'r', encoding='utf-8') as json_file:
-        subs_data = json.load(json_file)
-    
-    # Translate each subtitle
-    for sub in subs_data:
-        translated_text = translator.translate(sub["text"], src=source_lang, dest=dest_lang).text
-        sub["text"] = translated_text
-    
-    # Save the translated subtitles to a new JSON file
-    with open(translated_file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(subs_data, json_file, ensure_ascii=False, indent=4)
-    
-    logging.info(f"Translated subtitles saved to: {translated_file_path}")
-    return translated_file_path
+    base, _ = os.path.splitext(path_to_subtitles)
+    translated_file_path = f"{base}_en.json"
 
+    # Read the original subtitles (SRT, VTT or JSON)
+    cues = load_cues(path_to_subtitles)
 
-def split_audio(path_to_mp3, path_to_subtitles, output_dir, buffer_time=0.33):
-    # Make sure that output_dir exists
-    os.makedirs(output_dir, exist_ok=True)
+    # Repeated lines and lines known from earlier runs are not sent again, see translation.py
+    translated_texts = translate_texts([cue.text for cue in cues],
+                                       source_lang=source_lang, dest_lang=dest_lang,
+                                       backend=backend, memory=memory)
+    for cue, translated_text in zip(cues, translated_texts):
+        cue.text = translated_text
 
-    # Load subtitles
-    with open(path_to_subtitles, 'r') as file:
-        subtitles = json.load(file)
+    # Save the translated subtitles to a new JSON file
+    write_json(cues, translated_file_path)
 
-    # Load the audio file
-    audio_clip = AudioFileClip(path_to_mp3)
-    duration = audio_clip.duration
+    logging.info(f"Translated subtitles saved to: {translated_file_path}")
+    return translated_file_path
 
-    # Process each subtitle entry
-    for index, subtitle in enumerate(subtitles):
-        # Calculate the end time of the clip
-        start_time = subtitle['start']
-        end_time = start_time + subtitle['duration'] + buffer_time
-        # Make sure that we use proper timing
-        if end_time > duration:
-            end_time = duration
 
-        # Extract the specific audio segment
-        audio_segment = audio_clip.subclip(start_time, end_time)
-        
-        # Define the output filename for the segment
-        segment_filename = os.path.join(output_dir, f'segment_{index+1:03d}.mp3')
+def load_subtitles(path_to_subtitles):
+    """
+    Loads SRT, VTT or YouTube transcript JSON subtitles as a list of Cue records.
+    """
+    return load_cues(path_to_subtitles)
 
-        # Write the audio segment to a file
-        audio_segment.write_audiofile(segment_filename, logger=None)  # logger=None to suppress the progress bar
 
-        yield index, subtitle, segment_filename
+def split_audio(path_to_mp3, path_to_subtitles, output_dir, buffer_time=0.33, workers=1,
+                mode=PRECISE_MODE, decode=MEMORY_DECODE, cache=None):
+    # Load subtitles
+    subtitles = load_subtitles(path_to_subtitles=path_to_subtitles)
 
-    # Close the original audio clip to release resources
-    # TODO: Add with statement for audio_clip.
-    audio_clip.close()
+    # The audio is decoded once and every segment is cut from the decoded buffer
+    yield from split_media(path_to_media=path_to_mp3, subtitles=subtitles,
+                           output_dir=output_dir, buffer_time=buffer_time,
+                           workers=workers, mode=mode, decode=decode,
+                           cache=cache)
 
 
-# NOTE: The script was temporary remade to work with srt files
 def main():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -116,7 +90,7 @@ def main():
                         help='Path to the audio file.',
                         required=True)
     parser.add_argument('-s', '--subtitles',
-                        help='Path to the subtitles file.',
+                        help='Path to the subtitles file (SRT, VTT or JSON).',
                         required=True)
     parser.add_argument('-p', '--path',
                         help='The output path.',
@@ -124,20 +98,43 @@ def main():
     parser.add_argument('-l', '--lang',
                         help='The original lang of the subs.',
                         required=True)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The amount of processes that encode segments.')
+    parser.add_argument('-m', '--mode', choices=SPLIT_MODES, default=PRECISE_MODE,
+                        help='precise re-encodes every segment, copy cuts the original '
+                             'audio packets without re-encoding (much faster, the cuts '
+                             'land on packet boundaries).')
+    parser.add_argument('--decode', choices=DECODE_MODES, default=MEMORY_DECODE,
+                        help='memory decodes the whole audio track at once, stream decodes '
+                             'it in windows to keep the memory flat for long sources.')
+    add_cache_arguments(parser)
+    add_translation_arguments(parser)
+    parser.add_argument('--trace', help='Save a Chrome trace (JSON) of the split stages to this file.')
 
     # Parse the arguments
     args = parser.parse_args()
 
+    if args.trace is not None:
+        enable_tracing()
+
     # Make sure that the folder exists
     os.makedirs(args.path, exist_ok=True)
 
-    json_subtitles = srt_to_json(srt_file_path=args.subtitles)
-    translate_subtitles(json_file_path=json_subtitles, source_lang='cs')
-
-    for index, subtitle, segment_filename in split_audio(path_to_mp3=args.audio,
-                                                         path_to_subtitles=json_subtitles,
-                                                         output_dir=args.path):
-        pass
+    with TranslationMemory(args.translation_memory) as memory:
+        translate_subtitles(path_to_subtitles=args.subtitles, source_lang=args.lang,
+                            backend=BACKENDS[args.translation_backend](), memory=memory)
+
+    try:
+        for index, subtitle, segment_filename in split_audio(path_to_mp3=args.audio,
+                                                             path_to_subtitles=args.subtitles,
+                                                             output_dir=args.path,
+                                                             workers=args.workers,
+                                                             mode=args.mode,
+                                                             decode=args.decode,
+                                                             cache=cache_from_arguments(args)):
+            pass
+    finally:
+        save_trace(args.trace)
 
 
 if __name__ == "__main__":
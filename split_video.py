@@ -2,30 +2,12 @@
 import os
 import logging
 import argparse
-from contextlib import contextmanager
 
-from pydub import AudioSegment
-
-from split_audio import split_audio
-
-
-MP3_EXTENSION = 'mp3'
-
-
-@contextmanager
-def ensure_file_removal(file_path):
-    try:
-        yield  # Perform file operations in the with block
-    finally:
-        # Cleanup action: Attempt to remove the file
-        try:
-            os.remove(file_path)
-            logging.info(f"File successfully removed: {file_path}")
-
-        except FileNotFoundError:
-            logging.warning(f"File was already removed or does not exist: {file_path}")
-        except Exception as e:
-            logging.error(f"An error occurred while trying to remove the file: {e}")
+from segmenter import (split_media, SPLIT_MODES, PRECISE_MODE,
+                       DECODE_MODES, MEMORY_DECODE)
+from segment_cache import add_cache_arguments, cache_from_arguments
+from tracing import enable_tracing, save_trace
+from split_audio import load_subtitles
 
 
 def remove_file_extension(filename):
@@ -44,23 +26,31 @@ def remove_file_extension(filename):
     return root
 
 
-def split_video(path_to_video, path_to_subtitles, output_dir):
-    mp3_file = f'{remove_file_extension(path_to_video)}.{MP3_EXTENSION}'
-
-    with ensure_file_removal(file_path=mp3_file):
-        audio = AudioSegment.from_file(path_to_video)
-        audio.export(mp3_file, format=MP3_EXTENSION)
+def split_video(path_to_video, path_to_subtitles, output_dir, workers=1,
+                mode=PRECISE_MODE, decode=MEMORY_DECODE, cache=None):
+    subtitles = load_subtitles(path_to_subtitles=path_to_subtitles)
 
-        for index, subtitle, segment_filename in split_audio(path_to_mp3=mp3_file,
-                                                             path_to_subtitles=path_to_subtitles,
-                                                             output_dir=output_dir):
-            yield index, subtitle, segment_filename
+    # The audio track is decoded straight from the video,
+    # there is no intermediate mp3 to encode and decode again.
+    for index, subtitle, segment_filename in split_media(path_to_media=path_to_video,
+                                                         subtitles=subtitles,
+                                                         output_dir=output_dir,
+                                                         workers=workers,
+                                                         mode=mode,
+                                                         decode=decode,
+                                                         cache=cache):
+        yield index, subtitle, segment_filename
 
 
-def split_video_without_generator(path_to_video, path_to_subtitles, output_dir):
+def split_video_without_generator(path_to_video, path_to_subtitles, output_dir, workers=1,
+                                  mode=PRECISE_MODE, decode=MEMORY_DECODE, cache=None):
     for index, subtitle, segment_filename in split_video(path_to_video=path_to_video,
                                                          path_to_subtitles=path_to_subtitles,
-                                                         output_dir=output_dir):
+                                                         output_dir=output_dir,
+                                                         workers=workers,
+                                                         mode=mode,
+                                                         decode=decode,
+                                                         cache=cache):
         logging.info(f'The next chunk was processed: index = {index}, '
                      f'subtitle={subtitle}, segment={segment_filename}.')
 
@@ -71,17 +61,35 @@ def main():
     parser = argparse.ArgumentParser(description='Split a video into chunks')
 
     parser.add_argument('-v', '--video', help='Path to the video file.', required=True)
-    parser.add_argument('-s', '--subtitles', help='Path to the subtitles file.', required=True)
+    parser.add_argument('-s', '--subtitles', help='Path to the subtitles file (SRT, VTT or JSON).', required=True)
     parser.add_argument('-p', '--path', help='The output path.', required=True)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='The amount of processes that encode segments.')
+    parser.add_argument('-m', '--mode', choices=SPLIT_MODES, default=PRECISE_MODE,
+                        help='precise re-encodes every segment, copy cuts the original '
+                             'audio packets without re-encoding (much faster, the cuts '
+                             'land on packet boundaries).')
+    parser.add_argument('--decode', choices=DECODE_MODES, default=MEMORY_DECODE,
+                        help='memory decodes the whole audio track at once, stream decodes '
+                             'it in windows to keep the memory flat for long sources.')
+    add_cache_arguments(parser)
+    parser.add_argument('--trace', help='Save a Chrome trace (JSON) of the split stages to this file.')
 
     # Parse the arguments
     args = parser.parse_args()
 
+    if args.trace is not None:
+        enable_tracing()
+
     # Make sure that the folder exists
     os.makedirs(args.path, exist_ok=True)
 
-    split_video_without_generator(path_to_video=args.video, path_to_subtitles=args.subtitles,
-                output_dir=args.path)
+    try:
+        split_video_without_generator(path_to_video=args.video, path_to_subtitles=args.subtitles,
+                    output_dir=args.path, workers=args.workers, mode=args.mode,
+                    decode=args.decode, cache=cache_from_arguments(args))
+    finally:
+        save_trace(args.trace)
 
 
 if __name__ == "__main__":
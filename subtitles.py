@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import logging
+import argparse
+
+import numpy as np
+
+
+SRT_FORMAT = 'srt'
+VTT_FORMAT = 'vtt'
+JSON_FORMAT = 'json'
+SUBTITLE_FORMATS = (SRT_FORMAT, VTT_FORMAT, JSON_FORMAT)
+
+# 00:01:02,500 --> 00:01:04,000 (SRT) or 01:02.500 --> 01:04.000 line:90% (VTT, hours optional)
+TIMING_PATTERN = re.compile(
+    r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})')
+
+# VTT markup: <c.yellow>, <i>, <00:00:01.000> karaoke timestamps, ...
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+# VTT blocks that are not cues
+VTT_SKIPPED_BLOCKS = ('NOTE', 'STYLE', 'REGION')
+
+
+class Cue:
+    """
+    One subtitle: a compact record that also reads like the YouTube transcript dicts,
+    cue['start'], cue['duration'] and cue['text'] work as before.
+
+    Cues are mutable (translated in place), so they compare by identity,
+    compare to_dict() for their values.
+    """
+
+    __slots__ = ('start', 'duration', 'text')
+
+    def __init__(self, start, duration, text):
+        self.start = start
+        self.duration = duration
+        self.text = text
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.keys() else default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    @staticmethod
+    def keys():
+        return ('start', 'duration', 'text')
+
+    def to_dict(self):
+        return {'start': self.start, 'duration': self.duration, 'text': self.text}
+
+    def __repr__(self):
+        return f'Cue(start={self.start}, duration={self.duration}, text={self.text!r})'
+
+
+def _seconds(hours, minutes, seconds, fraction):
+    # '5' after the comma means 500 ms, not 5 ms
+    return (int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+            + int(fraction) / 10 ** len(fraction))
+
+
+def _iter_text_cues(lines, strip_tags=False):
+    """
+    Parses the blocks of SRT and VTT files line by line, the file is never loaded at once.
+    A block is optional id lines, a timing line and the text up to an empty line.
+    """
+    timing = None
+    text_lines = []
+    skipping = False
+
+    for line in lines:
+        line = line.strip()
+
+        if not line:
+            if timing is not None:
+                yield Cue(timing[0], round(timing[1] - timing[0], 3), '\n'.join(text_lines))
+            timing = None
+            text_lines = []
+            skipping = False
+            continue
+
+        if skipping:
+            continue
+
+        if timing is None:
+            match = TIMING_PATTERN.search(line)
+            if match is not None:
+                groups = match.groups()
+                timing = (_seconds(*groups[:4]), _seconds(*groups[4:]))
+            elif strip_tags and line.startswith(VTT_SKIPPED_BLOCKS):
+                skipping = True
+            # Otherwise an index (SRT), an id or the header (VTT)
+            continue
+
+        text_lines.append(TAG_PATTERN.sub('', line) if strip_tags else line)
+
+    if timing is not None:
+        yield Cue(timing[0], round(timing[1] - timing[0], 3), '\n'.join(text_lines))
+
+
+def _json_cue(item):
+    if 'duration' in item:
+        duration = item['duration']
+    else:
+        duration = item['end'] - item['start']
+    return Cue(item['start'], duration, item['text'])
+
+
+def _iter_json_cues(file):
+    """
+    Streams the one-cue-per-line layout write_json() produces line by line.
+    Any other layout (e.g. the single line of the YouTube transcript API)
+    is parsed as a whole with json.load, which parses in C.
+    """
+    streamed = 0
+
+    if file.readline().strip() == '[':
+        for line in file:
+            line = line.strip().rstrip(',')
+            if line == ']':
+                return
+
+            try:
+                item = json.loads(line)
+                cue = _json_cue(item)
+            except (ValueError, TypeError, KeyError):
+                # Not the compact layout, e.g. indented JSON
+                break
+
+            yield cue
+            streamed += 1
+
+    # The cues streamed so far are the first ones of the full parse
+    file.seek(0)
+    for item in json.load(file)[streamed:]:
+        yield _json_cue(item)
+
+
+def detect_format(path_to_subtitles):
+    """
+    Returns the format of a subtitle file by its extension or, failing that, by its first bytes.
+    """
+    extension = os.path.splitext(path_to_subtitles)[1][1:].lower()
+    if extension in SUBTITLE_FORMATS:
+        return extension
+
+    with open(path_to_subtitles, 'r', encoding='utf-8-sig') as file:
+        head = file.read(64).lstrip()
+
+    if head.startswith(('[', '{')):
+        return JSON_FORMAT
+    if head.startswith('WEBVTT'):
+        return VTT_FORMAT
+    return SRT_FORMAT
+
+
+def iter_cues(path_to_subtitles, subtitle_format=None):
+    """
+    Yields the cues of an SRT, WebVTT or YouTube transcript JSON file one by one.
+
+    Parameters:
+    - path_to_subtitles (str): The subtitle file.
+    - subtitle_format (str): One of SUBTITLE_FORMATS, detected when None.
+
+    Yields:
+    - Cue: The cues in the order of the file.
+    """
+    subtitle_format = subtitle_format or detect_format(path_to_subtitles)
+
+    # utf-8-sig drops the byte order mark many subtitle editors write
+    with open(path_to_subtitles, 'r', encoding='utf-8-sig') as file:
+        if subtitle_format == JSON_FORMAT:
+            yield from _iter_json_cues(file)
+        else:
+            yield from _iter_text_cues(file, strip_tags=subtitle_format == VTT_FORMAT)
+
+
+def load_cues(path_to_subtitles, subtitle_format=None):
+    return list(iter_cues(path_to_subtitles, subtitle_format=subtitle_format))
+
+
+def cue_timings(cues):
+    """
+    Returns the starts and the ends of cues as two float64 NumPy arrays.
+    """
+    starts = np.fromiter((cue.start for cue in cues), dtype=np.float64, count=len(cues))
+    durations = np.fromiter((cue.duration for cue in cues), dtype=np.float64, count=len(cues))
+
+    return starts, starts + durations
+
+
+def write_json(cues, json_file_path):
+    """
+    Writes cues as YouTube transcript JSON, one compact line per cue.
+    """
+    with open(json_file_path, 'w', encoding='utf-8') as json_file:
+        json_file.write('[')
+        for index, cue in enumerate(cues):
+            json_file.write(',\n' if index else '\n')
+            json_file.write(json.dumps(cue.to_dict(), ensure_ascii=False))
+        json_file.write('\n]\n')
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Convert SRT/VTT subtitles to YouTube transcript JSON')
+
+    parser.add_argument('-s', '--subtitles', help='Path to the subtitles file.', required=True)
+    parser.add_argument('-o', '--output', help='Path to the JSON file.', required=True)
+    parser.add_argument('-f', '--format', choices=SUBTITLE_FORMATS,
+                        help='The format of the subtitles, detected by default.')
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    cues = load_cues(args.subtitles, subtitle_format=args.format)
+    write_json(cues, args.output)
+
+    logging.info(f'Converted {len(cues)} cues from {args.subtitles} to {args.output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from align_subtitles import align_subtitles
+
+
+def cue(start, duration, text):
+    return {'start': start, 'duration': duration, 'text': text}
+
+
+class AlignSubtitlesTest(unittest.TestCase):
+
+    def test_overlapping_cues(self):
+        source = [cue(0, 2, 'a'), cue(2, 2, 'b')]
+        target = [cue(0.1, 1, 'A1'), cue(1.1, 0.8, 'A2'), cue(2.1, 1.5, 'B')]
+
+        self.assertEqual(align_subtitles(source, target), ['A1 A2', 'B'])
+
+    def test_touching_cues_do_not_overlap(self):
+        source = [cue(0, 2, 'a'), cue(2, 2, 'b')]
+        target = [cue(0, 2, 'A'), cue(2, 2, 'B')]
+
+        self.assertEqual(align_subtitles(source, target), ['A', 'B'])
+
+    def test_zero_length_cues(self):
+        source = [cue(1, 0, 'a'), cue(2, 2, 'b')]
+        target = [cue(1, 0, 'A'), cue(2, 2, 'B'), cue(3, 0, 'C')]
+
+        self.assertEqual(align_subtitles(source, target), ['A', 'B C'])
+
+    def test_negative_duration(self):
+        # Clamped to a zero-length cue
+        source = [cue(1, -0.5, 'a'), cue(2, 2, 'b')]
+        target = [cue(1, 0.2, 'A'), cue(2, 2, 'B')]
+
+        self.assertEqual(align_subtitles(source, target), ['A', 'B'])
+
+
+if __name__ == "__main__":
+    unittest.main()
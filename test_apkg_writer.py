@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+import unittest
+
+import genanki
+
+from apkg_writer import ApkgWriter
+
+
+MODEL = genanki.Model(
+    1607392319, 'Test model',
+    fields=[{'name': 'Front'}, {'name': 'Back'}, {'name': 'Audio'}],
+    templates=[{'name': 'Card 1', 'qfmt': '{{Front}}<br>{{Audio}}',
+                'afmt': '{{FrontSide}}<hr id="answer">{{Back}}'}])
+
+
+def read_package(path):
+    """
+    Returns what a package holds, without the ids and times that differ between writes.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        with zipfile.ZipFile(path) as package:
+            package.extract('collection.anki2', directory)
+            media = json.loads(package.read('media'))
+            media_contents = {name: package.read(index) for index, name in media.items()}
+
+        connection = sqlite3.connect(os.path.join(directory, 'collection.anki2'))
+        notes = sorted(connection.execute('SELECT guid, mid, tags, flds, sfld, csum FROM notes'))
+        cards = sorted(connection.execute('SELECT notes.guid, cards.did, cards.ord, cards.type, cards.queue '
+                                          'FROM cards JOIN notes ON notes.id = cards.nid'))
+        decks = json.loads(connection.execute('SELECT decks FROM col').fetchone()[0])
+        models = json.loads(connection.execute('SELECT models FROM col').fetchone()[0])
+        connection.close()
+    finally:
+        shutil.rmtree(directory)
+
+    return {
+        'notes': notes,
+        'cards': cards,
+        'decks': sorted((deck['id'], deck['name']) for deck in decks.values()),
+        'models': sorted((model['id'], model['name']) for model in models.values()),
+        'media': media_contents,
+    }
+
+
+class ApkgWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.media = {}
+        for name, content in [('a.mp3', b'first audio'), ('b.ogg', b'second audio'), ('c.txt', b'text' * 100)]:
+            self.media[name] = os.path.join(self.directory, name)
+            with open(self.media[name], 'wb') as file:
+                file.write(content)
+
+        self.notes = [(deck_index, [f'Front {index}', f'Back {index}', f'[sound:{name}]'])
+                      for index, (deck_index, name) in enumerate([(0, 'a.mp3'), (1, 'b.ogg'),
+                                                                  (1, 'c.txt'), (0, 'a.mp3')])]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_decks(self):
+        decks = [genanki.Deck(2059400110, 'Course'), genanki.Deck(2059400111, 'Course::Lesson')]
+        for deck in decks:
+            deck.add_model(MODEL)
+        return decks
+
+    def make_note(self, index, fields):
+        return genanki.Note(model=MODEL, fields=fields, guid=genanki.guid_for('note', index))
+
+    def test_same_package_as_genanki(self):
+        decks = self.make_decks()
+        for index, (deck_index, fields) in enumerate(self.notes):
+            decks[deck_index].add_note(self.make_note(index, fields))
+        genanki_path = os.path.join(self.directory, 'genanki.apkg')
+        genanki.Package(decks, media_files=list(self.media.values())).write_to_file(genanki_path)
+
+        decks = self.make_decks()
+        writer_path = os.path.join(self.directory, 'writer.apkg')
+        with ApkgWriter(writer_path, decks=decks, note_batch=2) as writer:
+            for index, (deck_index, fields) in enumerate(self.notes):
+                writer.add_note(self.make_note(index, fields), deck_id=decks[deck_index].deck_id)
+            for name, path in self.media.items():
+                writer.add_media(name, path)
+
+        self.assertEqual(read_package(writer_path), read_package(genanki_path))
+
+    def test_failed_write_leaves_no_files(self):
+        output_path = os.path.join(self.directory, 'failed.apkg')
+
+        with self.assertRaises(RuntimeError):
+            with ApkgWriter(output_path, decks=self.make_decks()) as writer:
+                writer.add_note(self.make_note(0, self.notes[0][1]))
+                raise RuntimeError('failed')
+
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(self.media))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+import http.server
+import urllib.request
+
+from chunked_download import download_file, RangesNotSupportedError, _staging_lock
+from download_from_youtube import download_youtube_video
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the bytes of the server in ranges, or whole when the server has no ranges.
+    The first request for a start in server.truncated gets only half of its range.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.data
+        match = re.match(r'bytes=(\d+)-(\d+)$', self.headers.get('Range', ''))
+
+        if match is None or not self.server.ranges:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        start, end = int(match.group(1)), int(match.group(2))
+        self.server.requested.append((start, end))
+        body = data[start:end + 1]
+
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if start in self.server.truncated:
+            self.server.truncated.remove(start)
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+
+class FakeStream:
+    """
+    The part of a pytube stream download_youtube_video uses.
+    """
+
+    itag = 18
+    title = 'Fake'
+    default_filename = 'fake.mp4'
+
+    def __init__(self, url):
+        self.url = url
+
+    def download(self, output_path):
+        with urllib.request.urlopen(self.url) as response, \
+                open(os.path.join(output_path, self.default_filename), 'wb') as file:
+            shutil.copyfileobj(response, file)
+
+
+class FakeSession:
+    video_id = 'fake'
+
+    def __init__(self, url):
+        self.stream = FakeStream(url)
+
+
+class ChunkedDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = os.urandom(100_000)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.data = self.data
+        self.server.ranges = True
+        self.server.requested = []
+        self.server.truncated = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.url = f'http://127.0.0.1:{self.server.server_port}/video.mp4'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def download(self, **kwargs):
+        destination = os.path.join(self.directory, 'video.mp4')
+        digest = download_file(self.url, destination, chunk_size=30_000, workers=2, backoff=0,
+                               staging_dir=os.path.join(self.directory, 'staging'), **kwargs)
+        return destination, digest
+
+    def test_truncated_chunk_is_resumed(self):
+        self.server.truncated.add(30_000)
+
+        destination, digest = self.download(expected_sha256=hashlib.sha256(self.data).hexdigest())
+
+        with open(destination, 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertEqual(digest, hashlib.sha256(self.data).hexdigest())
+        # The retry asks only for the half that did not arrive
+        self.assertIn((45_000, 59_999), self.server.requested)
+        # Only the lock file of the staging folder is left
+        self.assertTrue(all(name.endswith('.lock')
+                            for name in os.listdir(os.path.join(self.directory, 'staging'))))
+
+    def test_same_key_waits_for_the_staging_lock(self):
+        staging = os.path.join(self.directory, 'staging',
+                               hashlib.sha256(self.url.encode()).hexdigest())
+        thread = threading.Thread(target=self.download)
+
+        with _staging_lock(staging):
+            thread.start()
+            thread.join(timeout=0.5)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(self.server.requested, [(0, 0)])
+
+        thread.join()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'video.mp4')))
+
+    def test_no_ranges(self):
+        self.server.ranges = False
+
+        with self.assertRaises(RangesNotSupportedError):
+            self.download()
+
+    def test_video_without_ranges_is_downloaded_in_one_request(self):
+        self.server.ranges = False
+        output_dir = os.path.join(self.directory, 'video')
+        os.makedirs(output_dir)
+
+        video_path = download_youtube_video('https://www.youtube.com/watch?v=fake', output_dir,
+                                            session=FakeSession(self.url))
+
+        with open(video_path, 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
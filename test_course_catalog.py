@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from create_course import (COURSE_INFO, LESSON_INFO, PHRASE_JOURNAL, PhraseJournal,
+                           compact_lesson, create_course, create_lesson, enable_catalog,
+                           export_catalog, iter_phrases, read_json_from_file, read_lesson,
+                           uses_catalog)
+from course_catalog import CATALOG_FILE, CourseCatalog
+from import_lesson import register_lessons
+from export_to_anki import export_course
+
+
+def make_phrases(lesson_number, count):
+    return [{'source': f'Source {lesson_number}.{index}', 'target': f'Target {lesson_number}.{index}',
+             'source_audio': None, 'target_audio': None, 'comment': None}
+            for index in range(count)]
+
+
+class CourseCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.course_path = os.path.join(self.directory, 'course')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def lesson_info_path(self, lesson_number):
+        return os.path.join(self.course_path, str(lesson_number), LESSON_INFO)
+
+    def import_lesson(self, lesson_number, phrases):
+        # What build_lesson leaves: the journal of the lesson, or its lesson-info.json
+        lesson_path = os.path.join(self.course_path, str(lesson_number))
+        create_lesson(lesson_name=f'Lesson {lesson_number}', lesson_number=lesson_number,
+                      lesson_path=lesson_path)
+
+        with PhraseJournal(lesson_path, read_lesson(self.lesson_info_path(lesson_number))) as journal:
+            for phrase in phrases:
+                journal.append(phrase)
+        if not uses_catalog(self.course_path):
+            compact_lesson(lesson_path)
+
+        register_lessons(self.course_path, [{'name': f'Lesson {lesson_number}',
+                                             'source-link': None, 'path': str(lesson_number)}])
+
+    def create(self, catalog):
+        create_course(course_name='Course', course_path=self.course_path,
+                      source_language='English', target_language='German', catalog=catalog)
+
+    def test_registered_lesson_lives_in_the_catalog(self):
+        self.create(catalog=True)
+        phrases = make_phrases(1, 3)
+
+        self.import_lesson(1, phrases)
+
+        lesson_folder = os.path.join(self.course_path, '1')
+        self.assertFalse(os.path.exists(os.path.join(lesson_folder, LESSON_INFO)))
+        self.assertFalse(os.path.exists(os.path.join(lesson_folder, PHRASE_JOURNAL)))
+
+        self.assertEqual(read_lesson(self.lesson_info_path(1))['phrases'], phrases)
+        self.assertEqual(list(iter_phrases(self.lesson_info_path(1))), phrases)
+
+        with CourseCatalog(os.path.join(self.course_path, CATALOG_FILE)) as catalog:
+            self.assertEqual(catalog.find_phrases('Source 1.2')[0]['target'], 'Target 1.2')
+
+    def test_export_rereads_only_updated_lessons(self):
+        self.create(catalog=True)
+        for lesson_number in (1, 2):
+            self.import_lesson(lesson_number, make_phrases(lesson_number, 2))
+        output_path = os.path.join(self.directory, 'course.apkg')
+
+        first = export_course(self.course_path, output_path=output_path, incremental=True)
+        unchanged = export_course(self.course_path, output_path=output_path, incremental=True)
+        self.import_lesson(2, make_phrases(2, 3))
+        changed = export_course(self.course_path, output_path=output_path, incremental=True)
+
+        self.assertEqual((first['read_lessons'], first['notes']), (2, 4))
+        self.assertEqual((unchanged['read_lessons'], unchanged['notes']), (0, 4))
+        self.assertEqual((changed['read_lessons'], changed['added'], changed['notes']), (1, 1, 5))
+
+    def test_enable_and_export_round_trip(self):
+        self.create(catalog=False)
+        for lesson_number in (1, 2):
+            self.import_lesson(lesson_number, make_phrases(lesson_number, 2))
+        lessons = [read_json_from_file(self.lesson_info_path(lesson_number)) for lesson_number in (1, 2)]
+
+        enable_catalog(self.course_path)
+
+        self.assertEqual(read_json_from_file(os.path.join(self.course_path, COURSE_INFO))['catalog'],
+                         CATALOG_FILE)
+        self.assertFalse(os.path.exists(self.lesson_info_path(1)))
+        self.assertEqual([read_lesson(self.lesson_info_path(lesson_number)) for lesson_number in (1, 2)],
+                         lessons)
+
+        export_catalog(self.course_path)
+
+        self.assertNotIn('catalog', read_json_from_file(os.path.join(self.course_path, COURSE_INFO)))
+        self.assertEqual([read_json_from_file(self.lesson_info_path(lesson_number))
+                          for lesson_number in (1, 2)], lessons)
+
+
+if __name__ == "__main__":
+    unittest.main()
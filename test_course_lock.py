@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from create_course import COURSE_INFO, create_course, read_json_from_file
+from course_lock import reserve_lessons
+
+
+def reserve_and_hold(course_path, video_links, hold, queue):
+    # Runs in another process, the reservations stay when it ends without registering
+    with reserve_lessons(course_path, video_links) as lesson_numbers:
+        queue.put(lesson_numbers)
+        time.sleep(hold)
+
+
+class ReserveLessonsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.course_path = os.path.join(self.directory, 'course')
+        create_course(course_name='Course', course_path=self.course_path,
+                      source_language='English', target_language='German')
+
+        self.context = multiprocessing.get_context('spawn')
+        self.queue = self.context.Queue()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self, video_links, hold):
+        process = self.context.Process(target=reserve_and_hold,
+                                       args=(self.course_path, video_links, hold, self.queue))
+        process.start()
+        return process
+
+    def reservations(self):
+        course_info = read_json_from_file(os.path.join(self.course_path, COURSE_INFO))
+        return {int(number): reservation['link']
+                for number, reservation in course_info['reservations'].items()}
+
+    def test_two_processes_get_distinct_numbers(self):
+        processes = [self.start([f'{name}-{index}' for index in range(3)], hold=0.5)
+                     for name in ('first', 'second')]
+        results = [self.queue.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join()
+
+        self.assertEqual(sorted(number for numbers in results for number in numbers), list(range(1, 7)))
+        for numbers in results:
+            self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(self.reservations().values())), 6)
+
+    def test_abandoned_reservation_is_taken_over(self):
+        process = self.start(['link'], hold=1.0)
+        (held_number,) = self.queue.get(timeout=30)
+
+        # The reservation is held, the same link gets another number
+        with reserve_lessons(self.course_path, ['link']) as (lesson_number,):
+            self.assertNotEqual(lesson_number, held_number)
+
+        process.join()
+
+        with reserve_lessons(self.course_path, ['link']) as (lesson_number,):
+            self.assertEqual(lesson_number, held_number)
+        self.assertEqual(len(self.reservations()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
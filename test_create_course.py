@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+from create_course import (LESSON_INFO, PHRASE_JOURNAL, PhraseJournal, atomic_write,
+                           compact_lesson, dump_file, iter_phrases, read_lesson)
+
+
+LESSON = {
+    'name': 'Ünïcode lesson',
+    'number': 1,
+    'source-link': None,
+    'tags': ['a', {'nested': [1, 2.5, True]}],
+    'empty': {},
+}
+
+PHRASES = [
+    {'source': 'Hello', 'target': 'Привет', 'source_audio': 'source-audio/segment_001.mp3',
+     'target_audio': None, 'comment': None},
+    {'source': 'Quote " and \\ backslash', 'target': '你好\nworld', 'source_audio': None,
+     'target_audio': None, 'comment': {'list': [], 'dict': {}}},
+]
+
+
+class CompactLessonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compact(self, name, phrases):
+        lesson_path = os.path.join(self.directory, name)
+        with PhraseJournal(lesson_path, LESSON) as journal:
+            for phrase in phrases:
+                journal.append(phrase)
+
+        compact_lesson(lesson_path)
+        with open(os.path.join(lesson_path, LESSON_INFO), 'rb') as file:
+            return lesson_path, file.read()
+
+    def dumped(self, phrases):
+        dump_file(folder_path=self.directory, file_name='dumped.json',
+                  data=dict(LESSON, phrases=phrases))
+        with open(os.path.join(self.directory, 'dumped.json'), 'rb') as file:
+            return file.read()
+
+    def test_same_bytes_as_dump_file(self):
+        for phrases in [PHRASES, PHRASES[:1], []]:
+            lesson_path, compacted = self.compact(f'lesson-{len(phrases)}', phrases)
+
+            self.assertEqual(compacted, self.dumped(phrases))
+            self.assertFalse(os.path.exists(os.path.join(lesson_path, PHRASE_JOURNAL)))
+
+    def test_journal_is_read_while_importing(self):
+        lesson_path = os.path.join(self.directory, 'lesson')
+        with PhraseJournal(lesson_path, LESSON) as journal:
+            for phrase in PHRASES:
+                journal.append(phrase)
+
+        lesson_info_path = os.path.join(lesson_path, LESSON_INFO)
+        self.assertEqual(read_lesson(lesson_info_path), dict(LESSON, phrases=PHRASES))
+        self.assertEqual(list(iter_phrases(lesson_info_path)), PHRASES)
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.umask = os.umask(0o027)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.directory)
+
+    def test_new_file_gets_the_umask_mode(self):
+        path = os.path.join(self.directory, 'new.json')
+        with atomic_write(path) as file:
+            file.write('{}')
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+    def test_replaced_file_keeps_its_mode(self):
+        path = os.path.join(self.directory, 'existing.json')
+        with open(path, 'w') as file:
+            file.write('{}')
+        os.chmod(path, 0o604)
+
+        with atomic_write(path) as file:
+            file.write('[]')
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o604)
+        self.assertEqual(os.listdir(self.directory), ['existing.json'])
+
+    def test_failed_write_keeps_the_old_file(self):
+        path = os.path.join(self.directory, 'existing.json')
+        with open(path, 'w') as file:
+            file.write('{}')
+
+        with self.assertRaises(RuntimeError):
+            with atomic_write(path) as file:
+                file.write('[')
+                raise RuntimeError('failed')
+
+        with open(path) as file:
+            self.assertEqual(file.read(), '{}')
+        self.assertEqual(os.listdir(self.directory), ['existing.json'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from download_from_youtube import (LocalBackend, VideoSession, download_subtitles,
+                                   download_youtube_video)
+
+
+VIDEO_URL = 'https://www.youtube.com/watch?v=abcdefghijk'
+
+
+class CountingBackend(LocalBackend):
+    """
+    A LocalBackend that counts how often the video is resolved.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resolved = 0
+        self.listed = 0
+
+    def resolve_stream(self, url, audio_only=False):
+        self.resolved += 1
+        return super().resolve_stream(url, audio_only=audio_only)
+
+    def list_transcripts(self, video_id):
+        self.listed += 1
+        return super().list_transcripts(video_id)
+
+
+class FlakyBackend(LocalBackend):
+    """
+    A LocalBackend whose transcript fetches fail the given amount of times first.
+    """
+
+    def __init__(self, *args, failures=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+        self.fetches = 0
+
+    def fetch_transcript(self, video_id, language_code, is_generated):
+        self.fetches += 1
+        if self.fetches <= self.failures:
+            raise ConnectionError('The service is not reachable')
+        return super().fetch_transcript(video_id, language_code, is_generated)
+
+
+class VideoSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'metadata')
+
+        self.media_path = os.path.join(self.directory, 'Lesson one.mp4')
+        with open(self.media_path, 'wb') as file:
+            file.write(b'video')
+
+        transcript_path = os.path.join(self.directory, 'en.json')
+        with open(transcript_path, 'w', encoding='utf-8') as file:
+            json.dump([{'text': 'Hello', 'start': 0.0, 'duration': 1.0}], file)
+
+        self.backend = CountingBackend(self.media_path, {('en', False): transcript_path})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def session(self, **kwargs):
+        return VideoSession(VIDEO_URL, backend=self.backend, cache_dir=self.cache_dir, **kwargs)
+
+    def cache_files(self):
+        return sorted(os.listdir(self.cache_dir)) if os.path.exists(self.cache_dir) else []
+
+    def test_metadata_is_resolved_once_within_the_ttl(self):
+        first = self.session()
+        second = self.session()
+
+        self.assertEqual((self.backend.resolved, self.backend.listed), (1, 1))
+        self.assertEqual((second.title, second.default_filename, second.transcripts),
+                         (first.title, first.default_filename, first.transcripts))
+
+    def test_expired_metadata_is_resolved_again(self):
+        self.session()
+        self.session(ttl=-1)
+
+        self.assertEqual(self.backend.listed, 2)
+
+    def test_broken_cache_is_resolved_again(self):
+        self.session()
+        with open(os.path.join(self.cache_dir, self.cache_files()[0]), 'w') as file:
+            file.write('{"title"')
+
+        self.assertEqual(self.session().title, 'Lesson one')
+        self.assertEqual(self.backend.listed, 2)
+
+    def test_audio_only_has_its_own_entry(self):
+        self.session()
+        self.session(audio_only=True)
+
+        self.assertEqual(self.cache_files(), ['abcdefghijk-audio.json', 'abcdefghijk.json'])
+        self.assertEqual(self.backend.listed, 2)
+
+    def test_no_cache_dir(self):
+        VideoSession(VIDEO_URL, backend=self.backend, cache_dir=None)
+        VideoSession(VIDEO_URL, backend=self.backend, cache_dir=None)
+
+        self.assertEqual(self.backend.listed, 2)
+        self.assertEqual(self.cache_files(), [])
+
+    def test_cached_session_resolves_the_stream_only_to_download(self):
+        self.session()
+        session = self.session()
+        self.assertEqual(self.backend.resolved, 1)
+
+        output_dir = os.path.join(self.directory, 'download')
+        os.makedirs(output_dir)
+        video_path = download_youtube_video(VIDEO_URL, output_dir, session=session)
+
+        self.assertEqual(self.backend.resolved, 2)
+        with open(video_path, 'rb') as file:
+            self.assertEqual(file.read(), b'video')
+
+
+class DownloadSubtitlesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.media_path = os.path.join(self.directory, 'Lesson one.mp4')
+        with open(self.media_path, 'wb') as file:
+            file.write(b'video')
+
+        self.transcript_path = os.path.join(self.directory, 'en.json')
+        with open(self.transcript_path, 'w', encoding='utf-8') as file:
+            json.dump([{'text': 'Hello', 'start': 0.0, 'duration': 1.0}], file)
+
+        self.output_dir = os.path.join(self.directory, 'subtitles')
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def download(self, failures, retries):
+        backend = FlakyBackend(self.media_path, {('en', False): self.transcript_path},
+                               failures=failures)
+        session = VideoSession(VIDEO_URL, backend=backend, cache_dir=None)
+
+        try:
+            return download_subtitles(VIDEO_URL, self.output_dir, session=session,
+                                      languages=['en'], retries=retries, backoff=0)
+        finally:
+            self.fetches = backend.fetches
+
+    def test_failed_fetches_are_retried(self):
+        subtitles = self.download(failures=2, retries=2)
+
+        self.assertEqual(self.fetches, 3)
+        with open(subtitles['en'], 'r', encoding='utf-8') as file:
+            self.assertEqual(json.load(file)[0]['text'], 'Hello')
+
+    def test_retries_give_up(self):
+        with self.assertRaises(ConnectionError):
+            self.download(failures=3, retries=2)
+
+        self.assertEqual(self.fetches, 3)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import sqlite3
+import zipfile
+import hashlib
+import tempfile
+import unittest
+
+from create_course import (COURSE_INFO, LESSON_INFO, SOURCE_AUDIO_DIR, create_course,
+                           create_lesson, dump_file, read_json_from_file)
+from export_to_anki import export_course, export_shards
+from media_index import content_name
+
+
+def package_media(package_path):
+    """
+    Returns the media of a package by name, and the audio fields of its notes.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        with zipfile.ZipFile(package_path) as package:
+            media = {name: package.read(index) for index, name in json.loads(package.read('media')).items()}
+            package.extract('collection.anki2', directory)
+
+        connection = sqlite3.connect(os.path.join(directory, 'collection.anki2'))
+        # The audio is the last field of a note, fields are separated by 0x1f
+        audio_fields = sorted(fields.split('\x1f')[-1]
+                              for (fields,) in connection.execute('SELECT flds FROM notes'))
+        connection.close()
+    finally:
+        shutil.rmtree(directory)
+
+    return media, audio_fields
+
+
+class ExportTestCase(unittest.TestCase):
+    """
+    A JSON course with lessons whose audio files hold the given bytes.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.course_path = os.path.join(self.directory, 'course')
+        self.output_path = os.path.join(self.directory, 'course.apkg')
+        create_course(course_name='Course', course_path=self.course_path,
+                      source_language='English', target_language='German')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_lesson(self, lesson_number, audio):
+        """
+        Writes a lesson with one phrase per audio content and adds it to the course.
+        """
+        lesson_path = os.path.join(self.course_path, str(lesson_number))
+        create_lesson(lesson_name=f'Lesson {lesson_number}', lesson_number=lesson_number,
+                      lesson_path=lesson_path)
+
+        os.makedirs(os.path.join(lesson_path, SOURCE_AUDIO_DIR), exist_ok=True)
+        phrases = []
+        for index, content in enumerate(audio):
+            segment_filename = os.path.join(lesson_path, SOURCE_AUDIO_DIR, f'segment_{index + 1:03d}.mp3')
+            with open(segment_filename, 'wb') as file:
+                file.write(content)
+            phrases.append({'source': f'Source {lesson_number}.{index}',
+                            'target': f'Target {lesson_number}.{index}',
+                            'source_audio': segment_filename, 'target_audio': None, 'comment': None})
+
+        lesson_info = read_json_from_file(os.path.join(lesson_path, LESSON_INFO))
+        lesson_info['phrases'] = phrases
+        dump_file(folder_path=lesson_path, file_name=LESSON_INFO, data=lesson_info)
+
+        course_info = read_json_from_file(os.path.join(self.course_path, COURSE_INFO))
+        if str(lesson_number) not in [lesson['path'] for lesson in course_info['lessons']]:
+            course_info['lessons'].append({'name': f'Lesson {lesson_number}', 'source-link': None,
+                                           'path': str(lesson_number)})
+            dump_file(folder_path=self.course_path, file_name=COURSE_INFO, data=course_info)
+
+    def remove_lesson(self, lesson_number):
+        course_info = read_json_from_file(os.path.join(self.course_path, COURSE_INFO))
+        course_info['lessons'] = [lesson for lesson in course_info['lessons']
+                                  if lesson['path'] != str(lesson_number)]
+        dump_file(folder_path=self.course_path, file_name=COURSE_INFO, data=course_info)
+
+
+class IncrementalExportTest(ExportTestCase):
+
+    def export(self):
+        return export_course(self.course_path, output_path=self.output_path, incremental=True)
+
+    def test_unchanged_course_reads_no_lesson(self):
+        for lesson_number in (1, 2, 3):
+            self.write_lesson(lesson_number, [b'a%d' % lesson_number, b'b%d' % lesson_number])
+        first = self.export()
+
+        second = self.export()
+
+        self.assertEqual((first['read_lessons'], first['hashed_media'], first['added']), (3, 6, 6))
+        self.assertEqual((second['read_lessons'], second['hashed_media'], second['notes']), (0, 0, 6))
+        self.assertEqual((second['added'], second['updated'], second['removed']), (0, 0, 0))
+
+    def test_changed_and_removed_lessons(self):
+        for lesson_number in (1, 2, 3):
+            self.write_lesson(lesson_number, [b'a%d' % lesson_number, b'b%d' % lesson_number])
+        self.export()
+
+        self.write_lesson(2, [b'a2', b'b2', b'new'])
+        lesson_info_path = os.path.join(self.course_path, '2', LESSON_INFO)
+        lesson_info = read_json_from_file(lesson_info_path)
+        lesson_info['phrases'][0]['target'] = 'Edited'
+        dump_file(folder_path=os.path.dirname(lesson_info_path), file_name=LESSON_INFO, data=lesson_info)
+        self.remove_lesson(3)
+        stats = self.export()
+
+        self.assertEqual(stats['read_lessons'], 1)
+        self.assertEqual((stats['added'], stats['updated'], stats['removed']), (1, 1, 2))
+        self.assertEqual(stats['notes'], 5)
+
+    def test_without_a_package_everything_is_read(self):
+        self.write_lesson(1, [b'a'])
+        export_course(self.course_path, output_path=self.output_path)
+
+        self.assertEqual(self.export()['read_lessons'], 1)
+
+
+class MediaNamesTest(ExportTestCase):
+
+    def name_of(self, content):
+        return content_name('segment.mp3', hashlib.sha256(content).hexdigest())
+
+    def test_media_is_named_by_content(self):
+        # segment_001.mp3 is in both lessons, with different audio
+        self.write_lesson(1, [b'first', b'second'])
+        self.write_lesson(2, [b'third'])
+
+        for streaming in (False, True):
+            stats = export_course(self.course_path, output_path=self.output_path, streaming=streaming)
+            media, audio_fields = package_media(self.output_path)
+
+            self.assertEqual(stats['media'], 3)
+            self.assertEqual(media, {self.name_of(content): content
+                                     for content in (b'first', b'second', b'third')})
+            self.assertEqual(audio_fields, sorted(f'[sound:{name}]' for name in media))
+
+    def test_same_audio_is_packed_once(self):
+        self.write_lesson(1, [b'same', b'other'])
+        self.write_lesson(2, [b'same'])
+
+        stats = export_course(self.course_path, output_path=self.output_path)
+        media, audio_fields = package_media(self.output_path)
+
+        self.assertEqual((stats['notes'], stats['media']), (3, 2))
+        self.assertEqual(sorted(media), sorted([self.name_of(b'same'), self.name_of(b'other')]))
+        self.assertEqual(audio_fields.count(f'[sound:{self.name_of(b"same")}]'), 2)
+
+
+class ShardExportTest(ExportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = os.path.join(self.directory, 'decks')
+        for lesson_number in (1, 2, 3):
+            self.write_lesson(lesson_number, [b'a%d' % lesson_number])
+
+    def export(self, lessons_per_shard):
+        results = export_shards(self.course_path, output_dir=self.output_dir,
+                                lessons_per_shard=lessons_per_shard)
+        return {os.path.basename(path): bool(stats.get('skipped')) for path, stats in results.items()}
+
+    def packages(self):
+        return sorted(name for name in os.listdir(self.output_dir) if name.endswith('.apkg'))
+
+    def test_only_changed_shards_are_built(self):
+        self.assertEqual(self.export(lessons_per_shard=1),
+                         {'course-1.apkg': False, 'course-2.apkg': False, 'course-3.apkg': False})
+        self.assertEqual(self.export(lessons_per_shard=1),
+                         {'course-1.apkg': True, 'course-2.apkg': True, 'course-3.apkg': True})
+
+        self.write_lesson(2, [b'changed', b'new'])
+
+        self.assertEqual(self.export(lessons_per_shard=1),
+                         {'course-1.apkg': True, 'course-2.apkg': False, 'course-3.apkg': True})
+
+    def test_shards_of_another_layout_are_removed(self):
+        self.export(lessons_per_shard=1)
+
+        # The shard of lesson 3 is the same in both layouts
+        self.assertEqual(self.export(lessons_per_shard=2), {'course-1-2.apkg': False, 'course-3.apkg': True})
+        self.assertEqual(self.packages(), ['course-1-2.apkg', 'course-3.apkg'])
+        self.assertFalse(any(name.startswith('course-1.apkg') or name.startswith('course-2.apkg')
+                             for name in os.listdir(self.output_dir)))
+
+    def test_unrelated_packages_are_kept(self):
+        unrelated_path = os.path.join(self.output_dir, 'other-course-1.apkg')
+        os.makedirs(self.output_dir)
+        with open(unrelated_path, 'wb') as file:
+            file.write(b'package')
+
+        self.export(lessons_per_shard=3)
+
+        self.assertEqual(self.packages(), ['course-1-3.apkg', 'other-course-1.apkg'])
+
+
+if __name__ == "__main__":
+    unittest.main()
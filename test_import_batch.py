@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from create_course import COURSE_INFO, create_course, read_json_from_file, read_lesson
+from import_batch import import_lessons
+from test_segmenter import make_tone
+
+
+class ImportLessonsTest(unittest.TestCase):
+    """
+    Imports local media through the real pipeline, only the download is replaced.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.course_path = os.path.join(self.directory, 'course')
+        create_course(course_name='Course', course_path=self.course_path,
+                      source_language='English', target_language='German')
+
+        self.media = os.path.join(self.directory, 'tone.mp3')
+        make_tone(self.media, seconds=2)
+
+        # How long the download of every link takes, the first ones finish last
+        self.delays = {'link-0': 0.6, 'link-1': 0.3, 'link-2': 0.0}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def download_lesson(self, video_link, path, source_abbreviation, target_abbreviation, **kwargs):
+        if video_link == 'broken':
+            raise IOError('The video is not available')
+        time.sleep(self.delays[video_link])
+
+        video_path = shutil.copy(self.media, os.path.join(path, f'{video_link}.mp3'))
+        subtitles = {}
+        for language in (source_abbreviation, target_abbreviation):
+            subtitles[language] = os.path.join(path, f'{video_link} ({language}).json')
+            with open(subtitles[language], 'w', encoding='utf-8') as file:
+                json.dump([{'text': f'{video_link} {language} {index}', 'start': index * 0.5,
+                            'duration': 0.4} for index in range(3)], file)
+
+        return {'video_link': video_link, 'video_name': f'{video_link}.mp3', 'video_path': video_path,
+                'source_subtitles': subtitles[source_abbreviation],
+                'target_subtitles': subtitles[target_abbreviation]}
+
+    def import_lessons(self, video_links):
+        with mock.patch('import_batch.download_lesson', self.download_lesson):
+            return import_lessons(self.course_path, video_links, 'en', 'de',
+                                  download_workers=3, split_workers=2)
+
+    def test_lessons_are_numbered_in_input_order(self):
+        failures = self.import_lessons(['link-0', 'link-1', 'link-2'])
+
+        self.assertEqual(failures, {})
+        course_info = read_json_from_file(os.path.join(self.course_path, COURSE_INFO))
+        self.assertEqual([(lesson['path'], lesson['source-link']) for lesson in course_info['lessons']],
+                         [('1', 'link-0'), ('2', 'link-1'), ('3', 'link-2')])
+        self.assertEqual(course_info.get('reservations', {}), {})
+
+        lesson = read_lesson(os.path.join(self.course_path, '2', 'lesson-info.json'))
+        self.assertEqual([phrase['source'] for phrase in lesson['phrases']],
+                         [f'link-1 en {index}' for index in range(3)])
+
+    def test_failed_link_keeps_its_number(self):
+        failures = self.import_lessons(['link-0', 'broken', 'link-2'])
+
+        self.assertEqual(list(failures), ['broken'])
+        course_info = read_json_from_file(os.path.join(self.course_path, COURSE_INFO))
+        self.assertEqual([lesson['path'] for lesson in course_info['lessons']], ['1', '3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from segment_cache import SegmentCache
+from segmenter import split_media
+from test_segmenter import make_tone
+
+
+PARAMETERS = {'mode': 'precise', 'codec': 'libmp3lame', 'fps': 44100, 'nchannels': 2}
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_same_cue_same_key(self):
+        self.assertEqual(SegmentCache.key('digest', 1.0, 2.5, 0.33, PARAMETERS),
+                         SegmentCache.key('digest', 1.0000000001, 2.5, 0.33, dict(PARAMETERS)))
+
+    def test_anything_else_changes_the_key(self):
+        key = SegmentCache.key('digest', 1.0, 2.5, 0.33, PARAMETERS)
+
+        self.assertNotIn(key, {
+            SegmentCache.key('other digest', 1.0, 2.5, 0.33, PARAMETERS),
+            SegmentCache.key('digest', 1.1, 2.5, 0.33, PARAMETERS),
+            SegmentCache.key('digest', 1.0, 2.6, 0.33, PARAMETERS),
+            SegmentCache.key('digest', 1.0, 2.5, 0.5, PARAMETERS),
+            SegmentCache.key('digest', 1.0, 2.5, 0.33, dict(PARAMETERS, mode='copy')),
+        })
+
+
+class SegmentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SegmentCache(cache_dir=os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, size):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        return path
+
+    def test_fetch_links_the_stored_segment(self):
+        segment = self.write('segment.mp3', 100)
+        self.cache.store('a' * 64, segment)
+
+        fetched = os.path.join(self.directory, 'fetched.mp3')
+        self.assertTrue(self.cache.fetch('a' * 64, fetched))
+        self.assertFalse(self.cache.fetch('b' * 64, os.path.join(self.directory, 'missing.mp3')))
+
+        self.assertEqual(os.stat(fetched).st_ino, os.stat(segment).st_ino)
+
+    def test_hit_does_not_touch_the_linked_files(self):
+        segment = self.write('segment.mp3', 100)
+        os.utime(segment, ns=(10 ** 18, 10 ** 18))
+        self.cache.store('a' * 64, segment)
+
+        self.cache.fetch('a' * 64, os.path.join(self.directory, 'fetched.mp3'))
+
+        self.assertEqual(os.stat(segment).st_mtime_ns, 10 ** 18)
+
+    def test_evict_removes_the_least_recently_used(self):
+        self.cache.max_bytes = 250
+        for key in ('a', 'b', 'c'):
+            self.cache.store(key * 64, self.write(f'{key}.mp3', 100))
+
+        # Stored at once, "a" is the one used last
+        time.sleep(0.01)
+        self.cache.lookup('a' * 64, 'mp3')
+        self.cache.lookup('c' * 64, 'mp3')
+        time.sleep(0.01)
+        self.cache.lookup('a' * 64, 'mp3')
+
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.lookup('a' * 64, 'mp3'))
+        self.assertIsNotNone(self.cache.lookup('c' * 64, 'mp3'))
+        self.assertIsNone(self.cache.lookup('b' * 64, 'mp3'))
+
+
+class SplitWithCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media = os.path.join(self.directory, 'tone.mp3')
+        make_tone(self.media, seconds=3)
+
+        self.cache = SegmentCache(cache_dir=os.path.join(self.directory, 'cache'))
+        self.subtitles = [{'start': index * 0.5, 'duration': 0.4, 'text': str(index)}
+                          for index in range(4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def split(self, course):
+        output_dir = os.path.join(self.directory, course, 'source-audio')
+        return [segment_filename for _, _, segment_filename in
+                split_media(self.media, self.subtitles, output_dir, cache=self.cache)]
+
+    def test_second_course_links_the_segments(self):
+        first = self.split('first')
+
+        # A copy of the media elsewhere has the same content, so the same keys
+        self.media = shutil.copy(self.media, os.path.join(self.directory, 'copy.mp3'))
+        second = self.split('second')
+
+        self.assertEqual([os.stat(path).st_ino for path in second],
+                         [os.stat(path).st_ino for path in first])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import numpy as np
+
+from segmenter import (FFMPEG_BINARY, SAMPLE_DTYPE, STREAM_DECODE, PcmStream,
+                       split_media)
+from segment_manifest import MANIFEST_FILE
+
+
+def make_tone(path, seconds):
+    subprocess.run([FFMPEG_BINARY, '-y', '-v', 'error',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-ac', '2', path], check=True)
+
+
+class ArrayStream(PcmStream):
+    """
+    A PcmStream over frames that are already decoded, without an ffmpeg process.
+    """
+
+    def __init__(self, samples, fps):
+        self.path_to_media = '<array>'
+        self.fps = fps
+        self.samples = samples
+        self.offset = 0
+        self.finished = True
+
+    def close(self):
+        pass
+
+
+class DropBeforeTest(unittest.TestCase):
+
+    def test_drop_past_the_end_keeps_the_last_frame(self):
+        stream = ArrayStream(np.arange(20, dtype=SAMPLE_DTYPE).reshape(-1, 2), fps=10)
+
+        stream.drop_before(math.inf)
+
+        self.assertEqual(stream.offset, 9)
+        self.assertEqual(stream.samples.tolist(), [[18, 19]])
+
+
+class StreamDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media = os.path.join(self.directory, 'tone.mp3')
+        make_tone(self.media, seconds=5)
+
+        self.subtitles = [{'start': index * 0.5, 'duration': 0.4, 'text': str(index)}
+                          for index in range(8)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def split(self, workers):
+        output_dir = os.path.join(self.directory, f'workers-{workers}')
+        return [segment_filename for _, _, segment_filename in
+                split_media(self.media, self.subtitles, output_dir, workers=workers,
+                            decode=STREAM_DECODE, resume=False)]
+
+    def test_single_worker(self):
+        segment_filenames = self.split(workers=1)
+
+        self.assertEqual(len(segment_filenames), len(self.subtitles))
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in segment_filenames))
+
+    def test_several_workers(self):
+        # The pool asks for the job after the last one, which drops the whole buffer
+        segment_filenames = self.split(workers=2)
+
+        self.assertEqual(len(segment_filenames), len(self.subtitles))
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in segment_filenames))
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media = os.path.join(self.directory, 'tone.mp3')
+        make_tone(self.media, seconds=3)
+
+        self.output_dir = os.path.join(self.directory, 'segments')
+        self.subtitles = [{'start': index * 0.5, 'duration': 0.4, 'text': str(index)}
+                          for index in range(4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def split(self):
+        # The inode and the mtime of every segment, a re-encoded one gets new ones
+        identities = []
+        for _, _, segment_filename in split_media(self.media, self.subtitles, self.output_dir):
+            stat = os.stat(segment_filename)
+            identities.append((segment_filename, stat.st_ino, stat.st_mtime_ns))
+        return identities
+
+    def test_rerun_reuses_every_segment(self):
+        first = self.split()
+
+        self.assertEqual(self.split(), first)
+
+    def test_only_missing_broken_or_moved_segments_are_made_again(self):
+        first = self.split()
+        os.remove(first[0][0])
+        with open(first[1][0], 'r+b') as file:
+            file.truncate(10)
+        self.subtitles[2] = dict(self.subtitles[2], start=1.1)
+
+        second = self.split()
+
+        self.assertEqual([a == b for a, b in zip(first, second)], [False, False, False, True])
+        self.assertGreater(os.path.getsize(second[1][0]), 10)
+
+    def test_cut_off_manifest_line_is_ignored(self):
+        first = self.split()
+        with open(os.path.join(self.output_dir, MANIFEST_FILE), 'a') as file:
+            file.write('{"file": "segm')
+
+        self.assertEqual(self.split(), first)
+
+    def test_changed_source_makes_everything_again(self):
+        first = self.split()
+        make_tone(self.media, seconds=4)
+
+        second = self.split()
+
+        self.assertTrue(all(a != b for a, b in zip(first, second)))
+
+
+if __name__ == "__main__":
+    unittest.main()
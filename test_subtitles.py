@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from subtitles import Cue, load_cues, write_json
+from split_audio import srt_to_json
+
+
+SRT = """1
+00:00:00,000 --> 00:00:01,234
+Hello
+
+2
+00:00:01,500 --> 00:00:02,756
+World
+"""
+
+
+class JsonCuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cues = [Cue(0.0, 1.5, 'Hello, "you"'), Cue(1.5, 2.0, 'two\nlines,'),
+                     Cue(3.5, 0.0, ']')]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_compact_layout_round_trip(self):
+        write_json(self.cues, self.path('cues.json'))
+
+        self.assertEqual([cue.to_dict() for cue in load_cues(self.path('cues.json'))],
+                         [cue.to_dict() for cue in self.cues])
+
+    def test_other_layouts_fall_back_to_the_full_parse(self):
+        items = [cue.to_dict() for cue in self.cues]
+        for name, text in [('indented.json', json.dumps(items, indent=2)),
+                           ('single-line.json', json.dumps(items))]:
+            with open(self.path(name), 'w', encoding='utf-8') as file:
+                file.write(text)
+
+            self.assertEqual([cue.to_dict() for cue in load_cues(self.path(name))], items)
+
+    def test_empty_list(self):
+        write_json([], self.path('empty.json'))
+
+        self.assertEqual(load_cues(self.path('empty.json')), [])
+
+
+class SrtToJsonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_times_are_rounded(self):
+        srt_path = os.path.join(self.directory, 'lesson.srt')
+        with open(srt_path, 'w', encoding='utf-8') as file:
+            file.write(SRT)
+
+        srt_to_json(srt_path)
+
+        with open(os.path.join(self.directory, 'lesson.json'), encoding='utf-8') as file:
+            self.assertEqual(json.load(file), [
+                {'start': 0.0, 'duration': 1.23, 'text': 'Hello'},
+                {'start': 1.5, 'duration': 1.26, 'text': 'World'},
+            ])
+
+    def test_json_input_is_refused(self):
+        json_path = os.path.join(self.directory, 'lesson.json')
+        write_json([Cue(0.0, 1.0, 'Hello')], json_path)
+
+        with self.assertRaises(ValueError):
+            srt_to_json(json_path)
+
+        self.assertEqual(len(load_cues(json_path)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
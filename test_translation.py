@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from translation import (OfflineBackend, TranslationBackend, TranslationMemory,
+                         translate_texts)
+
+
+class FlakyBackend(OfflineBackend):
+    """
+    Fails the first calls, then translates like OfflineBackend.
+    """
+
+    def __init__(self, dictionary, failures):
+        super().__init__(dictionary)
+        self.failures = failures
+
+    def translate_batch(self, texts, source_lang, dest_lang):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('The service is not reachable')
+        return super().translate_batch(texts, source_lang, dest_lang)
+
+
+class TranslateTextsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memory_path = os.path.join(self.directory, 'translations.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_backend_is_abstract(self):
+        with self.assertRaises(TypeError):
+            TranslationBackend()
+
+    def test_repeated_lines_are_sent_once(self):
+        backend = OfflineBackend({'ahoj': 'hello'})
+
+        translations = translate_texts(['ahoj', 'svět', 'ahoj'], source_lang='cs',
+                                       backend=backend, batch_size=10)
+
+        self.assertEqual(translations, ['hello', 'svět', 'hello'])
+        self.assertEqual(backend.requests, 1)
+
+    def test_rerun_only_translates_new_lines(self):
+        dictionary = {'ahoj': 'hello', 'svět': 'world', 'pes': 'dog'}
+
+        with TranslationMemory(self.memory_path) as memory:
+            first = OfflineBackend(dictionary)
+            translate_texts(['ahoj', 'svět'], source_lang='cs', backend=first,
+                            memory=memory, batch_size=1)
+            self.assertEqual(first.requests, 2)
+
+        # A new process, the memory is read back from the file
+        with TranslationMemory(self.memory_path) as memory:
+            second = OfflineBackend(dictionary)
+            translations = translate_texts(['ahoj', 'pes', 'svět'], source_lang='cs',
+                                           backend=second, memory=memory, batch_size=1)
+
+            self.assertEqual(translations, ['hello', 'dog', 'world'])
+            self.assertEqual(second.requests, 1)
+            self.assertEqual(memory.lookup(['pes'], 'cs', 'en'), {'pes': 'dog'})
+
+    def test_memory_is_per_language_pair(self):
+        with TranslationMemory(self.memory_path) as memory:
+            memory.store({'ahoj': 'hello'}, 'cs', 'en')
+
+            self.assertEqual(memory.lookup(['ahoj'], 'cs', 'de'), {})
+
+    def test_failed_batches_are_retried(self):
+        backend = FlakyBackend({'ahoj': 'hello'}, failures=2)
+
+        translations = translate_texts(['ahoj'], source_lang='cs', backend=backend,
+                                       retries=2, backoff=0)
+
+        self.assertEqual(translations, ['hello'])
+
+    def test_retries_give_up(self):
+        backend = FlakyBackend({}, failures=3)
+
+        with self.assertRaises(ConnectionError):
+            translate_texts(['ahoj'], source_lang='cs', backend=backend, retries=2, backoff=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
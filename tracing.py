@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import logging
+import threading
+
+
+# The active tracer, None while tracing is off
+_tracer = None
+
+
+def now_us():
+    # perf_counter is CLOCK_MONOTONIC on Linux, so timestamps of worker processes line up
+    return time.perf_counter_ns() // 1000
+
+
+class Tracer:
+    """
+    Collects spans as Chrome trace events (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start_us, duration_us, args, pid=None, tid=None):
+        event = {
+            'name': name,
+            'cat': 'pipeline',
+            'ph': 'X',
+            'ts': start_us,
+            'dur': duration_us,
+            'pid': pid if pid is not None else os.getpid(),
+            'tid': tid if tid is not None else threading.get_native_id(),
+            'args': args,
+        }
+
+        with self._lock:
+            self.events.append(event)
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+        logging.info(f'Trace with {len(self.events)} spans saved to {path}')
+
+
+class Span:
+    __slots__ = ('name', 'args', 'start_us')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start_us = None
+
+    def set(self, **args):
+        """
+        Adds values that are only known at the end of the span, e.g. byte counts.
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_us = now_us()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+
+        _tracer.add(self.name, self.start_us, now_us() - self.start_us, self.args)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def enable_tracing():
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """
+    Times the with block as one span. Costs a single check while tracing is off.
+
+    Usage:
+        with span('download_video', url=url) as current:
+            ...
+            current.set(bytes=size)
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def record(name, start_us, duration_us, pid=None, tid=None, **args):
+    """
+    Adds a span that was timed elsewhere, e.g. inside a worker process.
+    """
+    if _tracer is not None:
+        _tracer.add(name, start_us, duration_us, args, pid=pid, tid=tid)
+
+
+def timed_call(function, *args):
+    """
+    Calls function(*args) and returns (result, start_us, duration_us, pid, tid).
+    It is picklable, so worker processes can time their own work.
+    """
+    start_us = now_us()
+    result = function(*args)
+    return result, start_us, now_us() - start_us, os.getpid(), threading.get_native_id()
+
+
+def save_trace(path):
+    if _tracer is not None:
+        _tracer.save(path)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import logging
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from googletrans import Translator
+
+from retry import retry_with_backoff, DEFAULT_RETRIES, DEFAULT_BACKOFF
+
+
+MEMORY_PATH_ENV = 'VIDEO_CUTTER_TRANSLATION_MEMORY'
+DEFAULT_MEMORY_PATH = os.environ.get(
+    MEMORY_PATH_ENV,
+    os.path.join(os.path.expanduser('~'), '.cache', 'video-cutter', 'translations.sqlite'))
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_TRANSLATION_WORKERS = 4
+
+
+class TranslationBackend(ABC):
+    """
+    Translates batches of texts. A backend may be called from several threads at once.
+    """
+
+    name = None
+
+    @abstractmethod
+    def translate_batch(self, texts, source_lang, dest_lang):
+        """
+        Returns the translations of texts, in the same order.
+        """
+
+
+class GoogleBackend(TranslationBackend):
+    """
+    Translates through googletrans. It has no batch endpoint: translate() of a list sends
+    one request per text, one after another. A batch is the unit of work of one thread,
+    the speedup comes from the batches running concurrently, and a failed batch is
+    retried as a whole.
+    """
+
+    name = 'google'
+
+    def __init__(self):
+        # googletrans keeps a session per Translator, every thread gets its own
+        self._local = threading.local()
+
+    def _translator(self):
+        if not hasattr(self._local, 'translator'):
+            self._local.translator = Translator()
+        return self._local.translator
+
+    def translate_batch(self, texts, source_lang, dest_lang):
+        translations = self._translator().translate(list(texts), src=source_lang, dest=dest_lang)
+        return [translation.text for translation in translations]
+
+
+class OfflineBackend(TranslationBackend):
+    """
+    Translates from a fixed dictionary and keeps unknown texts as they are.
+    A stand-in for tests and for runs without network.
+    """
+
+    name = 'offline'
+
+    def __init__(self, dictionary=None):
+        self.dictionary = dictionary or {}
+        self.requests = 0
+
+    def translate_batch(self, texts, source_lang, dest_lang):
+        self.requests += 1
+        return [self.dictionary.get(text, text) for text in texts]
+
+
+BACKENDS = {backend.name: backend for backend in (GoogleBackend, OfflineBackend)}
+
+
+class TranslationMemory:
+    """
+    A persistent store of translations keyed by (text, source language, target language).
+    """
+
+    def __init__(self, path=DEFAULT_MEMORY_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS translations ('
+            '    text TEXT NOT NULL, source_lang TEXT NOT NULL, dest_lang TEXT NOT NULL, '
+            '    translation TEXT NOT NULL, '
+            '    PRIMARY KEY (text, source_lang, dest_lang)'
+            ') WITHOUT ROWID')
+
+    def lookup(self, texts, source_lang, dest_lang):
+        """
+        Returns the known translations of texts as a dict text -> translation.
+        """
+        known = {}
+        texts = list(texts)
+
+        # SQLite limits the amount of parameters of one statement
+        for start in range(0, len(texts), 500):
+            chunk = texts[start:start + 500]
+            rows = self.connection.execute(
+                'SELECT text, translation FROM translations '
+                f'WHERE source_lang = ? AND dest_lang = ? AND text IN ({", ".join("?" * len(chunk))})',
+                (source_lang, dest_lang, *chunk))
+            known.update(rows)
+
+        return known
+
+    def store(self, translations, source_lang, dest_lang):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO translations (text, source_lang, dest_lang, translation) '
+                'VALUES (?, ?, ?, ?)',
+                ((text, source_lang, dest_lang, translation) for text, translation in translations.items()))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _translate_with_retries(backend, texts, source_lang, dest_lang, retries, backoff):
+    return retry_with_backoff(lambda: backend.translate_batch(texts, source_lang, dest_lang),
+                              retries=retries, backoff=backoff,
+                              description=f'Translating {len(texts)} lines')
+
+
+def translate_texts(texts, source_lang='auto', dest_lang='en', backend=None, memory=None,
+                    batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_TRANSLATION_WORKERS,
+                    retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    Translates texts, sending every distinct text that the memory does not know once.
+
+    Parameters:
+    - texts (list): The texts to translate.
+    - source_lang (str): The language of the texts, 'auto' to detect it.
+    - dest_lang (str): The language to translate into.
+    - backend (TranslationBackend): Defaults to GoogleBackend.
+    - memory (TranslationMemory): The known translations, new ones are added to it.
+                                  None translates everything without remembering it.
+    - batch_size (int): The amount of texts in one call of the backend.
+    - workers (int): The amount of batches translated at once.
+    - retries (int): How many times a failed request is retried.
+    - backoff (float): The delay before the first retry, doubled for every next one.
+
+    Returns:
+    - list: The translations in the order of texts.
+    """
+    backend = backend or GoogleBackend()
+
+    distinct = list(dict.fromkeys(texts))
+    known = memory.lookup(distinct, source_lang, dest_lang) if memory is not None else {}
+    missing = [text for text in distinct if text not in known]
+
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(_translate_with_retries, backend, batch,
+                                   source_lang, dest_lang, retries, backoff)
+                   for batch in batches]
+
+        for batch, future in zip(batches, futures):
+            translations = dict(zip(batch, future.result()))
+            known.update(translations)
+
+            # Stored batch by batch, an interrupted run keeps what it already paid for
+            if memory is not None:
+                memory.store(translations, source_lang, dest_lang)
+
+    logging.info(f'Translated {len(texts)} lines: {len(distinct)} distinct, '
+                 f'{len(missing)} sent in {len(batches)} batches.')
+
+    return [known[text] for text in texts]
+
+
+def add_translation_arguments(parser):
+    parser.add_argument('--translation-backend', choices=sorted(BACKENDS), default=GoogleBackend.name,
+                        help='The service that translates the subtitles.')
+    parser.add_argument('--translation-memory', default=DEFAULT_MEMORY_PATH,
+                        help='The SQLite file with the known translations, '
+                             f'also taken from ${MEMORY_PATH_ENV}.')
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='Translate lines of text')
+
+    parser.add_argument('-i', '--input', help='A file with one line to translate per line.', required=True)
+    parser.add_argument('-s', '--source-language', default='auto', help='The language of the lines.')
+    parser.add_argument('-t', '--target-language', default='en', help='The language to translate into.')
+    add_translation_arguments(parser)
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+
+    with TranslationMemory(args.translation_memory) as memory:
+        translations = translate_texts(lines, source_lang=args.source_language,
+                                       dest_lang=args.target_language,
+                                       backend=BACKENDS[args.translation_backend](),
+                                       memory=memory)
+
+    for translation in translations:
+        print(translation)
+
+
+if __name__ == "__main__":
+    main()